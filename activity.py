@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+
+import metrics
+from shards import parse_date
+from verify import linkedin_daily_totals
+
+# ======================================================================
+# Campaign activity index
+# Built once per run and account from the bulk listing of the account's
+# campaigns (their run schedules, creation times and statuses) and one
+# ACCOUNT pivot adAnalytics request over the whole date range (the daily
+# totals of metrics.ACTIVITY_PROBE_METRICS). A date is inactive when
+# LinkedIn reports none of the probe metrics for the account that day:
+# every table of that date would be empty, so its work units are skipped.
+# The probe is authoritative, schedules can be moved and conversions land
+# after a campaign ended, so the schedules only decide when the probe
+# failed, and only the dates the probe confirmed have their rows deleted.
+# The dates still being pulled are restricted to the campaigns whose
+# schedule covers them.
+# ======================================================================
+# Campaigns with these statuses never delivered
+NEVER_DELIVERED_STATUSES = ("DRAFT",)
+# Run schedules are in epoch milliseconds and the daily analytics in UTC,
+# schedule days are widened by this many days on both ends to be safe
+SCHEDULE_MARGIN_DAYS = 1
+# Above this many live campaigns the request is for the whole account
+MAX_FACET_CAMPAIGNS = 100
+
+
+def epoch_ms_date(epoch_ms):
+    return datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc).date()
+
+
+def campaign_windows(campaigns):
+    """
+    Returns {campaign_id: (first day, last day or None)} of the days each
+    campaign (listing responses, {id: response}) could have delivered on.
+    """
+    margin = timedelta(days=SCHEDULE_MARGIN_DAYS)
+    windows = {}
+    for campaign_id, campaign in campaigns.items():
+        if campaign.get("status") in NEVER_DELIVERED_STATUSES:
+            continue
+        schedule = campaign.get("runSchedule") or {}
+        created = ((campaign.get("changeAuditStamps") or {}).get("created") or {}).get("time")
+        starts = [t for t in (schedule.get("start"), created) if t]
+        first = epoch_ms_date(max(starts)) - margin if starts else None
+        last = epoch_ms_date(schedule["end"]) + margin if schedule.get("end") else None
+        windows[str(campaign_id)] = (first, last)
+    return windows
+
+
+def probe_fields():
+    return ["dateRange"] + metrics.ACTIVITY_PROBE_METRICS
+
+
+def active_days(elements):
+    """The dates of an ACCOUNT pivot DAILY response with any probe metric above 0."""
+    totals = linkedin_daily_totals(elements, metrics.ACTIVITY_PROBE_METRICS)
+    return {day for day, day_totals in totals.items() if any(day_totals.values())}
+
+
+class ActivityIndex:
+    """
+    `windows` as returned by campaign_windows and `probed_days` as returned
+    by active_days, either is None when it couldn't be fetched.
+    """
+
+    def __init__(self, windows=None, probed_days=None):
+        self.windows = windows
+        self.probed_days = probed_days
+
+    def live_campaigns(self, day):
+        """The sorted ids of the campaigns that could have delivered on the day (YYYY-MM-DD), None when unknown."""
+        if self.windows is None:
+            return None
+        day = parse_date(day)
+        return sorted(
+            campaign_id for campaign_id, (first, last) in self.windows.items()
+            if (first is None or first <= day) and (last is None or day <= last)
+        )
+
+    def is_active(self, day):
+        if self.probed_days is not None:
+            return day in self.probed_days
+        return self.live_campaigns(day) != []
+
+    def confirmed_inactive(self, day):
+        """Whether the probe reported no delivery on the day, only then may its rows be deleted."""
+        return self.probed_days is not None and day not in self.probed_days
+
+
+def split_units(units, indexes):
+    """Splits work units into (active, inactive) with the {account_id: ActivityIndex} of the run."""
+    active, inactive = [], []
+    for unit in units:
+        index = indexes.get(str(unit["account_id"]))
+        (inactive if index and not index.is_active(unit["date"]) else active).append(unit)
+    return active, inactive
+
+
+def campaigns_facet(campaign_ids):
+    """The campaigns= parameter of an adAnalytics request, empty for None or too many campaigns."""
+    if not campaign_ids or len(campaign_ids) > MAX_FACET_CAMPAIGNS:
+        return ""
+    urns = ",".join(f"urn%3Ali%3AsponsoredCampaign%3A{campaign_id}" for campaign_id in campaign_ids)
+    return f"&campaigns=List({urns})"
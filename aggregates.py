@@ -0,0 +1,170 @@
+import hmac
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import timedelta
+
+import metrics
+from shards import parse_date
+
+# ======================================================================
+# Dashboard aggregates (GET /aggregates of the long-lived server)
+# The metrics of metrics.DASHBOARD_METRICS summed per campaign over the
+# last metrics.DASHBOARD_WINDOWS days. The SQL is generated from
+# metrics.BIGQUERY_TABLES: each metric is read from the first table that
+# has it. Results are kept in an in-process LRU cache, an entry is
+# dropped when the ingestion deletes or loads rows of one of its tables,
+# for its account and a date of its window. Requests carry a bearer
+# token, only allowed accounts are served and the window end is kept to
+# the last days, so callers can't fill the cache with arbitrary keys.
+# ======================================================================
+KEY_COLUMNS = ["account_id", "campaign_group_id", "campaign_id"]
+NAME_COLUMNS = ["campaign_group_name", "campaign_name"]
+
+
+def metric_sources():
+    """Returns {table_id: [metrics]}, each of metrics.DASHBOARD_METRICS under the first table that has it."""
+    sources = {}
+    for metric in metrics.DASHBOARD_METRICS:
+        for table_info in metrics.BIGQUERY_TABLES:
+            table_id, table_config = next(iter(table_info.items()))
+            if metric in table_config.get("metrics", []):
+                sources.setdefault(table_id, []).append(metric)
+                break
+        else:
+            raise ValueError(f"No table has the dashboard metric {metric}")
+    return sources
+
+
+def window_dates(days, end_date):
+    """(first, last) YYYY-MM-DD of the `days` days ending on end_date."""
+    end = parse_date(end_date)
+    return (end - timedelta(days=days - 1)).isoformat(), end.isoformat()
+
+
+def is_authorized(authorization, token):
+    """Whether the Authorization header carries the bearer token, never for an unset token."""
+    if not token or not authorization or not authorization.startswith("Bearer "):
+        return False
+    return hmac.compare_digest(authorization[len("Bearer "):].encode("utf-8"), token.encode("utf-8"))
+
+
+def clamp_end_date(end_date, latest, max_days_back):
+    """
+    Returns end_date (YYYY-MM-DD) moved back to `latest` when it is later.
+    Raises ValueError when it is more than max_days_back days before it.
+    """
+    end, latest = parse_date(end_date), parse_date(latest)
+    if end > latest:
+        return latest.isoformat()
+    if (latest - end).days > max_days_back:
+        raise ValueError(f"end_date must be within the last {max_days_back} days before {latest.isoformat()}")
+    return end.isoformat()
+
+
+def campaign_query(project, dataset):
+    """The dashboard metrics per campaign of @account_id from @start_date to @end_date."""
+    sources = metric_sources()
+    selects = []
+    for table_id, table_metrics in sources.items():
+        columns = ["date"] + KEY_COLUMNS + NAME_COLUMNS + [
+            f"CAST(`{m}` AS FLOAT64) AS `{m}`" if m in table_metrics else f"CAST(NULL AS FLOAT64) AS `{m}`"
+            for m in metrics.DASHBOARD_METRICS
+        ]
+        selects.append(
+            f"  SELECT {', '.join(columns)}\n"
+            f"  FROM `{project}.{dataset}.{table_id}`\n"
+            f"  WHERE account_id = @account_id AND date BETWEEN @start_date AND @end_date"
+        )
+    columns = KEY_COLUMNS + [
+        f"ARRAY_AGG({column} IGNORE NULLS ORDER BY date DESC LIMIT 1)[SAFE_OFFSET(0)] AS {column}"
+        for column in NAME_COLUMNS
+    ] + [f"IFNULL(SUM(`{m}`), 0) AS `{m}`" for m in metrics.DASHBOARD_METRICS]
+    return (
+        f"SELECT {', '.join(columns)}\n"
+        f"FROM (\n" + "\n  UNION ALL\n".join(selects) + "\n)\n"
+        f"GROUP BY {', '.join(KEY_COLUMNS)}\n"
+        f"ORDER BY `{metrics.DASHBOARD_METRICS[0]}` DESC"
+    )
+
+
+class AggregateCache:
+    """
+    LRU cache of query results, each entry keeps the account, dates and
+    tables it was computed from. `max_age_seconds` bounds how long an entry
+    is served when the rows were changed by another process.
+    """
+
+    def __init__(self, max_entries=256, max_age_seconds=900):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.entries = OrderedDict()
+        self.generation = 0
+        # (generation, account_id, table_ids, start_date, end_date) of the last invalidations
+        self.recent_invalidations = deque(maxlen=1000)
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Returns (value or None, generation), the generation is passed back to put."""
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry and time.monotonic() - entry["stored_at"] < self.max_age_seconds:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"], self.generation
+            self.entries.pop(key, None)
+            self.misses += 1
+            return None, self.generation
+
+    def put(self, key, value, account_id, start_date, end_date, table_ids, generation):
+        """
+        Stores the value, unless its rows were invalidated after get returned
+        `generation`: the query may have read them before the change.
+        """
+        entry = {
+            "value": value,
+            "account_id": str(account_id),
+            "start_date": start_date,
+            "end_date": end_date,
+            "table_ids": set(table_ids),
+            "stored_at": time.monotonic(),
+        }
+        with self._lock:
+            if self.generation - generation > len(self.recent_invalidations):
+                return  # Too many invalidations since to tell
+            for invalidation_generation, *invalidation in self.recent_invalidations:
+                if invalidation_generation > generation and self._matches(entry, *invalidation):
+                    return
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, account_id, table_ids, start_date, end_date):
+        """
+        Drops the entries of the account (every account for None) whose
+        dates overlap start_date to end_date and which read one of the
+        tables (every table for None).
+        """
+        with self._lock:
+            self.generation += 1
+            self.recent_invalidations.append((self.generation, account_id, table_ids, start_date, end_date))
+            for key, entry in list(self.entries.items()):
+                if self._matches(entry, account_id, table_ids, start_date, end_date):
+                    del self.entries[key]
+                    self.invalidated += 1
+
+    @staticmethod
+    def _matches(entry, account_id, table_ids, start_date, end_date):
+        if account_id is not None and entry["account_id"] != str(account_id):
+            return False
+        if table_ids is not None and not entry["table_ids"] & set(table_ids):
+            return False
+        return not (entry["end_date"] < start_date or end_date < entry["start_date"])
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses, "invalidated": self.invalidated}
@@ -0,0 +1,78 @@
+import json
+
+import zstandard
+
+import storage
+
+# ======================================================================
+# Raw response archive
+# Every adAnalytics response is archived before it is flattened, with the
+# metadata responses used to flatten it, so any table can be rebuilt
+# without calling LinkedIn again. Files are zstd compressed NDJSON,
+# partitioned by account and date:
+#
+#   {root}/account={account_id}/date={YYYY-MM-DD}/{table_id}.ndjson.zst
+#       the response elements, one per line
+#   {root}/account={account_id}/date={YYYY-MM-DD}/{table_id}.metadata.ndjson.zst
+#       one line per request, account, campaign group and campaign response:
+#       {"kind": "request", "fields": [...]}
+#       {"kind": "account", "id": "...", "response": {...}}
+#       {"kind": "campaignGroup", "id": "...", "response": {...}}
+#       {"kind": "campaign", "id": "...", "response": {...}}
+# ======================================================================
+EXTENSION = ".ndjson.zst"
+COMPRESSION_LEVEL = 10
+
+
+def unit_path(root, account_id, date, name):
+    return storage.join(root, f"account={account_id}", f"date={date}", f"{name}{EXTENSION}")
+
+
+def write_ndjson(path, records):
+    data = "\n".join(json.dumps(r, separators=(",", ":")) for r in records).encode("utf-8")
+    storage.write_bytes(path, zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(data))
+
+
+def read_ndjson(path):
+    """Returns the records of the file, or None when it doesn't exist."""
+    data = storage.read_bytes(path)
+    if data is None:
+        return None
+    text = zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    return [json.loads(line) for line in text.splitlines() if line]
+
+
+# ======================================================================
+# Write / read one archived unit (one table for one account and date)
+# ======================================================================
+def write_unit(root, account_id, date, table_id, elements, fields, account, campaign_groups, campaigns):
+    # Metadata first, a unit is only complete once its elements are written
+    metadata = [{"kind": "request", "fields": list(fields)}]
+    metadata.append({"kind": "account", "id": account_id, "response": account})
+    metadata += [{"kind": "campaignGroup", "id": i, "response": r} for i, r in campaign_groups.items()]
+    metadata += [{"kind": "campaign", "id": i, "response": r} for i, r in campaigns.items()]
+    write_ndjson(unit_path(root, account_id, date, f"{table_id}.metadata"), metadata)
+    write_ndjson(unit_path(root, account_id, date, table_id), elements)
+
+
+def read_unit(root, account_id, date, table_id):
+    """
+    Returns a dict with the archived "elements", requested "fields",
+    "account", "campaign_groups" and "campaigns" of the unit,
+    or None when the unit was not archived.
+    """
+    elements = read_ndjson(unit_path(root, account_id, date, table_id))
+    if elements is None:
+        return None
+    unit = {"elements": elements, "fields": [], "account": {}, "campaign_groups": {}, "campaigns": {}}
+    for record in read_ndjson(unit_path(root, account_id, date, f"{table_id}.metadata")) or []:
+        kind = record.get("kind")
+        if kind == "request":
+            unit["fields"] = record.get("fields", [])
+        elif kind == "account":
+            unit["account"] = record.get("response") or {}
+        elif kind == "campaignGroup":
+            unit["campaign_groups"][record["id"]] = record.get("response") or {}
+        elif kind == "campaign":
+            unit["campaigns"][record["id"]] = record.get("response") or {}
+    return unit
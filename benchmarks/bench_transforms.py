@@ -0,0 +1,182 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import coercion
+import transforms
+from benchmarks import synthetic
+
+# ======================================================================
+# Microbenchmarks of the in-process hot paths
+# Measures the time per element and the peak memory of each transform of
+# the pipeline on synthetic adAnalytics responses, and compares them with
+# the stored baselines.
+#
+#   python -m benchmarks.bench_transforms
+#   python -m benchmarks.bench_transforms --elements 100,200000 --metrics 5,20
+#   python -m benchmarks.bench_transforms --save-baseline
+#
+# Exits with 1 when a transform got slower or bigger than its baseline by
+# more than --tolerance. Baselines depend on the machine, save them again
+# when comparing on another one.
+# ======================================================================
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DATE = "2025-01-01"
+ACCOUNT_ID = "500000000"
+ACCOUNT_NAME = "Benchmark account"
+
+
+def serialize_like_load_table_from_json(rows):
+    # What google-cloud-bigquery's load_table_from_json does with the rows
+    return "\n".join(json.dumps(row, ensure_ascii=False) for row in rows).encode()
+
+
+def benchmark_cases(n_elements, n_metrics):
+    """
+    Returns [(name, make_input, run)]. make_input builds a fresh input for
+    every measurement (transforms modify their input) and isn't measured.
+    """
+    metric_names = synthetic.pick_metrics(n_metrics)
+    response, campaign_groups, campaigns = synthetic.generate_response(n_elements, metric_names)
+    elements = response["elements"]
+
+    normalized = transforms.normalize_elements([dict(e) for e in elements], metric_names)
+    rows = transforms.build_rows(normalized, DATE, ACCOUNT_ID, ACCOUNT_NAME, campaign_groups, campaigns)
+    coerce = coercion.compile_coercer(synthetic.schema_for(metric_names))
+    coerced_rows, _ = coercion.coerce_rows(rows, coerce)
+
+    return [
+        (
+            "parse_urns",
+            lambda: elements,
+            lambda els: transforms.referenced_ids(els),
+        ),
+        (
+            "zero_fill",
+            lambda: [dict(e) for e in elements],
+            lambda els: transforms.normalize_elements(els, metric_names),
+        ),
+        (
+            "build_rows",
+            lambda: normalized,
+            lambda els: transforms.build_rows(els, DATE, ACCOUNT_ID, ACCOUNT_NAME, campaign_groups, campaigns),
+        ),
+        (
+            "coerce_rows",
+            lambda: rows,
+            lambda rs: coercion.coerce_rows(rs, coerce),
+        ),
+        (
+            "serialize_json",
+            lambda: coerced_rows,
+            serialize_like_load_table_from_json,
+        ),
+    ]
+
+
+def measure(make_input, run, repeat):
+    """Returns (best seconds, peak bytes allocated by run)."""
+    best = None
+    for _ in range(repeat):
+        data = make_input()
+        gc.collect()
+        started_at = time.perf_counter()
+        run(data)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+
+    # Memory is measured apart, tracemalloc slows everything down
+    data = make_input()
+    gc.collect()
+    tracemalloc.start()
+    run(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak
+
+
+def run_benchmarks(element_counts, metric_counts, repeat):
+    results = {}
+    for n_elements in element_counts:
+        for n_metrics in metric_counts:
+            for name, make_input, run in benchmark_cases(n_elements, n_metrics):
+                # Small inputs are too fast to time once, repeat them more
+                case_repeat = repeat * max(1, 1000 // n_elements)
+                seconds, peak = measure(make_input, run, case_repeat)
+                key = f"{name}/{n_elements}x{n_metrics}"
+                results[key] = {
+                    "ns_per_element": round(seconds * 1e9 / n_elements, 1),
+                    "peak_bytes_per_element": round(peak / n_elements, 1),
+                }
+                print(
+                    f"{key:<32} {results[key]['ns_per_element']:>12.1f} ns/element"
+                    f" {results[key]['peak_bytes_per_element']:>12.1f} peak bytes/element"
+                )
+    return results
+
+
+def compare(results, baselines, tolerance):
+    """Returns the list of regressions against the baselines."""
+    regressions = []
+    for key, result in results.items():
+        baseline = baselines.get(key)
+        if not baseline:
+            continue
+        for measure_name in ("ns_per_element", "peak_bytes_per_element"):
+            if result[measure_name] > baseline[measure_name] * (1 + tolerance):
+                regressions.append(
+                    f"{key} {measure_name}: {result[measure_name]} vs baseline {baseline[measure_name]} "
+                    f"(+{(result[measure_name] / baseline[measure_name] - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def parse_counts(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the in-process transforms of the pipeline")
+    parser.add_argument("--elements", default="100,10000,200000", help="Comma separated numbers of elements per response")
+    parser.add_argument("--metrics", default="5,20", help="Comma separated numbers of metrics per table")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case, the best one is kept")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baselines file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baselines")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before reporting a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(parse_counts(args.elements), parse_counts(args.metrics), args.repeat)
+
+    if args.save_baseline:
+        baselines = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baselines = json.load(f)
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write("\n")
+        print(f"Baselines saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baselines to compare with, run with --save-baseline first.")
+        return 0
+    with open(args.baseline) as f:
+        baselines = json.load(f)
+    regressions = compare(results, baselines, args.tolerance)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nNo regressions against the baselines.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
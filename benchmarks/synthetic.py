@@ -0,0 +1,97 @@
+import random
+from collections import namedtuple
+
+import metrics
+
+# ======================================================================
+# Synthetic adAnalytics responses
+# Generates payloads shaped like LinkedIn's adAnalytics responses with
+# CAMPAIGN and CAMPAIGN_GROUP pivots, at any scale, for the benchmarks.
+# ======================================================================
+# Metrics LinkedIn returns as strings
+STRING_METRICS = {"costInUsd", "costInLocalCurrency", "conversionValueInLocalCurrency", "costPerQualifiedLead"}
+FLOAT_METRICS = {"averageDwellTime", "audiencePenetration"}
+
+SchemaField = namedtuple("SchemaField", "name field_type mode")
+
+DIMENSION_SCHEMA = [
+    SchemaField("date", "DATE", "REQUIRED"),
+    SchemaField("account_name", "STRING", "NULLABLE"),
+    SchemaField("account_id", "STRING", "NULLABLE"),
+    SchemaField("campaign_group_name", "STRING", "NULLABLE"),
+    SchemaField("campaign_group_id", "STRING", "NULLABLE"),
+    SchemaField("campaign_name", "STRING", "NULLABLE"),
+    SchemaField("campaign_id", "STRING", "NULLABLE"),
+    SchemaField("campaign_type", "STRING", "NULLABLE"),
+    SchemaField("campaign_status", "STRING", "NULLABLE"),
+]
+
+
+def all_metrics():
+    """Every metric in metrics.BIGQUERY_TABLES, in order and without duplicates."""
+    names = []
+    for table_info in metrics.BIGQUERY_TABLES:
+        for table_config in table_info.values():
+            for metric in table_config.get("metrics", []):
+                if metric not in names:
+                    names.append(metric)
+    return names
+
+
+def pick_metrics(n_metrics):
+    """The first n_metrics of metrics.py, so every size includes the string and float metrics of the first tables."""
+    return all_metrics()[:n_metrics]
+
+
+def schema_for(metric_names):
+    schema = list(DIMENSION_SCHEMA)
+    for metric in metric_names:
+        if metric in STRING_METRICS:
+            schema.append(SchemaField(metric, "NUMERIC", "NULLABLE"))
+        elif metric in FLOAT_METRICS:
+            schema.append(SchemaField(metric, "FLOAT", "NULLABLE"))
+        else:
+            schema.append(SchemaField(metric, "INTEGER", "NULLABLE"))
+    return schema
+
+
+def generate_response(n_elements, metric_names, n_campaigns=None, missing_rate=0.2, seed=0):
+    """
+    Returns ({"elements": [...]}, campaign_groups, campaigns). About
+    `missing_rate` of the metrics are left out of each element, like
+    LinkedIn does for metrics that are 0, so zero filling has work to do.
+    """
+    rng = random.Random(seed)
+    n_campaigns = n_campaigns or max(1, n_elements)
+    n_groups = max(1, n_campaigns // 10)
+
+    elements = []
+    for i in range(n_elements):
+        campaign_id = 100000000 + i % n_campaigns
+        campaign_group_id = 600000000 + (i % n_campaigns) % n_groups
+        element = {
+            "pivotValues": [
+                f"urn:li:sponsoredCampaign:{campaign_id}",
+                f"urn:li:sponsoredCampaignGroup:{campaign_group_id}",
+            ],
+            "impressions": rng.randint(0, 100000),
+        }
+        for metric in metric_names:
+            if metric == "impressions" or rng.random() < missing_rate:
+                continue
+            if metric in STRING_METRICS:
+                element[metric] = f"{rng.uniform(0, 5000):.6f}"
+            elif metric in FLOAT_METRICS:
+                element[metric] = rng.uniform(0, 60)
+            else:
+                element[metric] = rng.randint(0, 5000)
+        elements.append(element)
+
+    campaign_groups = {
+        str(600000000 + g): {"name": f"Campaign group {g}"} for g in range(n_groups)
+    }
+    campaigns = {
+        str(100000000 + c): {"name": f"Campaign {c}", "type": "SPONSORED_UPDATES", "status": "ACTIVE"}
+        for c in range(n_campaigns)
+    }
+    return {"elements": elements}, campaign_groups, campaigns
@@ -0,0 +1,242 @@
+import json
+import threading
+from datetime import date, datetime, timezone
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+import storage
+
+# ======================================================================
+# Schema typed row coercion
+# A coercer is compiled once per destination table from its BigQuery
+# schema and casts every value to the exact column type before the load
+# job, so a single mismatched value can't fail the whole job. Rows that
+# can't be cast are returned apart to be quarantined. Columns the table
+# doesn't have are a schema error, not a bad row: metrics.py is ahead of
+# the table and every row would be quarantined.
+# ======================================================================
+class CoercionError(ValueError):
+    pass
+
+
+class SchemaError(ValueError):
+    """Rows have columns their table doesn't have (see --evolve-schema in the README)."""
+
+
+class QuarantineError(ValueError):
+    """Every row for the table was quarantined, its existing rows must be left as they are."""
+
+
+NUMERIC_SCALE = Decimal("0.000000001")  # BigQuery NUMERIC keeps 9 decimal digits
+NUMERIC_MAX = Decimal("1e29")
+
+
+def _to_int(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise CoercionError(f"{value!r} is not an integer")
+        return int(value)
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+        try:
+            number = Decimal(value)
+        except InvalidOperation:
+            raise CoercionError(f"{value!r} is not an integer")
+        if number != number.to_integral_value():
+            raise CoercionError(f"{value!r} is not an integer")
+        return int(number)
+    raise CoercionError(f"{value!r} is not an integer")
+
+
+def _to_float(value):
+    if type(value) is float:
+        return value
+    if isinstance(value, (int, str, Decimal)) and not isinstance(value, bool):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    raise CoercionError(f"{value!r} is not a float")
+
+
+def _to_numeric(value):
+    # Decimal can't be serialized to JSON, NUMERIC values are loaded as strings
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        raise CoercionError(f"{value!r} is not a numeric")
+    try:
+        number = Decimal(str(value) if isinstance(value, float) else value)
+    except InvalidOperation:
+        raise CoercionError(f"{value!r} is not a numeric")
+    if not number.is_finite() or abs(number) >= NUMERIC_MAX:
+        raise CoercionError(f"{value!r} is out of the NUMERIC range")
+    return format(number.quantize(NUMERIC_SCALE, rounding=ROUND_HALF_UP).normalize(), "f")
+
+
+def _to_bignumeric(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        raise CoercionError(f"{value!r} is not a numeric")
+    try:
+        number = Decimal(str(value) if isinstance(value, float) else value)
+    except InvalidOperation:
+        raise CoercionError(f"{value!r} is not a numeric")
+    if not number.is_finite():
+        raise CoercionError(f"{value!r} is not a finite numeric")
+    return format(number, "f")
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value[:10]).isoformat()
+        except ValueError:
+            pass
+    raise CoercionError(f"{value!r} is not a date")
+
+
+def _to_string(value):
+    if type(value) is str:
+        return value
+    if isinstance(value, (dict, list)):
+        raise CoercionError(f"{value!r} is not a string")
+    return str(value)
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.lower() in ("true", "false"):
+        return value.lower() == "true"
+    raise CoercionError(f"{value!r} is not a boolean")
+
+
+def _identity(value):
+    return value
+
+
+CONVERTERS = {
+    "INTEGER": _to_int,
+    "INT64": _to_int,
+    "FLOAT": _to_float,
+    "FLOAT64": _to_float,
+    "NUMERIC": _to_numeric,
+    "BIGNUMERIC": _to_bignumeric,
+    "DATE": _to_date,
+    "STRING": _to_string,
+    "BOOLEAN": _to_bool,
+    "BOOL": _to_bool,
+}
+
+
+def compile_coercer(schema):
+    """
+    Compiles a function that casts a row (dict) to the schema, given as
+    BigQuery SchemaFields (anything with name, field_type and mode).
+    The function raises CoercionError for rows that can't be cast, and
+    SchemaError for rows with columns the table doesn't have. NULL values
+    are dropped from the row, except for REQUIRED columns which raise.
+    """
+    columns = [
+        (field.name, CONVERTERS.get(field.field_type.upper(), _identity), (field.mode or "").upper() == "REQUIRED")
+        for field in schema
+    ]
+    known_columns = frozenset(name for name, _, _ in columns)
+
+    def coerce(row):
+        unknown_columns = row.keys() - known_columns
+        if unknown_columns:
+            raise SchemaError(f"Columns not in the table schema: {', '.join(sorted(unknown_columns))}")
+        coerced = {}
+        for name, convert, required in columns:
+            value = row.get(name)
+            if value is None:
+                if required:
+                    raise CoercionError(f"{name} is REQUIRED")
+                continue
+            try:
+                coerced[name] = convert(value)
+            except CoercionError as e:
+                raise CoercionError(f"{name}: {e}")
+        return coerced
+
+    return coerce
+
+
+def coerce_rows(rows, coerce):
+    """Returns (coerced rows, quarantined rows) where quarantined rows are {"row": ..., "error": ...}."""
+    coerced = []
+    quarantined = []
+    append = coerced.append
+    for row in rows:
+        try:
+            append(coerce(row))
+        except CoercionError as e:
+            quarantined.append({"row": row, "error": str(e)})
+    return coerced, quarantined
+
+
+# ======================================================================
+# Destination tables and quarantine (main.py and main_local.py)
+# ======================================================================
+class TableCoercers:
+    """
+    Schemas and coercers of the destination tables, `get_table(table_id)`
+    returns the BigQuery table. Each table is fetched and compiled once.
+    """
+
+    def __init__(self, get_table):
+        self.get_table = get_table
+        self.tables = {}
+        self._lock = threading.Lock()
+
+    def get(self, table_id):
+        """Returns (schema, coercer) of the table."""
+        with self._lock:
+            if table_id not in self.tables:
+                schema = self.get_table(table_id).schema
+                self.tables[table_id] = (schema, compile_coercer(schema))
+            return self.tables[table_id]
+
+    def forget(self, table_id):
+        """Drops the table's schema and coercer, after columns were added to it."""
+        with self._lock:
+            self.tables.pop(table_id, None)
+
+
+def quarantine_rows(quarantined, table_id, path=None):
+    """Logs the quarantined rows and writes them as NDJSON under path (local or gs://) when set."""
+    print(f"Quarantined {len(quarantined)} rows of {table_id}, first error: {quarantined[0]['error']}")
+    if path:
+        path = storage.join(path, table_id, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}.ndjson")
+        storage.write_bytes(path, "\n".join(json.dumps(q, default=str) for q in quarantined).encode("utf-8"))
+        print(f"Quarantined rows written to {path}")
+
+
+def coerce_rows_for_table(rows, table_id, coercers, quarantine_path=None):
+    """
+    Returns the rows cast to the table schema (`coercers` is a
+    TableCoercers), the ones that can't be cast are quarantined. Raises
+    QuarantineError when there were rows and none could be cast, so the
+    caller doesn't replace the table's rows with nothing.
+    """
+    _, coerce = coercers.get(table_id)
+    coerced, quarantined = coerce_rows(rows, coerce)
+    if quarantined:
+        quarantine_rows(quarantined, table_id, quarantine_path)
+    if rows and not coerced:
+        raise QuarantineError(
+            f"All {len(rows)} rows of {table_id} were quarantined, its rows were left as they are. "
+            f"First error: {quarantined[0]['error']}"
+        )
+    return coerced
@@ -0,0 +1,143 @@
+import threading
+import time
+
+import requests
+
+# ======================================================================
+# Adaptive concurrency for LinkedIn requests
+# An AIMD (additive increase, multiplicative decrease) limit on the number
+# of requests in flight: while LinkedIn answers quickly the limit grows by
+# one every `limit` responses, a 429 or a latency spike (latency above
+# `latency_factor` times the average healthy latency) cuts it by
+# `decrease`, at most once per average latency so one burst of throttled
+# requests only counts once. Throughput then follows what LinkedIn allows
+# instead of a hand-tuned worker count.
+# ======================================================================
+class AdaptiveLimiter:
+    def __init__(self, initial=4, minimum=1, maximum=32, decrease=0.5, latency_factor=3.0, min_spike_seconds=1.0):
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_spike_seconds = min_spike_seconds
+        self.in_flight = 0
+        self.latency = None  # moving average of the healthy latencies
+        self.last_decrease_at = 0.0
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.lowest_limit = self.highest_limit = int(self.limit)
+        self._condition = threading.Condition()
+
+    def current_limit(self):
+        return int(self.limit)
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, latency, throttled=False, error=False):
+        """
+        Releases a slot with the outcome of its request: `throttled` for a
+        429, `error` for a connection error or timeout.
+        """
+        with self._condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            self.requests += 1
+            spike = (
+                self.latency is not None
+                and latency > self.min_spike_seconds
+                and latency > self.latency * self.latency_factor
+            )
+            if throttled or error or spike:
+                self.throttled += throttled
+                self.errors += error
+                now = time.monotonic()
+                if now - self.last_decrease_at >= (self.latency or 0):
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self.last_decrease_at = now
+            else:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                # Only grow when the limit is what holds the requests back
+                if saturated:
+                    self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.lowest_limit = min(self.lowest_limit, int(self.limit))
+            self.highest_limit = max(self.highest_limit, int(self.limit))
+            self._condition.notify_all()
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "lowest_limit": self.lowest_limit,
+            "highest_limit": self.highest_limit,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "latency_seconds": round(self.latency or 0, 3),
+        }
+
+    def describe(self):
+        s = self.stats()
+        return (
+            f"LinkedIn concurrency limit: {s['limit']} (between {s['lowest_limit']} and {s['highest_limit']}), "
+            f"{s['requests']} requests, {s['throttled']} throttled (429), {s['errors']} connection errors, average latency {s['latency_seconds']}s"
+        )
+
+
+class RequestCounter:
+    """
+    The requests of a single run. The limiter is shared by the concurrent
+    runs of the long-lived server, its counters add up all of them.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, throttled=False, error=False):
+        with self._lock:
+            self.requests += 1
+            self.throttled += throttled
+            self.errors += error
+
+
+def limited_get(limiter, url, headers, max_retries=5, max_backoff_seconds=60, session=None, stream=False, counter=None):
+    """
+    GETs the url within the limiter, with the pooled `session` when given.
+    With `stream` the slot is released once the headers are received and
+    the body is left to be read by the caller.
+    Throttled requests (429) are retried after the Retry-After delay, or an
+    exponential backoff, up to `max_retries` times. Every attempt is also
+    recorded in the run's `counter` (a RequestCounter) when given. Returns
+    the last response.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        started_at = time.monotonic()
+        try:
+            r = (session or requests).get(url, headers=headers, stream=stream)
+        except requests.exceptions.RequestException:
+            # Connection errors and timeouts are treated as congestion too, but counted apart from 429s
+            limiter.release(time.monotonic() - started_at, error=True)
+            if counter:
+                counter.record(error=True)
+            raise
+        throttled = r.status_code == 429
+        limiter.release(time.monotonic() - started_at, throttled=throttled)
+        if counter:
+            counter.record(throttled=throttled)
+        if not throttled or attempt == max_retries:
+            return r
+        r.close()
+        try:
+            delay = float(r.headers.get("Retry-After", ""))
+        except ValueError:
+            delay = 2 ** attempt
+        time.sleep(min(delay, max_backoff_seconds))
+    return r
@@ -0,0 +1,64 @@
+import base64
+import json
+import time
+import zlib
+
+# ======================================================================
+# Deadline aware scheduling
+# ======================================================================
+class DeadlineScheduler:
+    """
+    Tracks the time left before the function deadline and tells whether
+    another work unit can still be started. A unit is only started when the
+    time left (minus the safety margin) covers the slowest unit seen so far,
+    or `initial_estimate` until the first unit has finished.
+    """
+
+    def __init__(self, budget_seconds, safety_seconds=0, initial_estimate=0, started_at=None):
+        started_at = time.monotonic() if started_at is None else started_at
+        self.deadline = started_at + budget_seconds - safety_seconds
+        self.estimate = initial_estimate
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def can_start(self, reserve=0):
+        """`reserve` is time that must be left after the unit, e.g. for a final commit."""
+        return self.remaining() >= self.estimate + reserve
+
+    def record(self, seconds):
+        self.estimate = max(self.estimate, seconds)
+
+
+# ======================================================================
+# Continuation tokens
+# A continuation token is the list of work items that were not started,
+# serialized as compressed url-safe base64 JSON so it can travel in a
+# request body, a response or an email.
+# ======================================================================
+def encode_continuation_token(items, run_id=None):
+    """`run_id` is carried along, so the continuation stays part of the same run (see jobs.py)."""
+    token = {"v": 1, "items": items}
+    if run_id:
+        token["run_id"] = run_id
+    data = json.dumps(token, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(zlib.compress(data, 9)).decode("ascii")
+
+
+def _decode(token):
+    try:
+        data = json.loads(zlib.decompress(base64.urlsafe_b64decode(token.encode("ascii"))))
+    except Exception:
+        raise ValueError("Invalid continuation token")
+    if not isinstance(data, dict) or data.get("v") != 1 or not isinstance(data.get("items"), list):
+        raise ValueError("Invalid continuation token")
+    return data
+
+
+def decode_continuation_token(token):
+    return _decode(token)["items"]
+
+
+def continuation_run_id(token):
+    """The run id the token was encoded with, None for tokens without one."""
+    return _decode(token).get("run_id")
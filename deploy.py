@@ -3,6 +3,9 @@ import sys
 import shutil
 import env
 
+# Function timeout in seconds, also passed to the function so it can stop before being killed
+FUNCTION_TIMEOUT_SECONDS = 540
+
 # ======================================================================
 # Deploy Google Cloud Function
 # ======================================================================
@@ -21,7 +24,7 @@ def deploy_application():
         "jc_linkedin_to_bq",
         "--runtime", "python311",
         "--trigger-http",
-        "--timeout", "540s",
+        "--timeout", f"{FUNCTION_TIMEOUT_SECONDS}s",
         "--allow-unauthenticated",
         "--region", "us-east1",
         "--entry-point", "jc_linkedin_to_bq",
@@ -37,7 +40,8 @@ def deploy_application():
         f"EMAIL_PASS={env.EMAIL_PASS},"
         f"SMTP_SERVER={env.SMTP_SERVER},"
         f"SMTP_PORT={env.SMTP_PORT},"
-        f"EMAIL_RECIPIENT={env.EMAIL_RECIPIENT}"
+        f"EMAIL_RECIPIENT={env.EMAIL_RECIPIENT},"
+        f"FUNCTION_TIMEOUT_SECONDS={FUNCTION_TIMEOUT_SECONDS}"
 
     ]
 
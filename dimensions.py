@@ -0,0 +1,111 @@
+import hashlib
+import json
+
+import metrics
+
+# ======================================================================
+# Campaign dimension table
+# One row per campaign with its campaign group, refreshed once per run from
+# the bulk listing of the account's campaigns and campaign groups instead
+# of one request per campaign referenced by the facts. Changes are kept as
+# history (slowly changing dimension, type 2): when a campaign's attributes
+# change its current row is closed (valid_to, is_current = FALSE) and a new
+# current row is added. The <table>_current view only has the current rows.
+# ======================================================================
+DIMENSION_TABLE_ID = metrics.CAMPAIGN_DIMENSION_TABLE
+PAGE_SIZE = 1000
+
+# (column, BigQuery type) of the attributes, the history columns are added to the table
+COLUMNS = [
+    ("account_id", "STRING"),
+    ("campaign_group_id", "STRING"),
+    ("campaign_group_name", "STRING"),
+    ("campaign_group_status", "STRING"),
+    ("campaign_id", "STRING"),
+    ("campaign_name", "STRING"),
+    ("campaign_type", "STRING"),
+    ("campaign_status", "STRING"),
+    ("attributes_hash", "STRING"),
+]
+HISTORY_COLUMNS = [
+    ("valid_from", "TIMESTAMP"),
+    ("valid_to", "TIMESTAMP"),
+    ("is_current", "BOOL"),
+]
+
+
+def listing_url(account_id, path, page_token=None):
+    """URL of one page of the account's adCampaigns or adCampaignGroups (path)."""
+    url = f"https://api.linkedin.com/rest/adAccounts/{account_id}/{path}?q=search&pageSize={PAGE_SIZE}"
+    if page_token:
+        url += f"&pageToken={page_token}"
+    return url
+
+
+def next_page_token(response):
+    return (response.get("metadata") or {}).get("nextPageToken")
+
+
+def id_from_urn(urn):
+    return str(urn).split(":")[-1] if urn else None
+
+
+def dimension_rows(account_id, campaign_groups, campaigns):
+    """
+    Builds the dimension rows from the listings, given as {id: response}
+    like the per id lookups (see transforms.build_rows).
+    """
+    rows = []
+    for campaign_id, campaign in campaigns.items():
+        campaign_group_id = id_from_urn(campaign.get("campaignGroup"))
+        campaign_group = campaign_groups.get(campaign_group_id) or {}
+        row = {
+            "account_id": str(account_id),
+            "campaign_group_id": campaign_group_id,
+            "campaign_group_name": campaign_group.get("name"),
+            "campaign_group_status": campaign_group.get("status"),
+            "campaign_id": str(campaign_id),
+            "campaign_name": campaign.get("name"),
+            "campaign_type": campaign.get("type"),
+            "campaign_status": campaign.get("status"),
+        }
+        row["attributes_hash"] = hashlib.sha1(json.dumps(row, sort_keys=True).encode("utf-8")).hexdigest()
+        rows.append(row)
+    return rows
+
+
+# ======================================================================
+# SQL
+# ======================================================================
+def create_statements(project, dataset):
+    table_ref = f"`{project}.{dataset}.{DIMENSION_TABLE_ID}`"
+    columns = ", ".join(f"{name} {column_type}" for name, column_type in COLUMNS + HISTORY_COLUMNS)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {table_ref} ({columns}) CLUSTER BY account_id, campaign_id;\n"
+        f"CREATE VIEW IF NOT EXISTS `{project}.{dataset}.{DIMENSION_TABLE_ID}_current` AS "
+        f"SELECT * EXCEPT (valid_to, is_current) FROM {table_ref} WHERE is_current;\n"
+    )
+
+
+def scd_script(project, dataset, staging_ref):
+    """
+    Applies the snapshot loaded in the staging table to the history of
+    @account_id in one transaction, as of @refreshed_at.
+    """
+    table_ref = f"`{project}.{dataset}.{DIMENSION_TABLE_ID}`"
+    columns = ", ".join(name for name, _ in COLUMNS)
+    return (
+        "BEGIN TRANSACTION;\n"
+        f"UPDATE {table_ref} D SET valid_to = @refreshed_at, is_current = FALSE\n"
+        f"  FROM `{staging_ref}` S\n"
+        "  WHERE D.account_id = @account_id AND D.is_current\n"
+        "    AND D.campaign_id = S.campaign_id AND D.attributes_hash != S.attributes_hash;\n"
+        f"INSERT INTO {table_ref} ({columns}, valid_from, valid_to, is_current)\n"
+        f"  SELECT {', '.join(f'S.{name}' for name, _ in COLUMNS)}, @refreshed_at, NULL, TRUE\n"
+        f"  FROM `{staging_ref}` S\n"
+        f"  WHERE NOT EXISTS (\n"
+        f"    SELECT 1 FROM {table_ref} D\n"
+        "    WHERE D.account_id = @account_id AND D.is_current AND D.campaign_id = S.campaign_id\n"
+        "  );\n"
+        "COMMIT TRANSACTION;\n"
+    )
@@ -16,3 +16,50 @@ EMAIL_PASS = '<email_password>'
 SMTP_SERVER = '<smtp_server>'
 SMTP_PORT = '<smtp_port>'
 EMAIL_RECIPIENT = '<email_recipient>'
+
+
+# Local response cache (main_local.py), days older than RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS are cached
+RESPONSE_CACHE_DIR = '.linkedin_cache'
+RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS = 90
+RESPONSE_CACHE_MAX_MB = 512
+
+# Raw response archive, local directory or gs://bucket/prefix (None disables it)
+ARCHIVE_PATH = None
+
+# Rows that don't match their table schema are quarantined here, local directory or gs://bucket/prefix (None only logs them)
+QUARANTINE_PATH = None
+
+# Keep the weekly and monthly rollup tables up to date after each load
+ROLLUPS_ENABLED = False
+
+# Profile every run with cProfile and tracemalloc to this local path or gs://bucket/prefix (None disables it)
+PROFILE_PATH = None
+PROFILE_TOP_N = 20
+
+# Adaptive limit of concurrent LinkedIn requests: starts at the initial value, grows while LinkedIn answers
+# quickly and halves on 429s or latency spikes, never above the max
+LINKEDIN_INITIAL_CONCURRENCY = 4
+LINKEDIN_MAX_CONCURRENCY = 32
+
+# "tables" writes every table of metrics.py, "wide" writes the single wide table (metrics.WIDE_TABLE)
+STORAGE_LAYOUT = "tables"
+
+# Campaign names from one listing of the account's campaigns per run instead of one lookup per campaign.
+# FACT_ROWS "ids" leaves the names out of the rows, join them with the campaign_dimension_current view
+CAMPAIGN_DIMENSION = False
+FACT_ROWS = "full"
+
+# Fetch, enrich, coerce and load run as pipelined stages: dates waiting between two stages, and workers per stage
+PIPELINE_QUEUE_SIZE = 2
+PIPELINE_FETCH_WORKERS = 2
+PIPELINE_LOAD_WORKERS = 1
+
+# History of the runs in a local SQLite file (None disables it), runs slower per date than RUN_REGRESSION_FACTOR times
+# the median of the last RUN_HISTORY_BASELINE_RUNS runs are flagged in the email
+RUN_HISTORY_PATH = ".linkedin_run_history.sqlite"
+RUN_HISTORY_BASELINE_RUNS = 20
+RUN_REGRESSION_FACTOR = 1.5
+
+# Skip the dates without any delivery (no campaign scheduled, or LinkedIn's account totals are 0) for every table, and
+# only request the other dates for the campaigns scheduled on them
+ACTIVITY_INDEX = False
@@ -0,0 +1,104 @@
+import json
+import threading
+
+# ======================================================================
+# BigQuery job cost ledger
+# The statistics of every query and load job a run submits (bytes
+# processed and billed, slot milliseconds, DML affected rows, output rows
+# and duration), added up per table and per run. They are printed and
+# sent in the run's email, and the run's totals are kept in the run
+# history, so the cost of a write strategy (COMMIT_MODE) or table layout
+# (STORAGE_LAYOUT) can be compared across runs. Jobs reused through a
+# deterministic job id (see jobs.py) were paid for by an earlier run,
+# they are only counted.
+# ======================================================================
+ON_DEMAND_USD_PER_TIB = 6.25
+STATISTICS = ["bytes_processed", "bytes_billed", "slot_ms", "dml_rows", "output_rows", "seconds"]
+
+
+def job_statistics(job):
+    """The STATISTICS of a finished QueryJob or LoadJob, missing ones are 0."""
+    seconds = 0.0
+    if getattr(job, "started", None) and getattr(job, "ended", None):
+        seconds = (job.ended - job.started).total_seconds()
+    return {
+        "bytes_processed": getattr(job, "total_bytes_processed", None) or 0,
+        "bytes_billed": getattr(job, "total_bytes_billed", None) or 0,
+        "slot_ms": getattr(job, "slot_millis", None) or 0,
+        "dml_rows": getattr(job, "num_dml_affected_rows", None) or 0,
+        "output_rows": getattr(job, "output_rows", None) or 0,
+        "seconds": seconds,
+    }
+
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.2f} TiB"
+
+
+def on_demand_usd(bytes_billed):
+    return bytes_billed / 1024 ** 4 * ON_DEMAND_USD_PER_TIB
+
+
+class JobCostLedger:
+    def __init__(self):
+        self.tables = {}
+        self.reused_job_ids = set()
+        self.jobs = 0
+        self.reused_jobs = 0
+        self._lock = threading.Lock()
+
+    def mark_reused(self, job_id):
+        with self._lock:
+            self.reused_job_ids.add(job_id)
+
+    def record(self, job, table_id, kind):
+        """Adds a finished job's statistics to the table's, kind being "load", "delete"..."""
+        statistics = job_statistics(job)
+        with self._lock:
+            self.jobs += 1
+            if job.job_id in self.reused_job_ids:
+                self.reused_jobs += 1
+                return
+            table = self.tables.setdefault(table_id, {"jobs": {}, **{s: 0 for s in STATISTICS}})
+            table["jobs"][kind] = table["jobs"].get(kind, 0) + 1
+            for name in STATISTICS:
+                table[name] += statistics[name]
+
+    def totals(self):
+        with self._lock:
+            totals = {s: 0 for s in STATISTICS}
+            for table in self.tables.values():
+                for name in STATISTICS:
+                    totals[name] += table[name]
+            totals["jobs"] = self.jobs
+            totals["reused_jobs"] = self.reused_jobs
+            return totals
+
+    def to_json(self):
+        """The statistics per table, for the run history."""
+        with self._lock:
+            return json.dumps(self.tables, sort_keys=True)
+
+    def describe(self):
+        """Log lines: the run's totals, then one line per table, the most billed first."""
+        totals = self.totals()
+        lines = [
+            f"BigQuery jobs: {totals['jobs']} ({totals['reused_jobs']} reused), "
+            f"{format_bytes(totals['bytes_processed'])} processed, {format_bytes(totals['bytes_billed'])} billed "
+            f"(~${on_demand_usd(totals['bytes_billed']):.4f} on demand), {totals['slot_ms'] / 1000:.1f} slot seconds, "
+            f"{totals['dml_rows']} DML rows, {totals['output_rows']} rows loaded, {totals['seconds']:.1f}s of job time"
+        ]
+        with self._lock:
+            tables = sorted(self.tables.items(), key=lambda item: (-item[1]["bytes_billed"], -item[1]["slot_ms"], item[0]))
+            for table_id, table in tables:
+                jobs = ", ".join(f"{count} {kind}" for kind, count in sorted(table["jobs"].items()))
+                lines.append(
+                    f"  {table_id}: {jobs} - {format_bytes(table['bytes_billed'])} billed, "
+                    f"{format_bytes(table['bytes_processed'])} processed, {table['slot_ms'] / 1000:.1f} slot seconds, "
+                    f"{table['dml_rows']} DML rows, {table['seconds']:.1f}s"
+                )
+        return lines
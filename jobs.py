@@ -0,0 +1,59 @@
+import hashlib
+import json
+import re
+import uuid
+
+# ======================================================================
+# Deterministic BigQuery job ids
+# A job id derived from what the job does (kind, table, date range, run
+# mode and a digest of the rows it loads) is the same every time the same
+# work is submitted again: a retried or rerun unit attaches to the job a
+# previous attempt already submitted, running or done, instead of loading
+# the same rows twice. The delete before a load uses the digest of the
+# rows loaded after it, so a unit whose rows changed gets new jobs for
+# both, and an unchanged unit gets neither.
+# Job ids are scoped to one run id: a request, its retries and its
+# continuations. A later run of the same day submits new jobs, even with
+# the same rows, the table may have changed since.
+# ======================================================================
+JOB_ID_PREFIX = "linkedin"
+RUN_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def new_run_id():
+    return uuid.uuid4().hex[:16]
+
+
+def scheduled_run_id(schedule_time):
+    """The run id of a Cloud Scheduler execution (its X-CloudScheduler-ScheduleTime), the same for its retries."""
+    return f"scheduled_{hashlib.sha256(schedule_time.encode('utf-8')).hexdigest()[:16]}"
+
+
+def validate_run_id(run_id):
+    if not isinstance(run_id, str) or not RUN_ID_PATTERN.fullmatch(run_id):
+        raise ValueError("run_id must be 1 to 64 letters, digits, - or _")
+    return run_id
+
+
+def rows_digest(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(row, sort_keys=True, default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def job_id(kind, table_ref, *parts):
+    """
+    Returns the job id for the kind of job ("load", "delete"...) on the
+    table, `parts` being anything else that identifies the work (JSON
+    serializable). Job ids only allow letters, digits, - and _.
+    """
+    key = json.dumps([kind, table_ref, parts], sort_keys=True, default=str)
+    table_name = re.sub(r"[^A-Za-z0-9_]", "_", table_ref.split(".")[-1])[:64]
+    return f"{JOB_ID_PREFIX}_{kind}_{table_name}_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:40]}"
+
+
+def attempt_job_id(base_job_id, attempt):
+    """The id of the attempt-th submission, when the previous ones failed."""
+    return base_job_id if attempt == 0 else f"{base_job_id}_retry{attempt}"
@@ -0,0 +1,117 @@
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ======================================================================
+# Single-flight leases
+# Make sure only one thread, process or instance does something at a time
+# (refreshing the LinkedIn access token), the others wait for it and then
+# reuse its result:
+#  - file_lock: processes of the same machine, with a lock file
+#  - secret_lease: instances, with an annotation on a Secret Manager secret
+#    written with the secret's etag, so only one of the concurrent writers
+#    gets it. The lease expires after ttl_seconds if its holder dies.
+# ======================================================================
+HOLDER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+class LeaseTimeout(RuntimeError):
+    pass
+
+
+@contextmanager
+def file_lock(path, timeout_seconds=120, poll_seconds=0.2):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a+b") as f:
+        waited_until = time.monotonic() + timeout_seconds
+        while True:
+            try:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                break
+            except OSError:
+                if time.monotonic() > waited_until:
+                    raise LeaseTimeout(f"Timed out waiting for the lock {path}")
+                time.sleep(poll_seconds)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _lease_holder(annotations, key):
+    """Returns the holder of the lease when it is held and not expired, else None."""
+    holder, _, expires_at = annotations.get(key, "").rpartition("@")
+    try:
+        if holder and float(expires_at) > time.time():
+            return holder
+    except ValueError:
+        pass
+    return None
+
+
+def _update_annotations(sm_client, secret, annotations):
+    sm_client.update_secret(request={
+        "secret": {"name": secret.name, "annotations": annotations, "etag": secret.etag},
+        "update_mask": {"paths": ["annotations"]},
+    })
+
+
+@contextmanager
+def secret_lease(sm_client, secret_name, key="token-refresh-lease", ttl_seconds=120, timeout_seconds=180, poll_seconds=2):
+    """
+    Holds the lease stored in the `key` annotation of the secret (full
+    resource name) while the block runs. Yields True when the lease was
+    taken, False when it couldn't be used (e.g. no permission to update the
+    secret), in which case the block runs without it.
+    """
+    from google.api_core import exceptions
+
+    waited_until = time.monotonic() + timeout_seconds
+    acquired = False
+    while True:
+        try:
+            secret = sm_client.get_secret(name=secret_name)
+            annotations = dict(secret.annotations)
+            if _lease_holder(annotations, key) is None:
+                annotations[key] = f"{HOLDER_ID}@{time.time() + ttl_seconds}"
+                _update_annotations(sm_client, secret, annotations)
+                acquired = True
+                break
+        except (exceptions.Aborted, exceptions.FailedPrecondition, exceptions.Conflict):
+            pass  # Someone else updated the secret first, look again
+        except exceptions.GoogleAPICallError as e:
+            print(f"Could not use the lease on {secret_name}, continuing without it: {e}")
+            break
+        if time.monotonic() > waited_until:
+            raise LeaseTimeout(f"Timed out waiting for the lease on {secret_name}")
+        time.sleep(poll_seconds)
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                secret = sm_client.get_secret(name=secret_name)
+                annotations = dict(secret.annotations)
+                if annotations.get(key, "").startswith(f"{HOLDER_ID}@"):
+                    annotations.pop(key)
+                    _update_annotations(sm_client, secret, annotations)
+            except Exception as e:
+                # The lease expires on its own
+                print(f"Could not release the lease on {secret_name}: {e}")
@@ -1,13 +1,39 @@
+import hashlib
+import json
 import os
-from flask import jsonify
-import pandas as pd
+from flask import Flask, jsonify, request as flask_request
 import requests
 import smtplib
+import threading
+import time
+import uuid
 
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from datetime import datetime, timedelta, timezone
 from google.cloud import bigquery, secretmanager
+import activity
+import aggregates
+import archive
+import coercion
+import concurrency
+import deadline
+import dimensions
+import jobs
+import lease
 import metrics
-from google.api_core.exceptions import NotFound
+import pipeline
+import profiling
+import rollups
+import run_history
+import run_state
+import shards
+import splitting
+import storage
+import streaming
+import transforms
+import verify
+import wide
+from google.api_core.exceptions import Conflict, NotFound
 from email.mime.text import MIMEText
 
 
@@ -37,6 +63,115 @@ SMTP_SERVER = os.environ.get("SMTP_SERVER")
 SMTP_PORT = os.environ.get("SMTP_PORT")
 EMAIL_RECIPIENT = os.environ.get("EMAIL_RECIPIENT")
 
+# Coordinator settings (used when the request body has "mode": "coordinator")
+WORKER_URL = os.environ.get("SHARD_WORKER_URL")
+SHARD_DAYS = int(os.environ.get("SHARD_DAYS", "7"))
+SHARD_MAX_WORKERS = int(os.environ.get("SHARD_MAX_WORKERS", "8"))
+# A shard is given SHARD_REQUEST_TIMEOUT seconds (its "budget_seconds"), the coordinator only posts one while it has
+# that much time left, so it must stay well under FUNCTION_TIMEOUT_SECONDS - DEADLINE_SAFETY_SECONDS
+SHARD_REQUEST_TIMEOUT = int(os.environ.get("SHARD_REQUEST_TIMEOUT", "240"))
+
+# Raw response archive (local path or gs://bucket/prefix), disabled when not set
+ARCHIVE_PATH = os.environ.get("ARCHIVE_PATH")
+
+# Rows that don't match their table schema are written here (local path or gs://), only logged when not set
+QUARANTINE_PATH = os.environ.get("QUARANTINE_PATH")
+
+# How the tables are written: "table" deletes and loads each table and date on its own,
+# "transaction" stages every table and replaces them all in one BigQuery transaction
+COMMIT_MODE = os.environ.get("COMMIT_MODE", "table")
+COMMIT_MODES = ("table", "transaction")
+TRANSACTION_MAX_WORKERS = int(os.environ.get("TRANSACTION_MAX_WORKERS", "10"))
+# Time kept for the staging loads and the commit in transaction mode
+TRANSACTION_RESERVE_SECONDS = int(os.environ.get("TRANSACTION_RESERVE_SECONDS", "90"))
+
+# Intraday refresh ("mode": "intraday"), the snapshot directory should be a gs:// path
+# so the last pull is remembered across instances
+INTRADAY_TABLE_ID, INTRADAY_TABLE_CONFIG = list(metrics.INTRADAY_TABLE.items())[0]
+INTRADAY_METRICS = INTRADAY_TABLE_CONFIG["metrics"]
+INTRADAY_SNAPSHOT_PATH = os.environ.get("INTRADAY_SNAPSHOT_PATH", "/tmp/linkedin_intraday")
+
+# Weekly and monthly rollup tables (see ROLLUP_PERIODS in metrics.py), off by default: every load then also
+# rewrites the weeks and months of its dates
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "false").lower() == "true"
+# Rollup tables already created by this instance (see rollups.update_rollups)
+ROLLUP_TABLES_READY = set()
+
+# Deadline settings, FUNCTION_TIMEOUT_SECONDS must match the --timeout used in deploy.py
+FUNCTION_TIMEOUT_SECONDS = int(os.environ.get("FUNCTION_TIMEOUT_SECONDS", "540"))
+DEADLINE_SAFETY_SECONDS = int(os.environ.get("DEADLINE_SAFETY_SECONDS", "60"))
+
+# "tables" writes every table of metrics.py, "wide" writes a single wide table and turns them into views (see wide.py)
+STORAGE_LAYOUT = os.environ.get("STORAGE_LAYOUT", "tables")
+STORAGE_LAYOUTS = ("tables", "wide")
+if STORAGE_LAYOUT not in STORAGE_LAYOUTS:
+    raise ValueError(f"STORAGE_LAYOUT must be one of: {', '.join(STORAGE_LAYOUTS)}")
+
+# Adaptive limit of concurrent LinkedIn requests (see concurrency.py)
+LINKEDIN_INITIAL_CONCURRENCY = int(os.environ.get("LINKEDIN_INITIAL_CONCURRENCY", "4"))
+LINKEDIN_MAX_CONCURRENCY = int(os.environ.get("LINKEDIN_MAX_CONCURRENCY", "32"))
+LINKEDIN_LIMITER = concurrency.AdaptiveLimiter(
+    initial=LINKEDIN_INITIAL_CONCURRENCY,
+    maximum=LINKEDIN_MAX_CONCURRENCY
+)
+
+# Single-flight token refresh (see lease.py): lock file for the processes of an instance, lease on the refresh token secret for instances
+TOKEN_LOCK_PATH = os.environ.get("TOKEN_LOCK_PATH", "/tmp/linkedin_token_refresh.lock")
+TOKEN_LEASE_SECONDS = int(os.environ.get("TOKEN_LEASE_SECONDS", "120"))
+
+# Process wide caches, kept warm between requests when served by gunicorn (see app below)
+TOKEN_CACHE_SECONDS = int(os.environ.get("TOKEN_CACHE_SECONDS", "600"))
+METADATA_CACHE_SECONDS = int(os.environ.get("METADATA_CACHE_SECONDS", "3600"))
+
+# Campaign dimension table refreshed once per run (see dimensions.py). FACT_ROWS "ids" leaves the campaign and
+# campaign group names, type and status out of the fact rows (NULL) and skips their lookups, it implies the dimension
+CAMPAIGN_DIMENSION_ENABLED = os.environ.get("CAMPAIGN_DIMENSION", "false").lower() == "true"
+FACT_ROWS = os.environ.get("FACT_ROWS", "full")
+FACT_ROWS_MODES = ("full", "ids")
+if FACT_ROWS not in FACT_ROWS_MODES:
+    raise ValueError(f"FACT_ROWS must be one of: {', '.join(FACT_ROWS_MODES)}")
+CAMPAIGN_DIMENSION_ENABLED = CAMPAIGN_DIMENSION_ENABLED or FACT_ROWS == "ids"
+
+# Work units run through pipelined fetch, enrich, coerce and load stages (see pipeline.py), queues hold
+# PIPELINE_QUEUE_SIZE units each. More than one load worker runs concurrent DML on the same tables
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", "2"))
+PIPELINE_FETCH_WORKERS = int(os.environ.get("PIPELINE_FETCH_WORKERS", "2"))
+PIPELINE_LOAD_WORKERS = int(os.environ.get("PIPELINE_LOAD_WORKERS", "1"))
+
+# Run history (see run_history.py): a run is flagged when its seconds per unit exceed RUN_REGRESSION_FACTOR times the
+# median of the last RUN_HISTORY_BASELINE_RUNS runs of its mode, or it takes more than RUN_TIMEOUT_WARNING of the timeout
+RUN_HISTORY_ENABLED = os.environ.get("RUN_HISTORY_ENABLED", "true").lower() == "true"
+RUN_HISTORY_BASELINE_RUNS = int(os.environ.get("RUN_HISTORY_BASELINE_RUNS", "20"))
+RUN_REGRESSION_FACTOR = float(os.environ.get("RUN_REGRESSION_FACTOR", "1.5"))
+RUN_TIMEOUT_WARNING = float(os.environ.get("RUN_TIMEOUT_WARNING", "0.8"))
+
+# Activity index (see activity.py): dates without any delivery are skipped for every table and the other dates are
+# only requested for the campaigns whose run schedule covers them
+ACTIVITY_INDEX_ENABLED = os.environ.get("ACTIVITY_INDEX", "false").lower() == "true"
+
+# Dashboard aggregates served by GET /aggregates (see aggregates.py): results cached in process, at most
+# AGGREGATE_CACHE_ENTRIES of them. Loads of this process invalidate them, AGGREGATE_CACHE_SECONDS bounds how long
+# an entry is served after a load by another instance
+AGGREGATE_CACHE_ENTRIES = int(os.environ.get("AGGREGATE_CACHE_ENTRIES", "256"))
+AGGREGATE_CACHE_SECONDS = int(os.environ.get("AGGREGATE_CACHE_SECONDS", "900"))
+# Bearer token the callers of /aggregates must send, the endpoint answers 403 when it is not set
+AGGREGATES_TOKEN = os.environ.get("AGGREGATES_TOKEN")
+# Accounts served by /aggregates, comma separated, LINKEDIN_ACCOUNT_ID by default
+AGGREGATE_ACCOUNTS = [a.strip() for a in os.environ.get("AGGREGATE_ACCOUNTS", ACCOUNT_ID).split(",") if a.strip()]
+# end_date can be at most this many days before yesterday, a later one is moved back to yesterday
+AGGREGATE_MAX_DAYS_BACK = int(os.environ.get("AGGREGATE_MAX_DAYS_BACK", "30"))
+
+# Profiling (cProfile + tracemalloc) of every run, written to this local path or gs://bucket/prefix when set
+PROFILE_PATH = os.environ.get("PROFILE_PATH")
+PROFILE_TOP_N = int(os.environ.get("PROFILE_TOP_N", "20"))
+
+# One pooled HTTP session for every LinkedIn and worker request of the process
+HTTP_SESSION = requests.Session()
+HTTP_SESSION.mount(
+    "https://",
+    requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=max(LINKEDIN_MAX_CONCURRENCY, SHARD_MAX_WORKERS))
+)
+
 
 # ======================================================================
 # Email helpers
@@ -63,7 +198,7 @@ def getAccountName(account_id, access_token):
         "Content-Type": "application/json",
         "X-Restli-Protocol-Version": "2.0.0"
     }
-    response = requests.get(url, headers=headers)
+    response = HTTP_SESSION.get(url, headers=headers)
     if response.status_code == 200:
         data = response.json()
         return data.get("name", "N/A")
@@ -104,7 +239,7 @@ def refresh_access_token_using_refresh_token(refresh_token):
         "client_id": CLIENT_ID,
         "client_secret": CLIENT_SECRET
     }
-    resp = requests.post(url, data=data)
+    resp = HTTP_SESSION.post(url, data=data)
     resp.raise_for_status()
     return resp.json()
 
@@ -115,29 +250,65 @@ def test_access_token(token):
     # lightweight test; will return True if token works, False if 401
     url = "https://api.linkedin.com/v2/me"
     headers = {"Authorization": f"Bearer {token}"}
-    r = requests.get(url, headers=headers)
+    r = HTTP_SESSION.get(url, headers=headers)
     return r.status_code == 200
 
 # ======================================================================
 # Get valid access token (refresh if needed)
 # ======================================================================
+TOKEN_LOCK = threading.Lock()
+TOKEN_CACHE = {"token": None, "checked_at": 0.0}
+
 def get_valid_access_token():
     """
-    Returns a valid access token string. Uses access token from Secret Manager
-    if still valid. Otherwise uses refresh token to obtain a new access token,
-    updates secrets and returns the new token.
+    Returns a valid access token, reusing the one checked in the last
+    TOKEN_CACHE_SECONDS. Concurrent requests wait for a single check or
+    refresh instead of each doing their own.
     """
-    # Try reading existing access token (may not exist)
-    access_token = None
+    with TOKEN_LOCK:
+        if TOKEN_CACHE["token"] and time.monotonic() - TOKEN_CACHE["checked_at"] < TOKEN_CACHE_SECONDS:
+            return TOKEN_CACHE["token"]
+        TOKEN_CACHE["token"] = fetch_valid_access_token()
+        TOKEN_CACHE["checked_at"] = time.monotonic()
+        return TOKEN_CACHE["token"]
+
+def read_valid_access_token():
+    """Returns the stored access token when LinkedIn accepts it, else None."""
     try:
         access_token = access_secret(ACCESS_TOKEN_SECRET)
     except Exception:
-        access_token = None
-
+        return None
     if access_token and test_access_token(access_token):
         return access_token
+    return None
 
-    # Need to refresh using refresh token
+def fetch_valid_access_token():
+    """
+    Returns a valid access token string. Uses access token from Secret Manager
+    if still valid. Otherwise uses refresh token to obtain a new access token,
+    updates secrets and returns the new token. Only one worker refreshes at a
+    time: the processes of a machine take TOKEN_LOCK_PATH and the instances a
+    lease on the refresh token secret (see lease.py), the others wait and
+    reuse the new token.
+    """
+    access_token = read_valid_access_token()
+    if access_token:
+        return access_token
+
+    with lease.file_lock(TOKEN_LOCK_PATH), lease.secret_lease(
+        sm_client,
+        f"projects/{PROJECT_ID}/secrets/{REFRESH_TOKEN_SECRET}",
+        ttl_seconds=TOKEN_LEASE_SECONDS
+    ):
+        # The previous holder may have refreshed it while we were waiting
+        access_token = read_valid_access_token()
+        if access_token:
+            print("Using the access token refreshed by another worker")
+            return access_token
+        return refresh_stored_access_token()
+
+def refresh_stored_access_token():
+    """Refreshes the access token with the refresh token and stores both in Secret Manager."""
     try:
         refresh_token = access_secret(REFRESH_TOKEN_SECRET)
     except Exception as e:
@@ -179,12 +350,85 @@ def ensure_dataset_and_table():
     for table_info in TABLE_IDS:
         for TABLE_ID, table_config in table_info.items():
             table_ref = bq_client.dataset(DATASET_ID).table(TABLE_ID)
+            if STORAGE_LAYOUT == "wide":
+                continue
             try:
                 bq_client.get_table(table_ref)
             except NotFound:
                 print(f"Couldn't find table: {TABLE_ID}")
                 return jsonify({"status": "error", "reason": f"Couldn't find table: {TABLE_ID}"}), 404
 
+    if STORAGE_LAYOUT == "wide":
+        ensure_wide_layout()
+
+# ======================================================================
+# Wide storage layout: one fact table, the tables of metrics.py as views
+# ======================================================================
+WIDE_LAYOUT_READY = False
+WIDE_LAYOUT_LOCK = threading.Lock()
+
+def ensure_wide_layout():
+    """Sets up the wide layout once per instance, concurrent requests wait for it."""
+    global WIDE_LAYOUT_READY
+    with WIDE_LAYOUT_LOCK:
+        if not WIDE_LAYOUT_READY:
+            create_wide_layout()
+            WIDE_LAYOUT_READY = True
+
+def create_wide_layout():
+    """
+    Creates the wide table (with the column types of the existing tables)
+    when it doesn't exist, copies the history of the tables that are still
+    real tables into it and renames them to <table>_legacy, then (re)creates
+    the table names as views.
+    """
+    legacy_tables = {}
+    for table_id in shards.VALID_TABLE_NAMES:
+        try:
+            table = bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{table_id}")
+        except NotFound:
+            continue
+        if table.table_type == "TABLE":
+            legacy_tables[table_id] = table
+
+    wide_ref = f"{PROJECT_ID}.{DATASET_ID}.{wide.WIDE_TABLE_ID}"
+    try:
+        bq_client.get_table(wide_ref)
+    except NotFound:
+        fields = {}
+        for table in legacy_tables.values():
+            for field in table.schema:
+                fields.setdefault(field.name, field)
+        missing = [c for c in wide.DIMENSION_COLUMNS + wide.wide_metrics() if c not in fields]
+        if missing:
+            raise RuntimeError(f"Can't create {wide.WIDE_TABLE_ID}, no table has a type for: {', '.join(missing)}")
+        table = bigquery.Table(
+            wide_ref,
+            schema=[fields[c] for c in wide.DIMENSION_COLUMNS + wide.wide_metrics()]
+        )
+        table.time_partitioning = bigquery.TimePartitioning(type_=bigquery.TimePartitioningType.DAY, field="date")
+        table.clustering_fields = ["account_id", "campaign_id"]
+        bq_client.create_table(table)
+        print(f"Created wide table {wide.WIDE_TABLE_ID}")
+
+    if legacy_tables:
+        wide_columns = {field.name for field in bq_client.get_table(wide_ref).schema}
+        table_columns = {
+            table_id: [f.name for f in table.schema if f.name in wide_columns and f.name not in wide.DIMENSION_COLUMNS]
+            for table_id, table in legacy_tables.items()
+        }
+        bq_client.query(wide.migration_script(PROJECT_ID, DATASET_ID, table_columns)).result()
+        for table_id in legacy_tables:
+            # DDL can't run inside the migration transaction
+            bq_client.query(
+                f"ALTER TABLE `{PROJECT_ID}.{DATASET_ID}.{table_id}` RENAME TO `{table_id}_legacy`"
+            ).result()
+        print(f"Copied {len(legacy_tables)} tables into {wide.WIDE_TABLE_ID}, kept as <table>_legacy")
+
+    bq_client.query("\n".join(
+        wide.view_statement(PROJECT_ID, DATASET_ID, table_id) for table_id in shards.VALID_TABLE_NAMES
+    )).result()
+
 # ======================================================================
 # LinkedIn data fetch + flatten
 # ======================================================================
@@ -193,107 +437,336 @@ def get_yesterday_date_parts():
     return yesterday.year, yesterday.month, yesterday.day, yesterday.isoformat()
 
 # ======================================================================
-# LinkedIn data fetch
+# Campaign and campaign group metadata
 # ======================================================================
-def fetch_linkedin_analytics(access_token, date):
-    date = datetime.strptime(date, "%Y-%m-%d").date()
-    start_date = date
-    end_date = date
-    url = (
-        "https://api.linkedin.com/rest/adAnalytics"
-        "?q=statistics"
-        "&timeGranularity=DAILY"
-        f"&accounts=List(urn%3Ali%3AsponsoredAccount%3A{ACCOUNT_ID})"
-        "&pivots=List(CAMPAIGN,CAMPAIGN_GROUP)"
-        f"&dateRange=(start:(day:{start_date.day},month:{start_date.month},year:{start_date.year}),end:(day:{end_date.day},month:{end_date.month},year:{end_date.year}))"
-        "&fields=pivotValues,impressions,clicks,costInUsd,oneClickLeads,externalWebsiteConversions,sends,opens,validWorkEmailLeads,oneClickLeadFormOpens,shares,comments,reactions,totalEngagements,cardImpressions,cardClicks"
-    )
+# {url: (fetched at, response)}, campaign names and statuses can change so entries expire
+METADATA_CACHE = {}
 
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "LinkedIn-Version": "202510",
-        "Content-Type": "application/json",
-        "X-Restli-Protocol-Version": "2.0.0"
-    }
+def get_linkedin_entity(access_token, url, counter=None):
+    cached = METADATA_CACHE.get(url)
+    if cached and time.monotonic() - cached[0] < METADATA_CACHE_SECONDS:
+        return cached[1]
+    try:
+        r = concurrency.limited_get(LINKEDIN_LIMITER, url, linkedin_headers(access_token), session=HTTP_SESSION, counter=counter)
+        response = r.json()
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+        return {}
+    if r.ok:
+        METADATA_CACHE[url] = (time.monotonic(), response)
+    return response
 
-    print(f"📡 Requesting LinkedIn Ad Analytics for {date} ...")
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    return r.json()
+def collect_elements_and_metadata(access_token, elements, account_id=None, state=None):
+    """
+    Returns (the elements as a list, {campaign_group_id: response},
+    {campaign_id: response}). The lookup of a campaign group or campaign
+    starts as soon as an element references it, so with a streamed response
+    (see stream_linkedin_analytics) the lookups run while the rest of the
+    response downloads. Each of them is requested once, and only when the
+    listings of the run's `state` (see refresh_campaign_dimension) don't have it.
+    """
+    account_id = account_id or ACCOUNT_ID
+    known_groups, known_campaigns = state.known_entities(account_id) if state else ({}, {})
+    collected = []
+    responses = {}
+    lookups = {}
+    # The pool is sized for the highest limit, LINKEDIN_LIMITER decides how many requests are in flight
+    with ThreadPoolExecutor(max_workers=LINKEDIN_MAX_CONCURRENCY) as pool:
+        for element in elements:
+            collected.append(element)
+            campaign_group_id, campaign_id = transforms.parse_pivot_values(element.get("pivotValues", []))
+            for kind, entity_id, path, known in (
+                ("campaign_group", campaign_group_id, "adCampaignGroups", known_groups),
+                ("campaign", campaign_id, "adCampaigns", known_campaigns),
+            ):
+                if entity_id == transforms.NOT_AVAILABLE or (kind, entity_id) in responses or (kind, entity_id) in lookups:
+                    continue
+                if entity_id in known:
+                    responses[(kind, entity_id)] = known[entity_id]
+                else:
+                    lookups[(kind, entity_id)] = pool.submit(
+                        get_linkedin_entity,
+                        access_token,
+                        f"https://api.linkedin.com/rest/adAccounts/{account_id}/{path}/{entity_id}",
+                        state.api_calls if state else None
+                    )
+        responses.update({key: lookup.result() for key, lookup in lookups.items()})
+    campaign_groups = {i: r for (kind, i), r in responses.items() if kind == "campaign_group"}
+    campaigns = {i: r for (kind, i), r in responses.items() if kind == "campaign"}
+    return collected, campaign_groups, campaigns
 
 # ======================================================================
-# Data flattening and insertion
+# Campaign dimension table
 # ======================================================================
-def flatten_linkedin_response(access_token, json_data, date):
-    rows = []
-    date = datetime.strptime(date, "%Y-%m-%d").date()
-
-    headers = {
-        "Authorization": f"Bearer {access_token}",
-        "LinkedIn-Version": "202510",
-        "Content-Type": "application/json",
-        "X-Restli-Protocol-Version": "2.0.0"
-    }
+DIMENSION_TABLE_READY = False
 
-    elements = json_data.get("elements", [])
+def list_linkedin_entities(access_token, account_id, path, counter=None):
+    """
+    Pages through the account's adCampaigns or adCampaignGroups listing,
+    returns {id: response}. The requests are recorded in the run's `counter`.
+    """
+    entities = {}
+    page_token = None
+    while True:
+        r = concurrency.limited_get(
+            LINKEDIN_LIMITER,
+            dimensions.listing_url(account_id, path, page_token),
+            linkedin_headers(access_token),
+            session=HTTP_SESSION,
+            counter=counter
+        )
+        r.raise_for_status()
+        response = r.json()
+        for entity in response.get("elements", []):
+            entities[str(entity["id"])] = entity
+        page_token = dimensions.next_page_token(response)
+        if not page_token or not response.get("elements"):
+            return entities
 
-    for element in elements:
-        campaign_group_id = "N/A"
-        campaign_id = "N/A"
-        campaign_group_name = "N/A"
-        campaign_name = "N/A"
-        campaign_type = "N/A"
-        campaign_status = "N/A"
+def refresh_campaign_dimension(access_token, account_ids, state):
+    """
+    Lists the campaign groups and campaigns of every account once, keeps
+    them in the run's `state` for its rows and applies them to the dimension table's
+    history (see dimensions.py). Returns log lines, an account that fails
+    is logged and falls back to the per campaign lookups.
+    """
+    global DIMENSION_TABLE_READY
+    if not DIMENSION_TABLE_READY:
+        bq_client.query(dimensions.create_statements(PROJECT_ID, DATASET_ID)).result()
+        DIMENSION_TABLE_READY = True
 
+    logs = []
+    refreshed_at = datetime.now(timezone.utc)
+    for account_id in account_ids:
         try:
-            pivot_values = element.get("pivotValues", [])
-            for urn in pivot_values:
-                if "CampaignGroup" in urn:
-                    campaign_group_id = urn.split(":")[-1]
-                    url = f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaignGroups/{campaign_group_id}"
-                    resp = requests.get(url, headers=headers).json()
-                    campaign_group_name = resp.get("name", "N/A")
-                elif "Campaign" in urn:
-                    campaign_id = urn.split(":")[-1]
-                    url = f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaigns/{campaign_id}"
-                    resp = requests.get(url, headers=headers).json()
-                    campaign_name = resp.get("name", "N/A")
-                    campaign_type = resp.get("type", "N/A")
-                    campaign_status = resp.get("status", "N/A")
+            campaign_groups = list_linkedin_entities(access_token, account_id, "adCampaignGroups", state.api_calls)
+            campaigns = list_linkedin_entities(access_token, account_id, "adCampaigns", state.api_calls)
+            rows = dimensions.dimension_rows(account_id, campaign_groups, campaigns)
+
+            staging_ref = f"{PROJECT_ID}.{DATASET_ID}.{dimensions.DIMENSION_TABLE_ID}__staging_{uuid.uuid4().hex[:12]}_{account_id}"
+            schema, _ = TABLE_COERCERS.get(dimensions.DIMENSION_TABLE_ID)
+            staging_table = bigquery.Table(staging_ref, schema=schema)
+            staging_table.expires = datetime.now(timezone.utc) + timedelta(days=1)
+            bq_client.create_table(staging_table, exists_ok=True)
+            try:
+                insert_rows_into_bq(
+                    rows,
+                    dimensions.DIMENSION_TABLE_ID,
+                    destination=staging_ref,
+                    write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+                    job_ledger=state.job_ledger
+                )
+                job_config = bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ScalarQueryParameter("account_id", "STRING", str(account_id)),
+                    bigquery.ScalarQueryParameter("refreshed_at", "TIMESTAMP", refreshed_at),
+                ])
+                query_job = bq_client.query(dimensions.scd_script(PROJECT_ID, DATASET_ID, staging_ref), job_config=job_config)
+                query_job.result()
+                state.job_ledger.record(query_job, dimensions.DIMENSION_TABLE_ID, "history")
+            finally:
+                bq_client.delete_table(staging_ref, not_found_ok=True)
+
+            state.account_dimensions[str(account_id)] = (campaign_groups, campaigns)
+            logs.append(f"Campaign dimension for {account_id}: {len(campaign_groups)} campaign groups, {len(campaigns)} campaigns")
         except Exception as e:
-            print(f"Error processing pivotValues: {e}")
-
-        # remove pivotValues safely
-        element.pop("pivotValues", None)
-
-        # build the row
-        row = {
-            "date": date.strftime("%Y-%m-%d"),
-            "account_name": ACCOUNT_NAME,
-            "account_id": ACCOUNT_ID,
-            "campaign_group_name": campaign_group_name,
-            "campaign_group_id": campaign_group_id,
-            "campaign_name": campaign_name,
-            "campaign_id": campaign_id,
-            "campaign_type": campaign_type,
-            "campaign_status": campaign_status,
-        }
+            state.account_dimensions.pop(str(account_id), None)
+            logs.append(f"Campaign dimension refresh failed for {account_id}: {e}")
+    for line in logs:
+        print(line)
+    return logs
+
+# ======================================================================
+# Campaign activity index
+# ======================================================================
+def build_activity_index(access_token, account_id, start_date, end_date, state=None):
+    """
+    Builds the account's index from the campaign listing (the run's campaign
+    dimension when it was refreshed) and one account totals request over
+    the dates. A part that fails is left out, it then skips nothing.
+    """
+    windows = probed_days = None
+    try:
+        known_campaigns = state.listed_campaigns(account_id) if state else None
+        campaigns = known_campaigns if known_campaigns is not None else list_linkedin_entities(
+            access_token, account_id, "adCampaigns", state.api_calls if state else None
+        )
+        windows = activity.campaign_windows(campaigns)
+    except Exception as e:
+        print(f"Campaign listing for the activity index of {account_id} failed: {e}")
+    try:
+        response = request_linkedin_analytics(
+            access_token, start_date, activity.probe_fields(), ["ACCOUNT"], account_id=account_id, end_date=end_date,
+            state=state
+        )
+        probed_days = activity.active_days(response.get("elements", []))
+    except Exception as e:
+        print(f"Activity probe of {account_id} failed: {e}")
+    return activity.ActivityIndex(windows, probed_days)
+
+def live_campaign_ids(unit, state=None):
+    """The campaigns a unit's request is restricted to, None for the whole account."""
+    index = state.activity_indexes.get(str(unit["account_id"])) if state else None
+    return index.live_campaigns(unit["date"]) if index else None
+
+def skip_inactive_units(access_token, units, state):
+    """
+    Builds the activity index of every account of the units (kept in the
+    run's `state`) and drops the units of dates without delivery. The rows
+    of the dates the probe confirmed, if any, are deleted with one job per
+    table instead of a delete, a request and a load per day. Dates skipped
+    on the schedules alone (the probe failed) are left untouched.
+    Returns (the units to ingest, the skipped units, log lines).
+    """
+    for account_id in sorted({str(unit["account_id"]) for unit in units}):
+        dates = [unit["date"] for unit in units if str(unit["account_id"]) == account_id]
+        state.activity_indexes[account_id] = build_activity_index(access_token, account_id, min(dates), max(dates), state)
+    units, skipped_units = activity.split_units(units, state.activity_indexes)
+
+    groups = {}
+    for unit in skipped_units:
+        if not state.activity_indexes[str(unit["account_id"])].confirmed_inactive(unit["date"]):
+            continue
+        groups.setdefault((unit["account_id"], unit["table_id"]), set()).add(unit["date"])
+    for (account_id, table_id), dates in groups.items():
+        delete_records_for_dates(sorted(dates), table_id, account_id, job_ledger=state.job_ledger)
+
+    logs = []
+    if skipped_units:
+        skipped_dates = sorted({unit["date"] for unit in skipped_units})
+        logs.append("=" * 50)
+        logs.append(
+            f"Skipped {len(skipped_units)} work units on {len(skipped_dates)} dates without delivery: "
+            f"{', '.join(skipped_dates)}"
+        )
+        print(logs[-1])
+    return units, skipped_units, logs
+
+# ======================================================================
+# Schema typed coercion and quarantine
+# ======================================================================
+# Schemas and coercers are compiled once per table and kept for the life of the instance
+TABLE_COERCERS = coercion.TableCoercers(lambda table_id: bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{table_id}"))
+
+def coerce_rows_for_table(rows, table_id):
+    """
+    Returns the rows cast to the table schema, the ones that can't be cast
+    are quarantined. Raises coercion.QuarantineError when every row was
+    quarantined, the callers then skip the unit and leave its rows as they
+    are.
+    """
+    return coercion.coerce_rows_for_table(rows, table_id, TABLE_COERCERS, QUARANTINE_PATH)
+
+# ======================================================================
+# Dashboard aggregates cache (see aggregates.py)
+# ======================================================================
+AGGREGATE_CACHE = aggregates.AggregateCache(AGGREGATE_CACHE_ENTRIES, AGGREGATE_CACHE_SECONDS)
+
+def invalidate_aggregates(table_id, account_id, dates):
+    """Drops the cached aggregates reading the table's rows of the account (None for every account) on the dates."""
+    dates = [str(d) for d in dates if d]
+    if not dates:
+        return
+    # The wide table holds the rows of every table
+    table_ids = None if table_id == wide.WIDE_TABLE_ID else [table_id]
+    AGGREGATE_CACHE.invalidate(account_id, table_ids, min(dates), max(dates))
+
+def get_dashboard_aggregates(days, account_id, end_date):
+    """Returns (the rows of aggregates.campaign_query, whether they came from the cache)."""
+    start_date, end_date = aggregates.window_dates(days, end_date)
+    key = (str(account_id), start_date, end_date)
+    rows, generation = AGGREGATE_CACHE.get(key)
+    if rows is not None:
+        return rows, True
+    job_config = bigquery.QueryJobConfig(query_parameters=[
+        bigquery.ScalarQueryParameter("account_id", "STRING", str(account_id)),
+        bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+        bigquery.ScalarQueryParameter("end_date", "DATE", end_date),
+    ])
+    query = aggregates.campaign_query(PROJECT_ID, DATASET_ID)
+    rows = [dict(row.items()) for row in bq_client.query(query, job_config=job_config).result()]
+    AGGREGATE_CACHE.put(key, rows, account_id, start_date, end_date, aggregates.metric_sources(), generation)
+    return rows, False
+
+# ======================================================================
+# Deterministic job ids (see jobs.py)
+# ======================================================================
+MAX_JOB_ATTEMPTS = 10
+DATASET_LOCATION = None
 
-        # merge the remaining metrics
-        row.update(element)
-        rows.append(row)
+def dataset_location():
+    global DATASET_LOCATION
+    if DATASET_LOCATION is None:
+        DATASET_LOCATION = bq_client.get_dataset(f"{PROJECT_ID}.{DATASET_ID}").location
+    return DATASET_LOCATION
 
-    return rows
+def submit_job(submit, base_job_id=None, job_ledger=None):
+    """
+    Submits a job with submit(job_id). When a previous attempt (a retried
+    request, a rerun) already submitted a job under base_job_id, that job
+    is returned instead, running or done, and marked as reused in the
+    run's `job_ledger`. Only a failed job is submitted again, under the
+    next attempt's id.
+    """
+    if base_job_id is None:
+        return submit(None)
+    for attempt in range(MAX_JOB_ATTEMPTS):
+        job_id = jobs.attempt_job_id(base_job_id, attempt)
+        try:
+            return submit(job_id)
+        except Conflict:
+            job = bq_client.get_job(job_id, location=dataset_location())
+            if job.state == "DONE" and job.error_result:
+                continue
+            print(f"Job {job_id} was already submitted ({job.state}), reusing it")
+            if job_ledger:
+                job_ledger.mark_reused(job_id)
+            return job
+    raise RuntimeError(f"Job {base_job_id} failed {MAX_JOB_ATTEMPTS} times")
 
 # =========================================================================
 # BigQuery insert helpers
 # =========================================================================
-def insert_rows_into_bq(rows, table_id):
+def insert_rows_into_bq(rows, table_id, destination=None, write_disposition=None, job_key=None, job_ledger=None):
+    """
+    Casts the rows to the table schema and loads them. Rows that can't be
+    cast are quarantined instead of failing the load job, the number of
+    rows loaded is returned. `destination` loads them into another table
+    with the same schema (a staging table) instead. See load_rows_into_bq
+    for `job_key` and `job_ledger`.
+    """
     if not rows:
         print("No rows to insert.")
         return 0
-    table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
-    job = bq_client.load_table_from_json(rows, table_ref)
+    rows = coerce_rows_for_table(rows, table_id)
+    return load_rows_into_bq(
+        rows, table_id, destination=destination, write_disposition=write_disposition, job_key=job_key,
+        job_ledger=job_ledger
+    )
+
+def load_rows_into_bq(rows, table_id, destination=None, write_disposition=None, job_ids=None, job_key=None, job_ledger=None):
+    """
+    Loads rows already cast by coerce_rows_for_table and waits for the load
+    job. The job's id is appended to `job_ids` when given. With a `job_key`
+    (what identifies the work, e.g. run mode, dates and rows digest) the
+    job id is derived from it, so the same load submitted again reuses the
+    first one (see submit_job). The job is recorded in the run's
+    `job_ledger` when given.
+    """
+    table_ref = destination or f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
+    schema, _ = TABLE_COERCERS.get(table_id)
+    job_config = bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+    )
+    if write_disposition:
+        job_config.write_disposition = write_disposition
+    job = submit_job(
+        lambda job_id: bq_client.load_table_from_json(rows, table_ref, job_config=job_config, job_id=job_id),
+        jobs.job_id("load", table_ref, *job_key) if job_key else None,
+        job_ledger
+    )
+    if job_ids is not None:
+        job_ids.append(job.job_id)
     try:
         job.result()  # Wait for the job to complete
     except Exception as e:
@@ -304,53 +777,92 @@ def insert_rows_into_bq(rows, table_id):
         else:
             raise RuntimeError(f"BigQuery load job failed: {e}")
     print(f"Inserted {job.output_rows} rows into {table_ref}")
+    if job_ledger:
+        job_ledger.record(job, table_id, "load" if destination is None else "staging load")
+    if destination is None:
+        account_dates = {}
+        for row in rows:
+            account_dates.setdefault(row.get("account_id"), set()).add(row.get("date"))
+        for account_id, dates in account_dates.items():
+            invalidate_aggregates(table_id, account_id, dates)
     return job.output_rows
 
 # ======================================================================
 # Delete existing records in date range to avoid duplicates
 # ======================================================================
-def delete_records_in_date_range(start_date, end_date, table_id):
+def delete_records_in_date_range(start_date, end_date, table_id, account_id=None, job_ids=None, job_key=None, job_ledger=None):
     table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
+    query_parameters = [
+        bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
+        bigquery.ScalarQueryParameter("end_date", "DATE", end_date),
+    ]
     query = f"""
         DELETE FROM `{table_ref}`
         WHERE date >= @start_date AND date <= @end_date
     """
+    # Only delete the given account's rows, several accounts can share the same tables
+    if account_id:
+        query += "    AND account_id = @account_id\n"
+        query_parameters.append(bigquery.ScalarQueryParameter("account_id", "STRING", account_id))
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    # With the job_key of the load that follows, the delete is only run again when that load is
+    query_job = submit_job(
+        lambda job_id: bq_client.query(query, job_config=job_config, job_id=job_id),
+        jobs.job_id("delete", table_ref, account_id, *job_key) if job_key else None,
+        job_ledger
+    )
+    if job_ids is not None:
+        job_ids.append(query_job.job_id)
+    query_job.result()  # Wait for job to complete
+    print(f"Deleted records from {start_date} to {end_date} in {table_ref}")
+    if job_ledger:
+        job_ledger.record(query_job, table_id, "delete")
+    invalidate_aggregates(table_id, account_id, [start_date, end_date])
+    return query_job.num_dml_affected_rows
+
+def delete_records_for_dates(dates, table_id, account_id, job_key=None, job_ledger=None):
+    table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
+    query = f"""
+        DELETE FROM `{table_ref}`
+        WHERE date IN UNNEST(@dates) AND account_id = @account_id
+    """
     job_config = bigquery.QueryJobConfig(
         query_parameters=[
-            bigquery.ScalarQueryParameter("start_date", "DATE", start_date),
-            bigquery.ScalarQueryParameter("end_date", "DATE", end_date),
+            bigquery.ArrayQueryParameter("dates", "DATE", dates),
+            bigquery.ScalarQueryParameter("account_id", "STRING", account_id),
         ]
     )
-    query_job = bq_client.query(query, job_config=job_config)
+    query_job = submit_job(
+        lambda job_id: bq_client.query(query, job_config=job_config, job_id=job_id),
+        jobs.job_id("delete", table_ref, account_id, *job_key) if job_key else None,
+        job_ledger
+    )
     query_job.result()  # Wait for job to complete
-    print(f"Deleted records from {start_date} to {end_date} in {table_ref}")
+    print(f"Deleted records for {len(dates)} dates in {table_ref}")
+    if job_ledger:
+        job_ledger.record(query_job, table_id, "delete")
+    invalidate_aggregates(table_id, account_id, dates)
     return query_job.num_dml_affected_rows
 
 # ======================================================================
 # LinkedIn data fetch for specific date with metrics and pivots
 # ======================================================================
-def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
-    print(f"Fetching LinkedIn analytics for {date} with metrics: {metrics} and pivots: {pivots}")
-    date = datetime.strptime(date, "%Y-%m-%d").date()
-    start_date = date
-    end_date = date
-
-    impressionsRequested = "impressions" in metrics
-
-    headers = {
+def linkedin_headers(access_token):
+    return {
         "Authorization": f"Bearer {access_token}",
         "LinkedIn-Version": "202510",
         "Content-Type": "application/json",
         "X-Restli-Protocol-Version": "2.0.0"
     }
 
+def linkedin_analytics_url(date, fields, pivots=[], account_id=None, end_date=None, campaign_ids=None):
+    account_id = account_id or ACCOUNT_ID
+    date = datetime.strptime(date, "%Y-%m-%d").date()
+    start_date = date
+    end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date
+
     q = "statistics"
     qPivots = ""
-    # Ensure pivotValues is always requested
-    metrics.insert(0, "pivotValues")
-    # Ensure impressions are always requested, this is needed for LinkedIn to always return other metrics
-    # Not documented by LinkedIn but observed behavior.
-    metrics.insert(1, "impressions")
     if len(pivots) == 0:
         qPivots = "&pivots=List(CAMPAIGN,CAMPAIGN_GROUP)"
     else:
@@ -360,110 +872,1228 @@ def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
         else:
             qPivots = f"&pivots=List({','.join(pivots)})"
 
-
-    url = (
+    return (
         "https://api.linkedin.com/rest/adAnalytics"
         f"?q={q}"
         "&timeGranularity=DAILY"
-        f"&accounts=List(urn%3Ali%3AsponsoredAccount%3A{ACCOUNT_ID})"
+        f"&accounts=List(urn%3Ali%3AsponsoredAccount%3A{account_id})"
+        f"{activity.campaigns_facet(campaign_ids)}"
         f"&dateRange=(start:(day:{start_date.day},month:{start_date.month},year:{start_date.year}),end:(day:{end_date.day},month:{end_date.month},year:{end_date.year}))"
         f"{qPivots}"
         "&fields="
-        f"{','.join(metrics)}"
+        f"{','.join(fields)}"
+    )
+
+def request_linkedin_analytics(access_token, date, fields, pivots=[], account_id=None, end_date=None, campaign_ids=None, complete=True, state=None):
+    """
+    Requests the fields for the date (to end_date when given) and returns
+    LinkedIn's response as is, except for its elements which are completed
+    by split queries when they hit LinkedIn's cap (unless `complete` is
+    False, see complete_linkedin_analytics).
+    """
+    url = linkedin_analytics_url(date, fields, pivots, account_id=account_id, end_date=end_date, campaign_ids=campaign_ids)
+    r = concurrency.limited_get(
+        LINKEDIN_LIMITER, url, linkedin_headers(access_token), session=HTTP_SESSION,
+        counter=state.api_calls if state else None
     )
-    r = requests.get(url, headers=headers)
     r.raise_for_status()
-    retval = r.json()
-    if not impressionsRequested:
-        metrics.remove("impressions")
-        # Removing impressions from response as it was not requested
-        for element in retval.get("elements", []):
-            element.pop("impressions", None)
-    for element in retval.get("elements", []):
-        for metric in metrics:
-            if metric not in element:
-                element[metric] = 0
-    return retval
-
-# ======================================================================
-# Test data fetch
-# ======================================================================
-def get_linkedin_metrics(access_token, date, metrics=[], pivots=[]):
-    r = get_linkedin_analytics_for_date(
+    response = r.json()
+    if complete and splitting.is_capped(response.get("elements", [])):
+        response["elements"] = complete_linkedin_analytics(
+            access_token, date, fields, pivots, account_id, end_date, campaign_ids, response["elements"], state
+        )
+    return response
+
+def stream_linkedin_analytics(access_token, date, fields, pivots=[], account_id=None, end_date=None, campaign_ids=None, state=None):
+    """
+    Same request as request_linkedin_analytics, but yields the response's
+    elements as they are downloaded (see streaming.py). `campaign_ids`
+    restricts it to these campaigns of the account.
+    """
+    url = linkedin_analytics_url(date, fields, pivots, account_id=account_id, end_date=end_date, campaign_ids=campaign_ids)
+    r = concurrency.limited_get(
+        LINKEDIN_LIMITER, url, linkedin_headers(access_token), session=HTTP_SESSION, stream=True,
+        counter=state.api_calls if state else None
+    )
+    # Keys of the elements already yielded, in case the response hits the cap
+    seen = set()
+    with r:
+        r.raise_for_status()
+        for element in streaming.iter_elements(r):
+            seen.add(splitting.element_key(element))
+            yield element
+    if len(seen) < splitting.ELEMENT_CAP:
+        return
+    for element in complete_linkedin_analytics(access_token, date, fields, pivots, account_id, end_date, campaign_ids, state=state):
+        if splitting.element_key(element) not in seen:
+            yield element
+
+def complete_linkedin_analytics(access_token, date, fields, pivots, account_id=None, end_date=None, campaign_ids=None, elements=None, state=None):
+    """
+    Returns every element of a query whose response hit LinkedIn's element
+    cap, split by dates and then by campaigns (see splitting.py). `elements`
+    is the capped response when it can be reused. The campaigns are taken
+    from the run's listings in `state` when it has them.
+    """
+    account_id = account_id or ACCOUNT_ID
+
+    def fetch(start_date, end_date, campaign_ids):
+        return request_linkedin_analytics(
+            access_token, start_date, fields, pivots, account_id=account_id, end_date=end_date,
+            campaign_ids=campaign_ids, complete=False
+        ).get("elements", [])
+
+    def list_campaigns():
+        known_campaigns = state.listed_campaigns(account_id) if state else None
+        return list(known_campaigns if known_campaigns is not None else list_linkedin_entities(
+            access_token, account_id, "adCampaigns", state.api_calls if state else None
+        ))
+
+    # The pool is sized for the highest limit, LINKEDIN_LIMITER decides how many requests are in flight
+    with ThreadPoolExecutor(max_workers=LINKEDIN_MAX_CONCURRENCY) as pool:
+        return splitting.fetch_complete(
+            fetch, date, end_date or date, campaign_ids, list_campaigns, pivots or PIVOTS,
+            elements=elements, max_facet=activity.MAX_FACET_CAMPAIGNS, map_func=pool.map
+        )
+
+# ======================================================================
+# Get LinkedIn metrics for a date as BigQuery rows
+# ======================================================================
+def get_linkedin_metrics(access_token, date, metrics=[], pivots=[], account_id=None, account_name=None, table_id=None, campaign_ids=None, state=None):
+    """
+    Fetches the metrics and their campaign metadata and flattens them into
+    rows. With ARCHIVE_PATH set and a table_id, the raw responses are
+    archived first so the table can be rebuilt later (see archive.py).
+    """
+    account_id = account_id or ACCOUNT_ID
+    print(f"Fetching LinkedIn analytics for {date} with metrics: {metrics} and pivots: {pivots}")
+    fields = transforms.analytics_fields(metrics)
+    elements = stream_linkedin_analytics(access_token, date, fields, pivots, account_id=account_id, campaign_ids=campaign_ids, state=state)
+    return enrich_linkedin_elements(access_token, elements, date, metrics, account_id, account_name, table_id, state)
+
+def enrich_linkedin_elements(access_token, elements, date, metrics, account_id=None, account_name=None, table_id=None, state=None):
+    """
+    Adds the campaign metadata to the elements (a list, or the generator of
+    a streamed response) and flattens them into rows, archiving them first
+    when ARCHIVE_PATH is set.
+    """
+    elements, campaign_groups, campaigns = collect_linkedin_elements(access_token, elements, account_id, state)
+    return flatten_linkedin_elements(elements, campaign_groups, campaigns, date, metrics, account_id, account_name, table_id)
+
+def collect_linkedin_elements(access_token, elements, account_id=None, state=None):
+    """
+    Returns (the elements as a list, campaign groups, campaigns), the
+    metadata being looked up while a streamed response downloads.
+    """
+    if FACT_ROWS == "ids":
+        # The names are in the campaign dimension table
+        return list(elements), {}, {}
+    return collect_elements_and_metadata(access_token, elements, account_id=account_id, state=state)
+
+def flatten_linkedin_elements(elements, campaign_groups, campaigns, date, metrics, account_id=None, account_name=None, table_id=None):
+    """Flattens what collect_linkedin_elements returned into rows, archiving them first when ARCHIVE_PATH is set."""
+    account_id = account_id or ACCOUNT_ID
+    account_name = account_name or ACCOUNT_NAME
+    fields = transforms.analytics_fields(metrics)
+    if ARCHIVE_PATH and table_id:
+        archive.write_unit(
+            ARCHIVE_PATH, account_id, date, table_id, elements, fields,
+            {"name": account_name}, campaign_groups, campaigns
+        )
+    transforms.normalize_elements(elements, metrics)
+    return transforms.build_rows(
+        elements, date, account_id, account_name, campaign_groups, campaigns, names=FACT_ROWS == "full"
+    )
+
+# ======================================================================
+# Rebuild rows from the raw response archive (no LinkedIn calls)
+# ======================================================================
+def get_archived_metrics(unit):
+    """Returns the unit's rows rebuilt from the archive, or None when the unit was not archived."""
+    if unit["table_id"] == wide.WIDE_TABLE_ID:
+        archived_rows = {t["table_id"]: get_archived_metrics(t) for t in wide.table_units([unit])}
+        if all(rows is None for rows in archived_rows.values()):
+            return None
+        missing = [table_id for table_id, rows in archived_rows.items() if rows is None]
+        if missing:
+            print(f"Tables not in the archive for {unit['date']}, their metrics are left NULL: {missing}")
+        return wide.merge_rows(rows for rows in archived_rows.values() if rows is not None)
+    archived = archive.read_unit(ARCHIVE_PATH, unit["account_id"], unit["date"], unit["table_id"])
+    if archived is None:
+        return None
+    metrics = shards.table_metrics(unit["table_id"])
+    # Metrics added to metrics.py after the day was archived were never
+    # requested, leave them out (NULL) instead of zero filling them
+    requested = [m for m in metrics if m in archived["fields"]]
+    if len(requested) < len(metrics):
+        print(f"Metrics not in the archive for {unit['table_id']} {unit['date']}: {[m for m in metrics if m not in requested]}")
+    transforms.normalize_elements(archived["elements"], requested)
+    return transforms.build_rows(
+        archived["elements"],
+        unit["date"],
+        unit["account_id"],
+        archived["account"].get("name", "N/A"),
+        archived["campaign_groups"],
+        archived["campaigns"],
+        names=FACT_ROWS == "full"
+    )
+
+# ======================================================================
+# Read the JSON body of the request (if any)
+# ======================================================================
+def get_request_body(request):
+    if request is None or not hasattr(request, "get_json"):
+        return {}
+    body = request.get_json(silent=True)
+    return body if isinstance(body, dict) else {}
+
+def get_run_id(request, body):
+    """
+    The run the request belongs to (see jobs.py): the body's "run_id", the
+    continuation token's, the Cloud Scheduler execution's (the same for
+    its retries), else a new one. Raises ValueError for an invalid one.
+    """
+    if body.get("run_id") is not None:
+        return jobs.validate_run_id(body["run_id"])
+    if body.get("continuation_token"):
+        run_id = deadline.continuation_run_id(body["continuation_token"])
+        if run_id is not None:
+            return jobs.validate_run_id(run_id)
+    headers = getattr(request, "headers", None)
+    schedule_time = headers.get("X-CloudScheduler-ScheduleTime") if headers is not None else None
+    if schedule_time:
+        return jobs.scheduled_run_id(schedule_time)
+    return jobs.new_run_id()
+
+# ======================================================================
+# Process a single work unit (one table, account and date)
+# ======================================================================
+def fetch_work_unit_rows(access_token, unit, account_name, state=None):
+    if unit["table_id"] == wide.WIDE_TABLE_ID:
+        # The metrics are still requested table by table, LinkedIn caps the fields per request
+        return wide.merge_rows(
+            fetch_work_unit_rows(access_token, table_unit, account_name, state)
+            for table_unit in wide.table_units([unit])
+        )
+    return get_linkedin_metrics(
+        access_token,
+        unit["date"],
+        metrics=shards.table_metrics(unit["table_id"]),
+        pivots=PIVOTS,
+        account_id=unit["account_id"],
+        account_name=account_name,
+        table_id=unit["table_id"],
+        campaign_ids=live_campaign_ids(unit, state),
+        state=state
+    )
+
+def fetch_work_unit_elements(access_token, unit, state=None):
+    """
+    Returns [(table unit, elements, campaign groups, campaigns)], one per
+    table of the wide layout's unit. The campaign metadata is looked up
+    while the response streams in (see collect_elements_and_metadata).
+    """
+    table_units = wide.table_units([unit]) if unit["table_id"] == wide.WIDE_TABLE_ID else [unit]
+    fetched = []
+    for table_unit in table_units:
+        metrics = shards.table_metrics(table_unit["table_id"])
+        print(f"Fetching LinkedIn analytics for {table_unit['date']} with metrics: {metrics} and pivots: {PIVOTS}")
+        elements = stream_linkedin_analytics(
             access_token,
-            date,
-            metrics,
-            pivots
+            table_unit["date"],
+            transforms.analytics_fields(metrics),
+            PIVOTS,
+            account_id=table_unit["account_id"],
+            campaign_ids=live_campaign_ids(table_unit, state),
+            state=state
+        )
+        fetched.append((table_unit, *collect_linkedin_elements(access_token, elements, table_unit["account_id"], state)))
+    return fetched
+
+def enrich_work_unit_rows(fetched, account_name):
+    """Flattens what fetch_work_unit_elements returned into the unit's rows."""
+    table_rows = [
+        flatten_linkedin_elements(
+            elements,
+            campaign_groups,
+            campaigns,
+            table_unit["date"],
+            shards.table_metrics(table_unit["table_id"]),
+            account_id=table_unit["account_id"],
+            account_name=account_name,
+            table_id=table_unit["table_id"]
         )
-    rows = flatten_linkedin_response(access_token, r, date)
-    return rows
+        for table_unit, elements, campaign_groups, campaigns in fetched
+    ]
+    return wide.merge_rows(table_rows) if len(table_rows) > 1 else table_rows[0]
 
 # ======================================================================
-# Cloud Function entrypoint
+# Run the ingestion for a list of work units
 # ======================================================================
-def jc_linkedin_to_bq(request):
+def run_ingestion(access_token, units, scheduler, recorder=None, mode="ingest", run_id=None, state=None):
+    """
+    Runs the work units through the fetch, enrich, coerce and load stages
+    (see pipeline.py), so a unit is fetched while the ones before it are
+    still being flattened or loaded. Units are started in order until they
+    are done or the scheduler says there is no time left for another one,
+    the units that were not started are returned as a continuation token.
+    Each unit is fetched before its day is deleted, so the window in which
+    the day is deleted but not reloaded is only the delete and load jobs.
+    Every unit is added to the run's manifest when a `recorder` is given.
+    The delete and load job ids are derived from the unit, `mode`, `run_id`
+    and the rows, so a unit submitted again with the same rows by the same
+    run (a retried request, a continuation) reuses its jobs. The run's
+    `state` (see run_state.py) has its listings, activity indexes and job
+    ledger.
+    Returns a summary with the inserted rows per table and the email logs.
+    """
+    state = state or run_state.RunState()
+    summary = {"rows": {}, "total_rows": 0, "logs": [], "continuation_token": None, "remaining_units": 0}
+    summary_lock = threading.Lock()
+    account_names = {}
+
+    nUnits = len(units)
+    print(f"Number of work units to process: {nUnits}")
+
+    def tasks():
+        # Only asked for the next unit once the fetch queue has room, so the deadline is checked late
+        for nUnit, unit in enumerate(units):
+            if not scheduler.can_start():
+                remaining = units[nUnit:]
+                summary["continuation_token"] = deadline.encode_continuation_token(remaining, run_id)
+                summary["remaining_units"] = len(remaining)
+                print(f"Deadline approaching ({scheduler.remaining():.0f}s left), stopping with {len(remaining)} units remaining")
+                with summary_lock:
+                    summary["logs"].append("=" * 50)
+                    summary["logs"].append(
+                        f"Stopped before the deadline with {len(remaining)} work units remaining. "
+                        f"Continuation token: {summary['continuation_token']}"
+                    )
+                return
+
+            account_id = unit["account_id"]
+            if account_id not in account_names:
+                account_names[account_id] = getAccountName(account_id, access_token)
+                print(f"Using LinkedIn Account Name: {account_names[account_id]} ({account_id})")
+
+            print(f"Processing unit: {nUnit + 1} of {nUnits} - {unit['table_id']} for {unit['date']}")
+            yield {
+                "unit": unit,
+                "account_name": account_names[account_id],
+                "queued_at": time.monotonic(),
+                "stage_seconds": {},
+                "job_ids": [],
+            }
+
+    def timed(stage, func):
+        def run(task):
+            stage_started_at = time.monotonic()
+            task = func(task)
+            task["stage_seconds"][stage] = time.monotonic() - stage_started_at
+            return task
+        return run
+
+    def fetch(task):
+        task["fetched"] = fetch_work_unit_elements(access_token, task["unit"], state)
+        return task
+
+    def enrich(task):
+        task["rows"] = enrich_work_unit_rows(task.pop("fetched"), task["account_name"])
+        return task
+
+    def coerce(task):
+        rows = task.pop("rows")
+        try:
+            task["rows"] = coerce_rows_for_table(rows, task["unit"]["table_id"]) if rows else []
+        except coercion.QuarantineError as e:
+            # Only this unit is skipped, its day is neither deleted nor loaded
+            task["rows"] = []
+            task["skipped"] = str(e)
+        task["quarantined_rows"] = len(rows) - len(task["rows"])
+        return task
+
+    def load(task):
+        unit = task["unit"]
+        table_id = unit["table_id"]
+        rows = task.pop("rows")
+        if task.get("skipped"):
+            task["inserted_rows"] = 0
+            return task
+        job_key = (mode, run_id, unit["account_id"], unit["date"], unit["date"], jobs.rows_digest(rows))
+        # Delete existing records for that date to avoid duplicates
+        delete_records_in_date_range(
+            unit["date"], unit["date"], table_id, account_id=unit["account_id"], job_ids=task["job_ids"], job_key=job_key,
+            job_ledger=state.job_ledger
+        )
+        inserted_rows = load_rows_into_bq(
+            rows, table_id, job_ids=task["job_ids"], job_key=job_key, job_ledger=state.job_ledger
+        ) if rows else 0
+        task["inserted_rows"] = inserted_rows
+        return task
+
+    def record(task):
+        unit = task["unit"]
+        table_id = unit["table_id"]
+        inserted_rows = task["inserted_rows"]
+        if recorder:
+            recorder.add_unit(unit, task["stage_seconds"], inserted_rows, task["quarantined_rows"], task["job_ids"])
+        with summary_lock:
+            # Includes the time spent waiting in the queues, like the unit's share of the deadline
+            scheduler.record(time.monotonic() - task["queued_at"])
+            summary["rows"][table_id] = summary["rows"].get(table_id, 0) + inserted_rows
+            summary["total_rows"] += inserted_rows
+            summary["logs"].append("=" * 50)
+            summary["logs"].append(
+                f"Inserted {inserted_rows} rows into table ({table_id}) of BigQuery dataset {DATASET_ID} "
+                f"for account {task['account_name']} ({unit['account_id']}) and date {unit['date']}"
+            )
+            if task.get("skipped"):
+                summary["logs"].append(f"Skipped, existing rows left as they are: {task['skipped']}")
+            elif task["quarantined_rows"]:
+                summary["logs"].append(f"Quarantined {task['quarantined_rows']} rows that didn't match the table schema")
+
+    timed_load = timed("load", load)
+    stages = pipeline.Pipeline(
+        [
+            pipeline.Stage("fetch", timed("fetch", fetch), PIPELINE_FETCH_WORKERS),
+            pipeline.Stage("enrich", timed("enrich", enrich), PIPELINE_FETCH_WORKERS),
+            pipeline.Stage("coerce", timed("coerce", coerce)),
+            pipeline.Stage("load", lambda task: record(timed_load(task)), PIPELINE_LOAD_WORKERS),
+        ],
+        queue_size=PIPELINE_QUEUE_SIZE
+    )
     try:
-        print("Starting LinkedIn to BigQuery data ingestion...")
-
-        # Ensure we have a valid access token (refresh if needed)
-        valid_access_token = get_valid_access_token()
-
-        global ACCOUNT_NAME
-        ACCOUNT_NAME = getAccountName(ACCOUNT_ID, valid_access_token)
-        print(f"Using LinkedIn Account Name: {ACCOUNT_NAME}")
-
-        # Ensure BigQuery dataset and table exist
-        ensure_dataset_and_table()
-        _, _, _, date = get_yesterday_date_parts()
-
-        emailLogs = []
-
-        # Set the number of tables to process
-        nTables = len(TABLE_IDS)
-        print(f"Number of tables to process: {nTables}")
-        nTableProcessing = 0
-
-        for table_info in TABLE_IDS:
-            for TABLE_ID, table_config in table_info.items():
-                nTableProcessing += 1
-                print(f"Processing table: {nTableProcessing} of {nTables} - {TABLE_ID}")
-                # Delete existing records for that date to avoid duplicates
-                delete_records_in_date_range(date, date, TABLE_ID)
-
-                n_rows = 0
-                metrics = table_config.get("metrics", [])
-                for date_to_process in pd.date_range(date, date):
-                    print(f"Processing date: {date_to_process}")
-                    # Fetch LinkedIn analytics for yesterday
-                    date_str = date_to_process.strftime("%Y-%m-%d")
-                    print(f"Fetching data for date: {date_str}")
-                    rows = get_linkedin_metrics(valid_access_token, date_str, metrics=metrics, pivots=PIVOTS)
-                    inserted_rows = insert_rows_into_bq(rows, TABLE_ID)
-                    n_rows += inserted_rows
-                    emailLogs.append("=" * 50)
-                    emailLogs.append(f"Inserted {inserted_rows} rows into table ({TABLE_ID}) of BigQuery dataset {DATASET_ID} for date {date_str}")
+        stages.run(tasks())
+    finally:
+        if recorder:
+            recorder.add_stage_seconds({stage.name: stage.busy_seconds for stage in stages.stages})
+    print(stages.describe())
+    summary["logs"].append(stages.describe())
+    return summary
 
-        send_email(
-            EMAIL_RECIPIENT, 
-            "LinkedIn Data Ingestion", 
-            (
-                f"Date processed: {date}\n"
-                f"Account Name: {ACCOUNT_NAME}\n"
-                f"Dataset: {DATASET_ID}\n"
-                f"{chr(10).join(emailLogs)}\n"
+# ======================================================================
+# Transaction commit mode: stage every table, then replace them all at once
+# ======================================================================
+def load_staging_tables(groups, staging_id, job_ledger=None):
+    """
+    Loads the rows of every (account, table) group, already cast by
+    coerce_rows_for_table, into its own staging table, in parallel. Staging tables expire after a day in case the run
+    dies before dropping them. Returns {group key: (staging table, rows loaded)}.
+    """
+    def load_group(key, rows):
+        account_id, table_id = key
+        staging_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}__staging_{staging_id}_{account_id}"
+        schema, _ = TABLE_COERCERS.get(table_id)
+        staging_table = bigquery.Table(staging_ref, schema=schema)
+        staging_table.expires = datetime.now(timezone.utc) + timedelta(days=1)
+        bq_client.create_table(staging_table, exists_ok=True)
+        if not rows:
+            return staging_ref, 0
+        loaded = load_rows_into_bq(
+            rows,
+            table_id,
+            destination=staging_ref,
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE,
+            job_ledger=job_ledger
+        )
+        return staging_ref, loaded
+
+    staged = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(len(groups), TRANSACTION_MAX_WORKERS))) as pool:
+        futures = {pool.submit(load_group, key, group["rows"]): key for key, group in groups.items()}
+        for future in as_completed(futures):
+            staged[futures[future]] = future.result()
+    return staged
+
+def commit_staging_tables(groups, staged, job_ledger=None):
+    """
+    Replaces the staged dates of every table in a single multi-statement
+    transaction: readers see every table refreshed, or none of them.
+    """
+    statements = []
+    query_parameters = []
+    for n, ((account_id, table_id), group) in enumerate(groups.items()):
+        table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
+        statements.append(
+            f"DELETE FROM `{table_ref}` WHERE account_id = @account_id_{n} AND date IN UNNEST(@dates_{n});"
+        )
+        query_parameters.append(bigquery.ScalarQueryParameter(f"account_id_{n}", "STRING", account_id))
+        query_parameters.append(bigquery.ArrayQueryParameter(f"dates_{n}", "DATE", group["dates"]))
+        staging_ref, loaded = staged[(account_id, table_id)]
+        if loaded:
+            schema, _ = TABLE_COERCERS.get(table_id)
+            columns = ", ".join(f"`{field.name}`" for field in schema)
+            statements.append(f"INSERT INTO `{table_ref}` ({columns}) SELECT {columns} FROM `{staging_ref}`;")
+
+    script = (
+        "BEGIN\n"
+        "  BEGIN TRANSACTION;\n"
+        + "".join(f"  {statement}\n" for statement in statements)
+        + "  COMMIT TRANSACTION;\n"
+        "EXCEPTION WHEN ERROR THEN\n"
+        "  ROLLBACK TRANSACTION;\n"
+        "  RAISE USING MESSAGE = @@error.message;\n"
+        "END;\n"
+    )
+    job_config = bigquery.QueryJobConfig(query_parameters=query_parameters)
+    query_job = bq_client.query(script, job_config=job_config)
+    query_job.result()  # Wait for the transaction to commit
+    print(f"Committed {len(groups)} tables in one transaction")
+    # The statements of the script aren't broken down per table
+    if job_ledger:
+        job_ledger.record(query_job, f"transaction ({len(groups)} tables)", "transaction")
+    for (account_id, table_id), group in groups.items():
+        invalidate_aggregates(table_id, account_id, group["dates"])
+
+def run_transactional_ingestion(access_token, units, scheduler, recorder=None, run_id=None, state=None):
+    """
+    Fetches every work unit first, then loads each table's rows into a
+    staging table in parallel and applies all the replacements in one
+    BigQuery transaction. Units that could not be fetched before the
+    deadline (keeping TRANSACTION_RESERVE_SECONDS for the commit) are
+    returned as a continuation token, everything fetched is committed.
+    """
+    state = state or run_state.RunState()
+    summary = {"rows": {}, "total_rows": 0, "logs": [], "continuation_token": None, "remaining_units": 0}
+    account_names = {}
+    groups = {}
+
+    nUnits = len(units)
+    print(f"Number of work units to fetch: {nUnits}")
+
+    for nUnit, unit in enumerate(units):
+        if not scheduler.can_start(reserve=TRANSACTION_RESERVE_SECONDS):
+            remaining = units[nUnit:]
+            summary["continuation_token"] = deadline.encode_continuation_token(remaining, run_id)
+            summary["remaining_units"] = len(remaining)
+            print(f"Deadline approaching ({scheduler.remaining():.0f}s left), committing with {len(remaining)} units remaining")
+            summary["logs"].append("=" * 50)
+            summary["logs"].append(
+                f"Stopped before the deadline with {len(remaining)} work units remaining. "
+                f"Continuation token: {summary['continuation_token']}"
             )
+            break
+
+        account_id = unit["account_id"]
+        if account_id not in account_names:
+            account_names[account_id] = getAccountName(account_id, access_token)
+            print(f"Using LinkedIn Account Name: {account_names[account_id]} ({account_id})")
+
+        print(f"Fetching unit: {nUnit + 1} of {nUnits} - {unit['table_id']} for {unit['date']}")
+        started_at = time.monotonic()
+        rows = fetch_work_unit_rows(access_token, unit, account_names[account_id], state)
+        fetch_seconds = time.monotonic() - started_at
+        scheduler.record(fetch_seconds)
+        # Cast per unit, a unit whose rows are all quarantined is left out of the transaction
+        try:
+            coerced_rows = coerce_rows_for_table(rows, unit["table_id"]) if rows else []
+        except coercion.QuarantineError as e:
+            coerced_rows = None
+            summary["logs"].append("=" * 50)
+            summary["logs"].append(f"Skipped {unit['table_id']} for {unit['date']}, existing rows left as they are: {e}")
+        if recorder:
+            # The unit's rows are committed with every other unit's, see the run's commit stage
+            recorder.add_unit(
+                unit, {"fetch": fetch_seconds}, len(coerced_rows or []), len(rows) - len(coerced_rows or [])
+            )
+            recorder.add_stage_seconds({"fetch": fetch_seconds})
+        if coerced_rows is None:
+            continue
+
+        group = groups.setdefault((account_id, unit["table_id"]), {"rows": [], "dates": []})
+        group["rows"] += coerced_rows
+        group["dates"].append(unit["date"])
+
+    if not groups:
+        return summary
+
+    staging_id = uuid.uuid4().hex[:12]
+    started_at = time.monotonic()
+    staged = load_staging_tables(groups, staging_id, state.job_ledger)
+    try:
+        commit_staging_tables(groups, staged, state.job_ledger)
+    finally:
+        for staging_ref, _ in staged.values():
+            bq_client.delete_table(staging_ref, not_found_ok=True)
+    if recorder:
+        recorder.add_stage_seconds({"commit": time.monotonic() - started_at})
+
+    for (account_id, table_id), group in groups.items():
+        _, inserted_rows = staged[(account_id, table_id)]
+        summary["rows"][table_id] = summary["rows"].get(table_id, 0) + inserted_rows
+        summary["total_rows"] += inserted_rows
+        summary["logs"].append("=" * 50)
+        summary["logs"].append(
+            f"Inserted {inserted_rows} rows into table ({table_id}) of BigQuery dataset {DATASET_ID} "
+            f"for account {account_names[account_id]} ({account_id}) and dates {', '.join(group['dates'])} (one transaction)"
+        )
+        quarantined_rows = len(group["rows"]) - inserted_rows
+        if quarantined_rows:
+            summary["logs"].append(f"Quarantined {quarantined_rows} rows that didn't match the table schema")
+    return summary
+
+# ======================================================================
+# Intraday refresh
+# ======================================================================
+def metrics_digest(row, metric_names):
+    values = [row.get(metric) for metric in metric_names]
+    return hashlib.sha1(json.dumps(values, default=str).encode("utf-8")).hexdigest()[:16]
+
+def intraday_snapshot_path(account_id):
+    return storage.join(INTRADAY_SNAPSHOT_PATH, f"{account_id}.json")
+
+def load_intraday_snapshot(account_id, today):
+    """Returns {campaign key: metrics digest} as of the last intraday pull of today."""
+    data = storage.read_bytes(intraday_snapshot_path(account_id))
+    snapshot = json.loads(data) if data else {}
+    if snapshot.get("date") != today:
+        return {}
+    return snapshot.get("campaigns", {})
+
+def save_intraday_snapshot(account_id, today, campaigns):
+    data = json.dumps({"date": today, "campaigns": campaigns}, separators=(",", ":")).encode("utf-8")
+    storage.write_bytes(intraday_snapshot_path(account_id), data)
+
+def run_intraday(access_token, account_ids, state=None):
+    """
+    Pulls today's metrics and writes only the campaigns whose metrics
+    changed since the previous pull to the intraday table, with the time
+    of the pull. The per campaign digests of the last pull are kept in
+    INTRADAY_SNAPSHOT_PATH.
+    """
+    state = state or run_state.RunState()
+    summary = {"rows": {}, "total_rows": 0, "logs": [], "continuation_token": None, "remaining_units": 0}
+    today = datetime.now(timezone.utc).date().isoformat()
+
+    for account_id in account_ids:
+        account_name = getAccountName(account_id, access_token)
+        rows = get_linkedin_metrics(
+            access_token,
+            today,
+            metrics=INTRADAY_METRICS,
+            pivots=PIVOTS,
+            account_id=account_id,
+            account_name=account_name,
+            state=state
         )
-        return (f"Inserted {n_rows} rows.", 200)
+
+        last_seen = load_intraday_snapshot(account_id, today)
+        pulled_at = datetime.now(timezone.utc).isoformat()
+        changed_rows = []
+        for row in rows:
+            key = f"{row['campaign_group_id']}:{row['campaign_id']}"
+            digest = metrics_digest(row, INTRADAY_METRICS)
+            if last_seen.get(key) != digest:
+                last_seen[key] = digest
+                changed_rows.append(dict(row, pulled_at=pulled_at))
+
+        try:
+            inserted_rows = insert_rows_into_bq(changed_rows, INTRADAY_TABLE_ID, job_ledger=state.job_ledger)
+        except coercion.QuarantineError as e:
+            # Not remembered, the campaigns are compared again by the next pull
+            summary["logs"].append(f"Intraday {today}: skipped account {account_name} ({account_id}): {e}")
+            print(summary["logs"][-1])
+            continue
+        # Only remember the pull once its rows are loaded
+        save_intraday_snapshot(account_id, today, last_seen)
+
+        summary["rows"][INTRADAY_TABLE_ID] = summary["rows"].get(INTRADAY_TABLE_ID, 0) + inserted_rows
+        summary["total_rows"] += inserted_rows
+        summary["logs"].append(
+            f"Intraday {today}: {len(changed_rows)} of {len(rows)} campaigns changed, "
+            f"inserted {inserted_rows} rows into table ({INTRADAY_TABLE_ID}) for account {account_name} ({account_id})"
+        )
+        print(summary["logs"][-1])
+    return summary
+
+def reconcile_intraday(units, job_ledger=None):
+    """
+    Removes the intraday rows of the dates the daily load has processed,
+    the daily tables are the source of truth for them from now on.
+    Does nothing when the intraday table doesn't exist.
+    """
+    dates_by_account = {}
+    for unit in units:
+        dates_by_account.setdefault(unit["account_id"], set()).add(unit["date"])
+    if not dates_by_account:
+        return
+    try:
+        bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{INTRADAY_TABLE_ID}")
+    except NotFound:
+        return
+    for account_id, dates in dates_by_account.items():
+        deleted = delete_records_for_dates(sorted(dates), INTRADAY_TABLE_ID, account_id, job_ledger=job_ledger)
+        print(f"Reconciled {deleted} intraday rows for account {account_id}")
+
+# ======================================================================
+# Replay: rebuild tables from the raw response archive
+# ======================================================================
+def run_replay(units, scheduler, run_id=None, job_ledger=None):
+    """
+    Rebuilds the units from the archive in bulk: the units of each table and
+    account are read together, then replaced with one delete and one load
+    job. Days that were never archived are left untouched. The job ids are
+    scoped to `run_id`, like run_ingestion's.
+    """
+    summary = {"rows": {}, "total_rows": 0, "logs": [], "continuation_token": None, "remaining_units": 0}
+
+    # Group the units by account and table, keeping their order
+    groups = {}
+    for unit in units:
+        groups.setdefault((unit["account_id"], unit["table_id"]), []).append(unit)
+
+    done_units = 0
+    for (account_id, table_id), group in groups.items():
+        if not scheduler.can_start():
+            remaining = units[done_units:]
+            summary["continuation_token"] = deadline.encode_continuation_token(remaining, run_id)
+            summary["remaining_units"] = len(remaining)
+            summary["logs"].append("=" * 50)
+            summary["logs"].append(
+                f"Stopped before the deadline with {len(remaining)} work units remaining. "
+                f"Continuation token: {summary['continuation_token']}"
+            )
+            break
+
+        started_at = time.monotonic()
+        rows = []
+        dates = []
+        missing = []
+        for unit in group:
+            unit_rows = get_archived_metrics(unit)
+            if unit_rows is None:
+                missing.append(unit["date"])
+                continue
+            rows += unit_rows
+            dates.append(unit["date"])
+
+        inserted_rows = 0
+        quarantined_rows = 0
+        if dates:
+            # Cast before deleting, nothing is deleted when every row is quarantined
+            try:
+                coerced_rows = coerce_rows_for_table(rows, table_id) if rows else []
+            except coercion.QuarantineError as e:
+                scheduler.record(time.monotonic() - started_at)
+                done_units += len(group)
+                summary["logs"].append("=" * 50)
+                summary["logs"].append(f"Skipped {table_id} for account {account_id}, existing rows left as they are: {e}")
+                continue
+            quarantined_rows = len(rows) - len(coerced_rows)
+            job_key = ("replay", run_id, account_id, sorted(dates), jobs.rows_digest(coerced_rows))
+            delete_records_for_dates(dates, table_id, account_id, job_key=job_key, job_ledger=job_ledger)
+            if coerced_rows:
+                inserted_rows = load_rows_into_bq(coerced_rows, table_id, job_key=job_key, job_ledger=job_ledger)
+        scheduler.record(time.monotonic() - started_at)
+        done_units += len(group)
+
+        summary["rows"][table_id] = summary["rows"].get(table_id, 0) + inserted_rows
+        summary["total_rows"] += inserted_rows
+        summary["logs"].append("=" * 50)
+        summary["logs"].append(
+            f"Replayed {inserted_rows} rows into table ({table_id}) of BigQuery dataset {DATASET_ID} "
+            f"for account {account_id} from {len(dates)} archived dates"
+        )
+        if quarantined_rows:
+            summary["logs"].append(f"Quarantined {quarantined_rows} rows that didn't match the table schema")
+        if missing:
+            summary["logs"].append(f"Not in the archive (left untouched): {', '.join(missing)}")
+    return summary
+
+# ======================================================================
+# Verify: compare the tables with LinkedIn's account totals
+# ======================================================================
+def get_verification_mismatches(access_token, spec, state=None):
+    """
+    Requests the daily account totals of the key metrics (see verify.py)
+    once per account for the whole range, and compares them with one SUM
+    query per table. Returns {(account_id, table_id): [(date, metric,
+    LinkedIn total, table total)]} for the tables with mismatched days.
+    """
+    metric_names = verify.all_verify_metrics(spec["tables"])
+    fields = ["dateRange"] + transforms.analytics_fields(metric_names)
+    mismatches = {}
+    for account_id in spec["accounts"]:
+        response = request_linkedin_analytics(
+            access_token,
+            spec["start_date"],
+            fields,
+            ["ACCOUNT"],
+            account_id=account_id,
+            end_date=spec["end_date"],
+            state=state
+        )
+        linkedin_totals = verify.linkedin_daily_totals(response.get("elements", []), metric_names)
+        for table_id in spec["tables"]:
+            job_config = bigquery.QueryJobConfig(query_parameters=[
+                bigquery.ScalarQueryParameter("account_id", "STRING", account_id),
+                bigquery.ScalarQueryParameter("start_date", "DATE", spec["start_date"]),
+                bigquery.ScalarQueryParameter("end_date", "DATE", spec["end_date"]),
+            ])
+            query = verify.totals_query(PROJECT_ID, DATASET_ID, table_id, verify.verify_metrics(table_id))
+            query_job = bq_client.query(query, job_config=job_config)
+            table_totals = {row["date"]: dict(row.items()) for row in query_job.result()}
+            if state:
+                state.job_ledger.record(query_job, table_id, "verify")
+            table_mismatches = verify.find_mismatches(
+                linkedin_totals, table_totals, table_id, spec["start_date"], spec["end_date"]
+            )
+            if table_mismatches:
+                mismatches[(account_id, table_id)] = table_mismatches
+    return mismatches
+
+def run_verify(access_token, spec, state=None):
+    """Returns the work units of the mismatched days and the log lines of the verification."""
+    mismatches = get_verification_mismatches(access_token, spec, state)
+    units = []
+    logs = ["=" * 50]
+    for (account_id, table_id), table_mismatches in mismatches.items():
+        dates = sorted({day for day, _, _, _ in table_mismatches})
+        units += [{"account_id": account_id, "table_id": table_id, "date": day} for day in dates]
+        logs.append(f"Totals of {table_id} for account {account_id} don't match LinkedIn on {len(dates)} days:")
+        logs += [
+            f"  {day} {metric}: LinkedIn {expected:g}, BigQuery {actual:g}"
+            for day, metric, expected, actual in table_mismatches
+        ]
+    if not units:
+        logs.append(f"Every table matches LinkedIn's account totals from {spec['start_date']} to {spec['end_date']}")
+    print("\n".join(logs))
+    if STORAGE_LAYOUT == "wide":
+        units = wide.collapse_units(units)
+    return units, logs
+
+def new_scheduler(started_at, initial_estimate=0, budget_seconds=None):
+    """`budget_seconds` (a shard's budget from the coordinator) shortens the function timeout."""
+    return deadline.DeadlineScheduler(
+        min(FUNCTION_TIMEOUT_SECONDS, budget_seconds or FUNCTION_TIMEOUT_SECONDS),
+        safety_seconds=DEADLINE_SAFETY_SECONDS,
+        initial_estimate=initial_estimate,
+        started_at=started_at
+    )
+
+# ======================================================================
+# Coordinator: dispatch shards to worker invocations
+# ======================================================================
+def post_shard(worker_url, payload):
+    # The worker stops starting units in time to answer before the request times out
+    payload = dict(payload, notify=False, budget_seconds=SHARD_REQUEST_TIMEOUT)
+    payload.setdefault("mode", "worker")
+    try:
+        resp = HTTP_SESSION.post(worker_url, json=payload, timeout=SHARD_REQUEST_TIMEOUT)
+        result = resp.json()
     except Exception as e:
+        return {"status": "error", "error": str(e)}
+    if resp.status_code != 200 and result.get("status") != "error":
+        result = {"status": "error", "error": f"Worker returned HTTP {resp.status_code}"}
+    return result
+
+def dispatch_shards(worker_url, payloads, max_workers, scheduler, run_id=None):
+    """
+    Posts the worker payloads (shard specs or continuation tokens) to the
+    worker URL, at most `max_workers` at a time, and aggregates the worker
+    summaries. Continuation tokens returned by the workers are queued again.
+    New payloads are only posted while the scheduler has time for them,
+    the rest is returned as a continuation token.
+    """
+    summary = {"shards": 0, "rows": {}, "total_rows": 0, "failed": [], "continuation_token": None}
+    pending = list(payloads)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        in_flight = {}
+        while pending or in_flight:
+            while pending and len(in_flight) < max_workers and scheduler.can_start():
+                payload = pending.pop(0)
+                in_flight[pool.submit(post_shard, worker_url, payload)] = (payload, time.monotonic())
+            if not in_flight:
+                break
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                payload, started_at = in_flight.pop(future)
+                scheduler.record(time.monotonic() - started_at)
+                summary["shards"] += 1
+                result = future.result()
+                if result.get("status") != "ok":
+                    print(f"Shard failed: {payload} - {result.get('error')}")
+                    summary["failed"].append({"shard": payload, "error": result.get("error")})
+                    continue
+                for table_id, n_rows in result.get("rows", {}).items():
+                    summary["rows"][table_id] = summary["rows"].get(table_id, 0) + n_rows
+                summary["total_rows"] += result.get("total_rows", 0)
+                print(f"Shard done: {result.get('spec', payload)} - {result.get('total_rows', 0)} rows")
+                if result.get("continuation_token"):
+                    options = {k: payload[k] for k in ("mode", "commit_mode", "run_id") if k in payload}
+                    pending.append(dict(options, continuation_token=result["continuation_token"]))
+    if pending:
+        summary["continuation_token"] = deadline.encode_continuation_token(pending, run_id)
+        print(f"Deadline approaching, {len(pending)} shards left for the next invocation")
+    return summary
+
+def run_coordinator(body, spec, started_at, run_id):
+    worker_url = body.get("worker_url") or WORKER_URL
+    if not worker_url:
+        return jsonify({"status": "error", "error": "worker_url is required in coordinator mode"}), 400
+    try:
+        if body.get("continuation_token"):
+            payloads = deadline.decode_continuation_token(body["continuation_token"])
+            for payload in payloads:
+                # Every payload is checked again by its worker, the accounts are also listed in the email
+                if not isinstance(payload, dict):
+                    raise ValueError("Invalid continuation token")
+                [shards.validate_account_id(a) for a in payload.get("accounts", [])]
+        else:
+            payloads = shards.split_into_shards(
+                spec,
+                shard_days=int(body.get("shard_days", SHARD_DAYS)),
+                tables_per_shard=int(body.get("tables_per_shard") or 0) if STORAGE_LAYOUT == "tables" else 0
+            )
+        if not body.get("continuation_token"):
+            # "worker_mode": "replay" replays every shard from the archive
+            payloads = [dict(p, mode=body.get("worker_mode", "worker")) for p in payloads]
+            if body.get("commit_mode"):
+                payloads = [dict(p, commit_mode=body["commit_mode"]) for p in payloads]
+        # The workers' jobs belong to the coordinator's run, retried shards reuse them
+        payloads = [dict(p, run_id=run_id) for p in payloads]
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    max_workers = int(body.get("max_workers", SHARD_MAX_WORKERS))
+    print(f"Dispatching {len(payloads)} shards to {worker_url} with {max_workers} workers")
+
+    # Make sure the stored access token is valid before the workers start,
+    # otherwise every worker would try to refresh it at the same time
+    get_valid_access_token()
+
+    # Until a shard has finished assume it takes its whole budget
+    scheduler = new_scheduler(started_at, initial_estimate=SHARD_REQUEST_TIMEOUT)
+    if not scheduler.can_start():
+        return jsonify({
+            "status": "error",
+            "error": f"SHARD_REQUEST_TIMEOUT ({SHARD_REQUEST_TIMEOUT}s) leaves no time to dispatch a shard, "
+                     f"it must be under {scheduler.remaining():.0f}s"
+        }), 500
+    summary = dispatch_shards(worker_url, payloads, max_workers, scheduler, run_id)
+    summary["status"] = "ok" if not summary["failed"] else "error"
+    summary["run_id"] = run_id
+
+    logs = [f"Inserted {n} rows into table ({table_id})" for table_id, n in summary["rows"].items()]
+    logs += [f"Failed shard: {f['shard']} - {f['error']}" for f in summary["failed"]]
+    if summary["continuation_token"]:
+        logs.append(f"Stopped before the deadline. Continuation token: {summary['continuation_token']}")
+    if body.get("notify", True):
         send_email(
-            EMAIL_RECIPIENT, 
-            "LinkedIn Data Ingestion Error", 
+            EMAIL_RECIPIENT,
+            "LinkedIn Data Ingestion" if not summary["failed"] else "LinkedIn Data Ingestion Error",
             (
-                f"Error: {e}\n"
-                f"Date processed: {date}\n"
-                f"Account Name: {ACCOUNT_NAME}\n"
+                f"Dates processed: {spec['start_date']} to {spec['end_date']}\n"
+                f"Accounts: {', '.join(spec['accounts'])}\n"
                 f"Dataset: {DATASET_ID}\n"
+                f"Shards: {summary['shards']} ({len(summary['failed'])} failed)\n"
+                f"{chr(10).join(logs)}\n"
             )
         )
-        return (f"Error: {e}", 500)
+    return jsonify(summary), 200 if not summary["failed"] else 500
+
+# ======================================================================
+# Run history and regression flags
+# ======================================================================
+RUN_HISTORY = run_history.BigQueryHistory(bq_client, PROJECT_ID, DATASET_ID)
+
+def write_run_history(recorder, status, state, summary=None, units=None, error=None):
+    """
+    Compares the run with the last successful runs of its mode and writes
+    its manifest (see run_history.py), with the LinkedIn requests and BigQuery
+    jobs of the run's `state`. Returns the regression flags. The history is
+    best effort, failing to write it never fails the run.
+    """
+    if summary is None:
+        summary = {"total_rows": 0, "remaining_units": 0}
+        units = None
+    done_units = len(units) - summary["remaining_units"] if units is not None else len(recorder.units)
+    run = recorder.run_row(
+        status,
+        units=done_units,
+        remaining_units=summary["remaining_units"],
+        rows=summary["total_rows"],
+        api_calls=state.api_calls.requests,
+        retries=state.api_calls.throttled,
+        error=error,
+        job_costs=state.job_ledger
+    )
+    return run_history.write_history(
+        RUN_HISTORY,
+        recorder,
+        run,
+        RUN_HISTORY_BASELINE_RUNS,
+        factor=RUN_REGRESSION_FACTOR,
+        timeout_seconds=FUNCTION_TIMEOUT_SECONDS,
+        timeout_warning=RUN_TIMEOUT_WARNING
+    )
+
+# ======================================================================
+# Cloud Function entrypoint
+# ======================================================================
+@profiling.profiled("jc_linkedin_to_bq", PROFILE_PATH, PROFILE_TOP_N)
+def jc_linkedin_to_bq(request, body=None):
+    """
+    Without a body, ingests yesterday for every table. A JSON body with a
+    shard spec (see shards.py) ingests that date range, tables and accounts.
+    With "mode": "coordinator" the spec is split into shards that are
+    posted concurrently to "worker_url" (or SHARD_WORKER_URL).
+    When the deadline gets close no new work is started and the response
+    carries a "continuation_token"; posting it back resumes the run.
+    With "mode": "replay" the tables are rebuilt from the raw response
+    archive (ARCHIVE_PATH) without calling LinkedIn.
+    "commit_mode" (or COMMIT_MODE) picks how the tables are written, see
+    run_ingestion and run_transactional_ingestion.
+    With "mode": "intraday" today's changed campaigns are appended to the
+    intraday table (see run_intraday).
+    With "mode": "verify" the tables are compared with LinkedIn's daily
+    account totals and only the days that don't match are ingested again
+    ("reingest": false only reports them), see run_verify.
+    `body` replaces the request's JSON body when given (see app below).
+    """
+    started_at = time.monotonic()
+    body = get_request_body(request) if body is None else body
+    _, _, _, yesterday = get_yesterday_date_parts()
+    try:
+        spec = shards.parse_shard_spec(body, yesterday, ACCOUNT_ID)
+        if STORAGE_LAYOUT == "wide":
+            # A day's wide rows hold every table's metrics, they can't be refreshed for some tables only
+            spec["tables"] = list(shards.VALID_TABLE_NAMES)
+        if body.get("mode") != "coordinator":
+            if body.get("continuation_token"):
+                units = shards.validate_work_units(deadline.decode_continuation_token(body["continuation_token"]))
+            else:
+                units = shards.expand_work_units(spec)
+            if STORAGE_LAYOUT == "wide":
+                units = wide.collapse_units(units)
+        commit_mode = body.get("commit_mode", COMMIT_MODE)
+        if commit_mode not in COMMIT_MODES:
+            raise ValueError(f"commit_mode must be one of: {', '.join(COMMIT_MODES)}")
+        budget_seconds = body.get("budget_seconds")
+        if budget_seconds is not None and (not isinstance(budget_seconds, int) or budget_seconds <= 0):
+            raise ValueError("budget_seconds must be a positive number of seconds")
+        run_id = get_run_id(request, body)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    print(f"Run id: {run_id}")
+
+    if body.get("mode") == "coordinator":
+        return run_coordinator(body, spec, started_at, run_id)
+
+    # Intraday pulls run many times a day, they only email when asked to
+    notify = body.get("notify", body.get("mode") != "intraday")
+    if body.get("continuation_token"):
+        dates_processed = f"Resumed from continuation token ({len(units)} work units)"
+    elif spec["start_date"] == spec["end_date"]:
+        dates_processed = f"Date processed: {spec['start_date']}"
+    else:
+        dates_processed = f"Dates processed: {spec['start_date']} to {spec['end_date']}"
+
+    global ACCOUNT_NAME
+    recorder = run_history.RunRecorder(body.get("mode") or "ingest", commit_mode, run_id) if RUN_HISTORY_ENABLED else None
+    summary = None
+    # Units of dates without delivery (see skip_inactive_units)
+    skipped_units = []
+    # What the run builds up (job ledger, LinkedIn requests, campaign listings, activity indexes), never shared with another request
+    state = run_state.RunState()
+    try:
+        if body.get("mode") == "intraday":
+            print("Starting LinkedIn to BigQuery intraday refresh...")
+            dates_processed = "Intraday refresh"
+            valid_access_token = get_valid_access_token()
+            summary = run_intraday(valid_access_token, spec["accounts"], state)
+        elif body.get("mode") == "replay":
+            print("Starting LinkedIn to BigQuery replay from the archive...")
+            if not ARCHIVE_PATH:
+                raise RuntimeError("ARCHIVE_PATH must be set to replay from the archive")
+            dates_processed += f"\nReplayed from archive: {ARCHIVE_PATH}"
+
+            # Ensure BigQuery dataset and table exist
+            ensure_dataset_and_table()
+
+            summary = run_replay(units, new_scheduler(started_at, budget_seconds=budget_seconds), run_id, state.job_ledger)
+        else:
+            print("Starting LinkedIn to BigQuery data ingestion...")
+
+            # Ensure we have a valid access token (refresh if needed)
+            valid_access_token = get_valid_access_token()
+
+            ACCOUNT_NAME = getAccountName(ACCOUNT_ID, valid_access_token)
+            print(f"Using LinkedIn Account Name: {ACCOUNT_NAME}")
+
+            # Ensure BigQuery dataset and table exist
+            ensure_dataset_and_table()
+
+            run_logs = []
+            if CAMPAIGN_DIMENSION_ENABLED:
+                run_logs += refresh_campaign_dimension(
+                    valid_access_token,
+                    sorted({unit["account_id"] for unit in units}),
+                    state
+                )
+            if body.get("mode") == "verify" and not body.get("continuation_token"):
+                # Only the days whose totals don't match LinkedIn's are ingested again
+                dates_processed += "\nVerified against LinkedIn's account totals"
+                units, logs = run_verify(valid_access_token, spec, state)
+                run_logs += logs
+                if not body.get("reingest", True):
+                    units = []
+            elif ACTIVITY_INDEX_ENABLED and body.get("mode") in (None, "worker") and not body.get("continuation_token"):
+                units, skipped_units, logs = skip_inactive_units(valid_access_token, units, state)
+                run_logs += logs
+
+            if commit_mode == "transaction":
+                summary = run_transactional_ingestion(
+                    valid_access_token, units, new_scheduler(started_at, budget_seconds=budget_seconds), recorder,
+                    run_id=run_id, state=state
+                )
+            else:
+                summary = run_ingestion(
+                    valid_access_token, units, new_scheduler(started_at, budget_seconds=budget_seconds), recorder,
+                    mode=body.get("mode") or "ingest", run_id=run_id, state=state
+                )
+            summary["logs"] = run_logs + summary["logs"]
+
+            # The intraday rows of the processed dates (skipped ones included) are superseded by the daily tables
+            reconcile_intraday(skipped_units + units[:len(units) - summary["remaining_units"]], state.job_ledger)
+
+        if ROLLUPS_ENABLED and body.get("mode") != "intraday":
+            try:
+                rollups.update_rollups(
+                    bq_client, PROJECT_ID, DATASET_ID,
+                    wide.table_units(skipped_units + units[:len(units) - summary["remaining_units"]]),
+                    ROLLUP_TABLES_READY, state.job_ledger
+                )
+            except Exception as e:
+                # The daily tables are loaded, a failed rollup is fixed by the next run over the same dates
+                print(f"Rollup update failed: {e}")
+                summary["logs"].append(f"Rollup update failed: {e}")
+
+        print(LINKEDIN_LIMITER.describe())
+        summary["logs"].append(LINKEDIN_LIMITER.describe())
+        print("\n".join(state.job_ledger.describe()))
+        summary["logs"] += state.job_ledger.describe()
+
+        if recorder:
+            flags = write_run_history(recorder, "ok", state, summary, units if body.get("mode") != "intraday" else [])
+            summary["logs"] = [f"REGRESSION: {flag}" for flag in flags] + summary["logs"]
+        summary["logs"].append(f"Run id: {run_id}")
+
+        if notify:
+            send_email(
+                EMAIL_RECIPIENT, 
+                "LinkedIn Data Ingestion", 
+                (
+                    f"{dates_processed}\n"
+                    f"Account Name: {ACCOUNT_NAME}\n"
+                    f"Dataset: {DATASET_ID}\n"
+                    f"{chr(10).join(summary['logs'])}\n"
+                )
+            )
+        if not body:
+            if summary["continuation_token"]:
+                return (f"Inserted {summary['total_rows']} rows. Continuation token: {summary['continuation_token']}", 200)
+            return (f"Inserted {summary['total_rows']} rows.", 200)
+        return jsonify({
+            "status": "ok",
+            "spec": spec,
+            "rows": summary["rows"],
+            "total_rows": summary["total_rows"],
+            "continuation_token": summary["continuation_token"],
+            "remaining_units": summary["remaining_units"],
+            "run_id": run_id,
+            "linkedin_concurrency": LINKEDIN_LIMITER.stats(),
+        }), 200
+    except Exception as e:
+        if recorder:
+            write_run_history(recorder, "error", state, summary, units if body.get("mode") != "intraday" else [], error=e)
+        if notify:
+            send_email(
+                EMAIL_RECIPIENT, 
+                "LinkedIn Data Ingestion Error", 
+                (
+                    f"Error: {e}\n"
+                    f"{dates_processed}\n"
+                    f"Account Name: {ACCOUNT_NAME}\n"
+                    f"Dataset: {DATASET_ID}\n"
+                    f"{chr(10).join(state.job_ledger.describe())}\n"
+                )
+            )
+        if not body:
+            return (f"Error: {e}", 500)
+        return jsonify({"status": "error", "spec": spec, "error": str(e)}), 500
+
+# ======================================================================
+# Long-lived server (Dockerfile: gunicorn main:app)
+# The process stays up between requests, so the pooled HTTP session, the
+# BigQuery and Secret Manager clients, the access token and the metadata
+# caches stay warm. Every shared cache is thread safe, gunicorn can serve
+# concurrent requests with --threads.
+# ======================================================================
+app = Flask(__name__)
+APP_STARTED_AT = time.monotonic()
+
+@app.route("/", methods=["POST", "GET"])
+def ingest():
+    """Same as the Cloud Function: every mode and body of jc_linkedin_to_bq."""
+    return jc_linkedin_to_bq(flask_request)
+
+@app.route("/ingest/daily", methods=["POST", "GET"])
+def ingest_daily():
+    """Ingests yesterday. The body can still pick tables, accounts and the commit_mode."""
+    body = get_request_body(flask_request)
+    body = {k: v for k, v in body.items() if k not in ("start_date", "end_date", "continuation_token", "mode")}
+    return jc_linkedin_to_bq(flask_request, body=body)
+
+@app.route("/ingest/range", methods=["POST"])
+def ingest_range():
+    """Ingests the start_date to end_date of the body, like the Cloud Function."""
+    body = get_request_body(flask_request)
+    if not body.get("start_date") and not body.get("continuation_token"):
+        return jsonify({"status": "error", "error": "start_date is required"}), 400
+    return jc_linkedin_to_bq(flask_request, body=body)
+
+@app.route("/aggregates", methods=["GET"])
+def dashboard_aggregates():
+    """
+    The dashboard metrics per campaign over the last `days` days (one of
+    metrics.DASHBOARD_WINDOWS) to `end_date` (yesterday by default, within
+    AGGREGATE_MAX_DAYS_BACK days) of `account_id` (LINKEDIN_ACCOUNT_ID by
+    default, one of AGGREGATE_ACCOUNTS), from the cache when no load
+    touched them since they were queried. Requires AGGREGATES_TOKEN.
+    """
+    if not aggregates.is_authorized(flask_request.headers.get("Authorization"), AGGREGATES_TOKEN):
+        return jsonify({"status": "error", "error": "Forbidden"}), 403
+    args = flask_request.args
+    account_id = args.get("account_id", ACCOUNT_ID)
+    if account_id not in AGGREGATE_ACCOUNTS:
+        return jsonify({"status": "error", "error": f"Account {account_id} is not in AGGREGATE_ACCOUNTS"}), 403
+    yesterday = get_yesterday_date_parts()[3]
+    try:
+        days = int(args.get("days", metrics.DASHBOARD_WINDOWS[0]))
+        if days not in metrics.DASHBOARD_WINDOWS:
+            raise ValueError(f"days must be one of: {', '.join(str(d) for d in metrics.DASHBOARD_WINDOWS)}")
+        end_date = aggregates.clamp_end_date(args.get("end_date") or yesterday, yesterday, AGGREGATE_MAX_DAYS_BACK)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    rows, cached = get_dashboard_aggregates(days, account_id, end_date)
+    start_date, end_date = aggregates.window_dates(days, end_date)
+    return jsonify({
+        "status": "ok",
+        "account_id": account_id,
+        "start_date": start_date,
+        "end_date": end_date,
+        "metrics": metrics.DASHBOARD_METRICS,
+        "cached": cached,
+        "rows": rows,
+    }), 200
 
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify({
+        "status": "ok",
+        "uptime_seconds": round(time.monotonic() - APP_STARTED_AT),
+        "access_token_cached": TOKEN_CACHE["token"] is not None,
+        "cached_entities": len(METADATA_CACHE),
+        "linkedin_concurrency": LINKEDIN_LIMITER.stats(),
+        "aggregate_cache": AGGREGATE_CACHE.stats(),
+    }), 200
@@ -1,14 +1,33 @@
 import os
 import re
 import sys
+import threading
+import time
 import pandas as pd
 import requests
 import smtplib
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime, timedelta, timezone
 from google.cloud import bigquery, secretmanager
+import activity
+import archive
+import coercion
+import concurrency
+import dimensions
 import env
+import job_costs
 import metrics
+import pipeline
+import profiling
+import response_cache
+import rollups
+import run_history
+import schema_evolution
+import splitting
+import transforms
+import verify
+import wide
 from google.api_core.exceptions import NotFound
 from email.mime.text import MIMEText
 
@@ -33,6 +52,59 @@ SMTP_SERVER = env.SMTP_SERVER
 SMTP_PORT = env.SMTP_PORT
 EMAIL_RECIPIENT = env.EMAIL_RECIPIENT
 
+# Local response cache settings (older env.py files may not define them)
+RESPONSE_CACHE_DIR = getattr(env, "RESPONSE_CACHE_DIR", ".linkedin_cache")
+RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS = getattr(env, "RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS", 90)
+RESPONSE_CACHE_MAX_MB = getattr(env, "RESPONSE_CACHE_MAX_MB", 512)
+
+# Raw response archive (local path or gs://bucket/prefix), disabled when not set
+ARCHIVE_PATH = getattr(env, "ARCHIVE_PATH", None)
+
+# Rows that don't match their table schema are written here (local path or gs://), only logged when not set
+QUARANTINE_PATH = getattr(env, "QUARANTINE_PATH", None)
+
+# Weekly and monthly rollup tables (see ROLLUP_PERIODS in metrics.py)
+ROLLUPS_ENABLED = getattr(env, "ROLLUPS_ENABLED", False)
+# Rollup tables already created by this run (see rollups.update_rollups)
+ROLLUP_TABLES_READY = set()
+
+# "tables" writes every table of metrics.py, "wide" writes the single wide table (see wide.py). The wide
+# table and the views are created by the Cloud Function on its first run with STORAGE_LAYOUT=wide
+STORAGE_LAYOUT = getattr(env, "STORAGE_LAYOUT", "tables")
+
+# Adaptive limit of concurrent LinkedIn requests (see concurrency.py)
+LINKEDIN_INITIAL_CONCURRENCY = getattr(env, "LINKEDIN_INITIAL_CONCURRENCY", 4)
+LINKEDIN_MAX_CONCURRENCY = getattr(env, "LINKEDIN_MAX_CONCURRENCY", 32)
+LINKEDIN_LIMITER = concurrency.AdaptiveLimiter(
+    initial=LINKEDIN_INITIAL_CONCURRENCY,
+    maximum=LINKEDIN_MAX_CONCURRENCY
+)
+
+# Campaign metadata from one listing of the account's campaigns and campaign groups per run instead of one lookup per
+# campaign (see dimensions.py). FACT_ROWS "ids" leaves the names, type and status out of the rows and skips the lookups.
+# The campaign_dimension table itself is refreshed by the Cloud Function
+CAMPAIGN_DIMENSION_ENABLED = getattr(env, "CAMPAIGN_DIMENSION", False)
+FACT_ROWS = getattr(env, "FACT_ROWS", "full")
+
+# Dates run through pipelined fetch, enrich, coerce and load stages (see pipeline.py), queues hold PIPELINE_QUEUE_SIZE dates each
+PIPELINE_QUEUE_SIZE = getattr(env, "PIPELINE_QUEUE_SIZE", 2)
+PIPELINE_FETCH_WORKERS = getattr(env, "PIPELINE_FETCH_WORKERS", 2)
+PIPELINE_LOAD_WORKERS = getattr(env, "PIPELINE_LOAD_WORKERS", 1)
+
+# Run history in a local SQLite file (see run_history.py), None disables it. The run is flagged when its seconds per
+# date exceed RUN_REGRESSION_FACTOR times the median of the last RUN_HISTORY_BASELINE_RUNS runs of the same kind
+RUN_HISTORY_PATH = getattr(env, "RUN_HISTORY_PATH", ".linkedin_run_history.sqlite")
+RUN_HISTORY_BASELINE_RUNS = getattr(env, "RUN_HISTORY_BASELINE_RUNS", 20)
+RUN_REGRESSION_FACTOR = getattr(env, "RUN_REGRESSION_FACTOR", 1.5)
+
+# Dates without any delivery are skipped for every table and the other dates only requested for the campaigns
+# scheduled on them (see activity.py)
+ACTIVITY_INDEX_ENABLED = getattr(env, "ACTIVITY_INDEX", False)
+
+# Profiling (cProfile + tracemalloc) of the run, written to this local path or gs://bucket/prefix when set
+PROFILE_PATH = getattr(env, "PROFILE_PATH", None)
+PROFILE_TOP_N = getattr(env, "PROFILE_TOP_N", 20)
+
 # ======================================================================
 # Email helpers
 # ======================================================================
@@ -83,6 +155,13 @@ print("\nYou may enter the following arguments when executing this script:\n")
 print("  --start-date YYYY-MM-DD : The start date for data fetching (default: yesterday)\n")
 print("  --end-date YYYY-MM-DD   : The end date for data fetching (default: yesterday)\n")
 print("  --table TABLE_NAME      : The specific table to fetch data for (defaults to all tables)\n")
+print("  --no-cache              : Don't use the local response cache for historical days\n")
+print("  --cache-dir DIR         : Directory of the local response cache (default: RESPONSE_CACHE_DIR in env.py)\n")
+print("  --archive-path PATH     : Archive the raw responses to PATH, local or gs:// (default: ARCHIVE_PATH in env.py)\n")
+print("  --replay                : Rebuild the tables from the archive instead of calling LinkedIn\n")
+print("  --verify                : Compare the range with LinkedIn's account totals and only ingest the days that don't match\n")
+print("  --evolve-schema         : Add the new metrics of metrics.py to the tables and backfill them (over --start-date to --end-date when given)\n")
+print("  --profile PATH          : Write a CPU and memory profile of the run to PATH, local or gs:// (default: PROFILE_PATH in env.py)\n")
 
 # If no argument was specified prompt the user
 if len(sys.argv) == 1:
@@ -139,6 +218,9 @@ if '--table' in sys.argv:
             print(f"Error: --table argument provided but table '{table_name}' is not valid.")
             print(f"Valid tables are: {', '.join(valid_table_names)}")
             sys.exit(1)
+        if STORAGE_LAYOUT == "wide":
+            print("Error: --table can't be used with STORAGE_LAYOUT wide, a day is refreshed for every table.")
+            sys.exit(1)
         # Filter TABLE_IDS to only include the specified table
         TABLE_IDS = [t for t in TABLE_IDS if list(t.keys())[0] == table_name]
     else:
@@ -146,6 +228,64 @@ if '--table' in sys.argv:
         sys.exit(1)
     print(f"--table found, using table: {table_name}")
 
+# Local response cache for days past LinkedIn's restatement window
+if '--cache-dir' in sys.argv:
+    cache_dir_index = sys.argv.index('--cache-dir') + 1
+    if cache_dir_index < len(sys.argv):
+        RESPONSE_CACHE_DIR = sys.argv[cache_dir_index]
+    else:
+        print("Error: --cache-dir argument provided but no directory found.")
+        sys.exit(1)
+
+# Raw response archive and replay
+if '--archive-path' in sys.argv:
+    archive_path_index = sys.argv.index('--archive-path') + 1
+    if archive_path_index < len(sys.argv):
+        ARCHIVE_PATH = sys.argv[archive_path_index]
+    else:
+        print("Error: --archive-path argument provided but no path found.")
+        sys.exit(1)
+
+REPLAY = '--replay' in sys.argv
+if REPLAY and not ARCHIVE_PATH:
+    print("Error: --replay needs an archive, use --archive-path or set ARCHIVE_PATH in env.py")
+    sys.exit(1)
+if ARCHIVE_PATH:
+    print(f"{'Replaying from' if REPLAY else 'Archiving raw responses to'} {ARCHIVE_PATH}")
+
+# Verify the range against LinkedIn's account totals and only ingest the days that don't match
+VERIFY = '--verify' in sys.argv
+if VERIFY and REPLAY:
+    print("Error: --verify and --replay can't be used together")
+    sys.exit(1)
+
+# Add the metrics added to metrics.py to the tables and backfill them (START_DATE to END_DATE when given, else each table's history)
+EVOLVE_SCHEMA = '--evolve-schema' in sys.argv
+if EVOLVE_SCHEMA and (REPLAY or VERIFY):
+    print("Error: --evolve-schema can't be used with --replay or --verify")
+    sys.exit(1)
+EVOLVE_RANGE_GIVEN = '--start-date' in sys.argv or '--end-date' in sys.argv
+
+# Profiling of the run
+if '--profile' in sys.argv:
+    profile_index = sys.argv.index('--profile') + 1
+    if profile_index < len(sys.argv):
+        PROFILE_PATH = sys.argv[profile_index]
+    else:
+        print("Error: --profile argument provided but no path found.")
+        sys.exit(1)
+if PROFILE_PATH:
+    print(f"Profiling the run to {PROFILE_PATH}")
+
+RESPONSE_CACHE = None
+if '--no-cache' not in sys.argv:
+    RESPONSE_CACHE = response_cache.ResponseCache(
+        RESPONSE_CACHE_DIR,
+        immutable_after_days=RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS,
+        max_bytes=RESPONSE_CACHE_MAX_MB * 1024 * 1024
+    )
+    print(f"Using response cache at {RESPONSE_CACHE_DIR} for days older than {RESPONSE_CACHE_IMMUTABLE_AFTER_DAYS} days")
+
 # ======================================================================
 # Secret Manager helpers
 # ======================================================================
@@ -265,6 +405,13 @@ def ensure_dataset_and_table():
                 print(f"Couldn't find table: {TABLE_ID}")
                 exit(1)
 
+    if STORAGE_LAYOUT == "wide":
+        try:
+            bq_client.get_table(bq_client.dataset(DATASET_ID).table(wide.WIDE_TABLE_ID))
+        except NotFound:
+            print(f"Couldn't find table: {wide.WIDE_TABLE_ID}, run the Cloud Function once with STORAGE_LAYOUT=wide to create it")
+            exit(1)
+
 # ======================================================================
 # LinkedIn data fetch
 # ======================================================================
@@ -309,68 +456,126 @@ def fetch_linkedin_analytics(date, metrics=[], pivots=[]):
     return r.json()
 
 # ======================================================================
-# Data flattening and insertion
+# Campaign and campaign group metadata
 # ======================================================================
-def flatten_linkedin_response(json_data, date):
-    rows = []
-    date = datetime.strptime(date, "%Y-%m-%d").date()
+# Campaign and campaign group lookups, kept for the whole run so every
+# campaign is only requested once instead of once per table and date
+METADATA_CACHE = {}
 
-    headers = {
+def linkedin_headers():
+    return {
         "Authorization": f"Bearer {ACCESS_TOKEN_SECRET}",
         "LinkedIn-Version": "202510",
         "Content-Type": "application/json",
         "X-Restli-Protocol-Version": "2.0.0"
     }
 
-    elements = json_data.get("elements", [])
-
-    for element in elements:
-        campaign_group_id = "N/A"
-        campaign_id = "N/A"
-        campaign_group_name = "N/A"
-        campaign_name = "N/A"
-        campaign_type = "N/A"
-        campaign_status = "N/A"
-
+def get_linkedin_entity(url):
+    if url not in METADATA_CACHE:
         try:
-            pivot_values = element.get("pivotValues", [])
-            for urn in pivot_values:
-                if "CampaignGroup" in urn:
-                    campaign_group_id = urn.split(":")[-1]
-                    url = f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaignGroups/{campaign_group_id}"
-                    resp = requests.get(url, headers=headers).json()
-                    campaign_group_name = resp.get("name", "N/A")
-                elif "Campaign" in urn:
-                    campaign_id = urn.split(":")[-1]
-                    url = f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaigns/{campaign_id}"
-                    resp = requests.get(url, headers=headers).json()
-                    campaign_name = resp.get("name", "N/A")
-                    campaign_type = resp.get("type", "N/A")
-                    campaign_status = resp.get("status", "N/A")
+            METADATA_CACHE[url] = concurrency.limited_get(LINKEDIN_LIMITER, url, linkedin_headers()).json()
         except Exception as e:
-            print(f"Error processing pivotValues: {e}")
+            print(f"Error fetching {url}: {e}")
+            return {}
+    return METADATA_CACHE[url]
+
+def list_linkedin_entities(path, account_id=None):
+    """Pages through the account's adCampaigns or adCampaignGroups listing, returns {id: response}."""
+    entities = {}
+    page_token = None
+    while True:
+        url = dimensions.listing_url(account_id or ACCOUNT_ID, path, page_token)
+        r = concurrency.limited_get(LINKEDIN_LIMITER, url, linkedin_headers())
+        r.raise_for_status()
+        response = r.json()
+        for entity in response.get("elements", []):
+            entities[str(entity["id"])] = entity
+        page_token = dimensions.next_page_token(response)
+        if not page_token or not response.get("elements"):
+            return entities
+
+# The account's campaigns when they were listed, {id: response}
+LISTED_CAMPAIGNS = None
+
+def load_campaign_listings():
+    """
+    Fills METADATA_CACHE from the listings of the account's campaign groups
+    and campaigns, so the lookups of get_campaign_metadata are cache hits.
+    """
+    global LISTED_CAMPAIGNS
+    for path in ("adCampaignGroups", "adCampaigns"):
+        entities = list_linkedin_entities(path)
+        for entity_id, entity in entities.items():
+            METADATA_CACHE[f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/{path}/{entity_id}"] = entity
+        if path == "adCampaigns":
+            LISTED_CAMPAIGNS = entities
+        print(f"Listed {len(entities)} {path} of account {ACCOUNT_ID}")
+
+# ======================================================================
+# Campaign activity index
+# ======================================================================
+ACTIVITY_INDEX = None
 
-        # remove pivotValues safely
-        element.pop("pivotValues", None)
+def build_activity_index(access_token):
+    """
+    Builds the account's activity index from the campaign listing and one
+    account totals request from START_DATE to END_DATE. A part that fails
+    is left out, it then skips nothing.
+    """
+    windows = probed_days = None
+    try:
+        campaigns = LISTED_CAMPAIGNS if LISTED_CAMPAIGNS is not None else list_linkedin_entities("adCampaigns")
+        windows = activity.campaign_windows(campaigns)
+    except Exception as e:
+        print(f"Campaign listing for the activity index failed: {e}")
+    try:
+        response = request_linkedin_analytics(access_token, START_DATE, activity.probe_fields(), ["ACCOUNT"], end_date=END_DATE)
+        probed_days = activity.active_days(response.get("elements", []))
+    except Exception as e:
+        print(f"Activity probe failed: {e}")
+    return activity.ActivityIndex(windows, probed_days)
 
-        # build the row
-        row = {
-            "date": date.strftime("%Y-%m-%d"),
-            "account_name": ACCOUNT_NAME,
-            "account_id": ACCOUNT_ID,
-            "campaign_group_name": campaign_group_name,
-            "campaign_group_id": campaign_group_id,
-            "campaign_name": campaign_name,
-            "campaign_id": campaign_id,
-            "campaign_type": campaign_type,
-            "campaign_status": campaign_status,
-        }
+def live_campaign_ids(date):
+    return ACTIVITY_INDEX.live_campaigns(date) if ACTIVITY_INDEX else None
 
-        # merge the remaining metrics
-        row.update(element)
-        rows.append(row)
+def get_campaign_metadata(elements):
+    campaign_group_ids, campaign_ids = transforms.referenced_ids(elements)
+    urls = {
+        ("campaign_group", campaign_group_id): f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaignGroups/{campaign_group_id}"
+        for campaign_group_id in campaign_group_ids
+    }
+    urls.update({
+        ("campaign", campaign_id): f"https://api.linkedin.com/rest/adAccounts/{ACCOUNT_ID}/adCampaigns/{campaign_id}"
+        for campaign_id in campaign_ids
+    })
+    if not urls:
+        return {}, {}
+
+    # The pool is sized for the highest limit, LINKEDIN_LIMITER decides how many requests are in flight
+    with ThreadPoolExecutor(max_workers=min(len(urls), LINKEDIN_MAX_CONCURRENCY)) as pool:
+        responses = dict(zip(urls, pool.map(get_linkedin_entity, urls.values())))
+    campaign_groups = {i: r for (kind, i), r in responses.items() if kind == "campaign_group"}
+    campaigns = {i: r for (kind, i), r in responses.items() if kind == "campaign"}
+    return campaign_groups, campaigns
 
-    return rows
+# ======================================================================
+# Data flattening and insertion
+# ======================================================================
+def flatten_linkedin_response(json_data, date):
+    elements = json_data.get("elements", [])
+    campaign_groups, campaigns = get_campaign_metadata(elements)
+    return transforms.build_rows(elements, date, ACCOUNT_ID, ACCOUNT_NAME, campaign_groups, campaigns)
+
+# ======================================================================
+# Schema typed coercion and quarantine
+# ======================================================================
+# Schemas and coercers are compiled once per table for the whole run
+TABLE_COERCERS = coercion.TableCoercers(lambda table_id: bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{table_id}"))
+
+def coerce_rows_for_table(rows, table_id):
+    # Cast the rows to the table schema, rows that can't be cast are quarantined instead of failing the load job.
+    # Raises coercion.QuarantineError when every row was quarantined, the callers then leave the rows as they are
+    return coercion.coerce_rows_for_table(rows, table_id, TABLE_COERCERS, QUARANTINE_PATH)
 
 # ======================================================================
 # Insert rows into BigQuery
@@ -379,8 +584,22 @@ def insert_rows_into_bq(rows, table_id):
     if not rows:
         print("No rows to insert.")
         return 0
+    rows = coerce_rows_for_table(rows, table_id)
+    return load_rows_into_bq(rows, table_id)
+
+# Statistics of the run's BigQuery jobs (see job_costs.py)
+JOB_LEDGER = job_costs.JobCostLedger()
+
+def load_rows_into_bq(rows, table_id, job_ids=None):
     table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
-    job = bq_client.load_table_from_json(rows, table_ref)
+    schema, _ = TABLE_COERCERS.get(table_id)
+    job_config = bigquery.LoadJobConfig(
+        schema=schema,
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+    )
+    job = bq_client.load_table_from_json(rows, table_ref, job_config=job_config)
+    if job_ids is not None:
+        job_ids.append(job.job_id)
     try:
         job.result()  # Wait for the job to complete
     except Exception as e:
@@ -391,6 +610,7 @@ def insert_rows_into_bq(rows, table_id):
         else:
             raise RuntimeError(f"BigQuery load job failed: {e}")
     print(f"Inserted {job.output_rows} rows into {table_ref}")
+    JOB_LEDGER.record(job, table_id, "load")
     return job.output_rows
 
 # ======================================================================
@@ -411,6 +631,24 @@ def delete_records_in_date_range(start_date, end_date, table_id):
     query_job = bq_client.query(query, job_config=job_config)
     query_job.result()  # Wait for job to complete
     print(f"Deleted records from {start_date} to {end_date} in {table_ref}")
+    JOB_LEDGER.record(query_job, table_id, "delete")
+    return query_job.num_dml_affected_rows
+
+def delete_records_for_dates(dates, table_id):
+    table_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}"
+    query = f"""
+        DELETE FROM `{table_ref}`
+        WHERE date IN UNNEST(@dates)
+    """
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("dates", "DATE", dates),
+        ]
+    )
+    query_job = bq_client.query(query, job_config=job_config)
+    query_job.result()  # Wait for job to complete
+    print(f"Deleted records for {len(dates)} dates in {table_ref}")
+    JOB_LEDGER.record(query_job, table_id, "delete")
     return query_job.num_dml_affected_rows
 
 # ======================================================================
@@ -451,6 +689,8 @@ def jc_linkedin_to_bq(request):
                 f"Dataset: {DATASET_ID}\n"
             )
         )
+        if RESPONSE_CACHE:
+            print(f"Response cache: {RESPONSE_CACHE.hits} hits, {RESPONSE_CACHE.misses} misses")
         return (f"Inserted {n_rows} rows.", 200)
     except Exception as e:
         send_email(
@@ -468,13 +708,20 @@ def jc_linkedin_to_bq(request):
 # ======================================================================
 # LinkedIn API call for specific date
 # ======================================================================
-def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
-    print(f"Fetching LinkedIn analytics for {date} with metrics: {metrics} and pivots: {pivots}")
+def request_linkedin_analytics(access_token, date, fields, pivots=[], end_date=None, campaign_ids=None, complete=True,
+                               account_id=None):
+    """
+    Requests the fields for the date (to end_date when given) and returns
+    LinkedIn's response as is (or from the response cache), except for its
+    elements which are completed by split queries when they hit LinkedIn's
+    cap (unless `complete` is False, see splitting.py). `campaign_ids`
+    restricts it to these campaigns of the account (ACCOUNT_ID unless
+    `account_id` is given).
+    """
+    requested_date, requested_end_date = date, end_date
     date = datetime.strptime(date, "%Y-%m-%d").date()
     start_date = date
-    end_date = date
-
-    impressionsRequested = "impressions" in metrics
+    end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date
 
     headers = {
         "Authorization": f"Bearer {access_token}",
@@ -485,11 +732,6 @@ def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
 
     q = "statistics"
     qPivots = ""
-    # Ensure pivotValues is always requested
-    metrics.insert(0, "pivotValues")
-    # Ensure impressions are always requested, this is needed for LinkedIn to always return other metrics
-    # Not documented by LinkedIn but observed behavior.
-    metrics.insert(1, "impressions")
     if len(pivots) == 0:
         qPivots = "&pivots=List(CAMPAIGN,CAMPAIGN_GROUP)"
     else:
@@ -504,25 +746,54 @@ def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
         "https://api.linkedin.com/rest/adAnalytics"
         f"?q={q}"
         "&timeGranularity=DAILY"
-        f"&accounts=List(urn%3Ali%3AsponsoredAccount%3A{ACCOUNT_ID})"
+        f"&accounts=List(urn%3Ali%3AsponsoredAccount%3A{account_id or ACCOUNT_ID})"
+        f"{activity.campaigns_facet(campaign_ids)}"
         f"&dateRange=(start:(day:{start_date.day},month:{start_date.month},year:{start_date.year}),end:(day:{end_date.day},month:{end_date.month},year:{end_date.year}))"
         f"{qPivots}"
         "&fields="
-        f"{','.join(metrics)}"
+        f"{','.join(fields)}"
     )
 
-    r = requests.get(url, headers=headers)
-    r.raise_for_status()
-    retval = r.json()
-    if not impressionsRequested:
-        metrics.remove("impressions")
-        # Removing impressions from response as it was not requested
-        for element in retval.get("elements", []):
-            element.pop("impressions", None)
-    for element in retval.get("elements", []):
-        for metric in metrics:
-            if metric not in element:
-                element[metric] = 0
+    retval = RESPONSE_CACHE.get(url, headers, end_date) if RESPONSE_CACHE else None
+    if retval is None:
+        r = concurrency.limited_get(LINKEDIN_LIMITER, url, headers)
+        r.raise_for_status()
+        if RESPONSE_CACHE:
+            RESPONSE_CACHE.put(url, headers, end_date, r.content)
+        retval = r.json()
+    else:
+        print(f"Using cached response for {date}")
+    if complete and splitting.is_capped(retval.get("elements", [])):
+        retval["elements"] = complete_linkedin_analytics(
+            access_token, requested_date, fields, pivots, requested_end_date, campaign_ids, retval["elements"], account_id
+        )
+    return retval
+
+def complete_linkedin_analytics(access_token, date, fields, pivots, end_date=None, campaign_ids=None, elements=None,
+                                account_id=None):
+    """Returns every element of a query whose response hit LinkedIn's element cap (see splitting.py)."""
+    def fetch(start_date, end_date, campaign_ids):
+        return request_linkedin_analytics(
+            access_token, start_date, fields, pivots, end_date=end_date, campaign_ids=campaign_ids, complete=False,
+            account_id=account_id
+        ).get("elements", [])
+
+    def list_campaigns():
+        if LISTED_CAMPAIGNS is not None and (account_id or ACCOUNT_ID) == ACCOUNT_ID:
+            return list(LISTED_CAMPAIGNS)
+        return list(list_linkedin_entities("adCampaigns", account_id))
+
+    # The pool is sized for the highest limit, LINKEDIN_LIMITER decides how many requests are in flight
+    with ThreadPoolExecutor(max_workers=LINKEDIN_MAX_CONCURRENCY) as pool:
+        return splitting.fetch_complete(
+            fetch, date, end_date or date, campaign_ids, list_campaigns, pivots or PIVOTS,
+            elements=elements, max_facet=activity.MAX_FACET_CAMPAIGNS, map_func=pool.map
+        )
+
+def get_linkedin_analytics_for_date(access_token, date, metrics=[], pivots=[]):
+    print(f"Fetching LinkedIn analytics for {date} with metrics: {metrics} and pivots: {pivots}")
+    retval = request_linkedin_analytics(access_token, date, transforms.analytics_fields(metrics), pivots)
+    transforms.normalize_elements(retval.get("elements", []), metrics)
     return retval
 
 # ======================================================================
@@ -540,20 +811,265 @@ def print_linkedin_response(json_data):
 # ======================================================================
 # Get LinkedIn metrics for a date
 # ======================================================================
-def get_linkedin_metrics(access_token, date, metrics=[], pivots=[]):
-    r = get_linkedin_analytics_for_date(
-            access_token,
-            date,
-            metrics,
-            pivots
+def get_linkedin_metrics(access_token, date, metrics=[], pivots=[], table_id=None):
+    print(f"Fetching LinkedIn analytics for {date} with metrics: {metrics} and pivots: {pivots}")
+    response = request_linkedin_analytics(access_token, date, transforms.analytics_fields(metrics), pivots)
+    return enrich_linkedin_elements(response.get("elements", []), date, metrics, table_id)
+
+def enrich_linkedin_elements(elements, date, metrics, table_id=None):
+    fields = transforms.analytics_fields(metrics)
+    # With FACT_ROWS "ids" the names are in the campaign dimension table
+    campaign_groups, campaigns = get_campaign_metadata(elements) if FACT_ROWS == "full" else ({}, {})
+    # Archive the raw responses so the table can be rebuilt with --replay
+    if ARCHIVE_PATH and table_id:
+        archive.write_unit(
+            ARCHIVE_PATH, ACCOUNT_ID, date, table_id, elements, fields,
+            {"name": ACCOUNT_NAME}, campaign_groups, campaigns
         )
-    rows = flatten_linkedin_response(r, date)
-    return rows
+    transforms.normalize_elements(elements, metrics)
+    return transforms.build_rows(
+        elements, date, ACCOUNT_ID, ACCOUNT_NAME, campaign_groups, campaigns, names=FACT_ROWS == "full"
+    )
+
+# ======================================================================
+# Get LinkedIn metrics for a date from the raw response archive
+# ======================================================================
+def get_archived_metrics(date, table_id, metrics):
+    """Returns the rows rebuilt from the archive, or None when the date was not archived."""
+    if table_id == wide.WIDE_TABLE_ID:
+        archived_rows = [
+            get_archived_metrics(date, TABLE_ID, table_config.get("metrics", []))
+            for table_info in TABLE_IDS
+            for TABLE_ID, table_config in table_info.items()
+        ]
+        if all(rows is None for rows in archived_rows):
+            return None
+        return wide.merge_rows(rows for rows in archived_rows if rows is not None)
+    archived = archive.read_unit(ARCHIVE_PATH, ACCOUNT_ID, date, table_id)
+    if archived is None:
+        return None
+    # Metrics added after the day was archived were never requested, leave them out (NULL)
+    requested = [m for m in metrics if m in archived["fields"]]
+    if len(requested) < len(metrics):
+        print(f"Metrics not in the archive for {date}: {[m for m in metrics if m not in requested]}")
+    transforms.normalize_elements(archived["elements"], requested)
+    return transforms.build_rows(
+        archived["elements"],
+        date,
+        ACCOUNT_ID,
+        archived["account"].get("name", ACCOUNT_NAME),
+        archived["campaign_groups"],
+        archived["campaigns"],
+        names=FACT_ROWS == "full"
+    )
+
+# ======================================================================
+# Schema evolution: add the new metric columns and backfill only them
+# ======================================================================
+def backfill_metrics(access_token, table_id, metric_names, start_date, end_date, account_id):
+    """
+    Requests only the metrics of the account over the range, a month per
+    request, loads them into a staging table and merges them into the
+    table's existing rows (see schema_evolution.py). Returns the number of
+    rows staged.
+    """
+    staging_ref = f"{PROJECT_ID}.{DATASET_ID}.{table_id}__evolve_{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+    schema = [bigquery.SchemaField(name, column_type) for name, column_type in schema_evolution.staging_columns(metric_names)]
+    staging_table = bigquery.Table(staging_ref, schema=schema)
+    staging_table.expires = datetime.now(timezone.utc) + timedelta(days=1)
+    bq_client.create_table(staging_table, exists_ok=True)
+    coerce = coercion.compile_coercer(schema)
+    staged = 0
+    try:
+        for first, last in schema_evolution.date_chunks(start_date, end_date):
+            print(f"Backfilling {', '.join(metric_names)} of {table_id} for account {account_id} from {first} to {last}")
+            response = request_linkedin_analytics(
+                access_token, first, transforms.analytics_fields(metric_names), PIVOTS, end_date=last,
+                account_id=account_id
+            )
+            rows, quarantined = coercion.coerce_rows(
+                schema_evolution.backfill_rows(response.get("elements", []), account_id, metric_names), coerce
+            )
+            if quarantined:
+                coercion.quarantine_rows(quarantined, table_id, QUARANTINE_PATH)
+            if not rows:
+                continue
+            job_config = bigquery.LoadJobConfig(schema=schema, source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON)
+            bq_client.load_table_from_json(rows, staging_ref, job_config=job_config).result()
+            staged += len(rows)
+        if staged:
+            query_job = bq_client.query(
+                schema_evolution.merge_statement(PROJECT_ID, DATASET_ID, table_id, staging_ref, metric_names)
+            )
+            query_job.result()
+            JOB_LEDGER.record(query_job, table_id, "merge")
+    finally:
+        bq_client.delete_table(staging_ref, not_found_ok=True)
+    return staged
+
+def evolve_schema(access_token):
+    """
+    Adds the metrics of metrics.py that the live tables don't have yet
+    and backfills them over START_DATE to END_DATE, or over the table's
+    whole history when no date was given. Returns the email logs.
+    """
+    logs = []
+    if STORAGE_LAYOUT == "wide":
+        targets = [(wide.WIDE_TABLE_ID, wide.wide_metrics())]
+    else:
+        targets = [(table_id, config.get("metrics", [])) for info in TABLE_IDS for table_id, config in info.items()]
+
+    evolved_tables = []
+    for table_id, metric_names in targets:
+        table = bq_client.get_table(f"{PROJECT_ID}.{DATASET_ID}.{table_id}")
+        missing = schema_evolution.missing_columns(metric_names, [field.name for field in table.schema])
+        if not missing:
+            print(f"{table_id} has every metric of metrics.py")
+            continue
+        bq_client.query(schema_evolution.alter_statement(PROJECT_ID, DATASET_ID, table_id, missing)).result()
+        # The cached schema and coercer don't have the new columns
+        TABLE_COERCERS.forget(table_id)
+        logs.append("=" * 50)
+        logs.append(f"Added {', '.join(missing)} to {table_id}")
+
+        # Every account of the table, each over its own history unless a range was given
+        accounts = list(bq_client.query(schema_evolution.date_range_query(PROJECT_ID, DATASET_ID, table_id)).result())
+        if not accounts:
+            logs.append(f"{table_id} has no rows, nothing to backfill")
+        skipped = []
+        for account in accounts:
+            account_id = account["account_id"]
+            start_date, end_date = (START_DATE, END_DATE) if EVOLVE_RANGE_GIVEN else (account["first_date"], account["last_date"])
+            try:
+                staged = backfill_metrics(access_token, table_id, missing, start_date, end_date, account_id)
+            except Exception as e:
+                # The token may not have access to every account that was ever loaded
+                print(f"Could not backfill {table_id} for account {account_id}: {e}")
+                skipped.append(account_id)
+                continue
+            logs.append(f"Backfilled {staged} rows of {table_id} for account {account_id} from {start_date} to {end_date}")
+        if skipped:
+            logs.append(
+                f"SKIPPED accounts of {table_id}, {', '.join(missing)} stay NULL for them: {', '.join(skipped)}"
+            )
+        evolved_tables.append(table_id)
+
+    if STORAGE_LAYOUT == "wide":
+        # A metric moved to another table only changes the views
+        bq_client.query("\n".join(
+            wide.view_statement(PROJECT_ID, DATASET_ID, table_id)
+            for info in metrics.BIGQUERY_TABLES for table_id in info
+        )).result()
+        logs.append("Recreated the table views of the wide table")
+        if evolved_tables:
+            evolved_tables = [table_id for info in metrics.BIGQUERY_TABLES for table_id in info]
+
+    if ROLLUPS_ENABLED and evolved_tables:
+        # INSERT ... SELECT into the rollups relies on their columns, rebuild them with the new ones
+        bq_client.query("\n".join(
+            rollups.rebuild_statement(PROJECT_ID, DATASET_ID, table_id, period)
+            for table_id in evolved_tables
+            for period in metrics.ROLLUP_PERIODS
+        )).result()
+        logs.append(f"Rebuilt the rollups of {', '.join(evolved_tables)}")
+    if not evolved_tables:
+        logs.append("Every table has every metric of metrics.py, nothing to do")
+    return logs
+
+# ======================================================================
+# Rebuild a table from the raw response archive for START_DATE to END_DATE
+# ======================================================================
+def replay_table(table_id, metrics):
+    """
+    Reads every archived date of the range and replaces those dates with one
+    delete and one load job. Dates that were never archived are left untouched.
+    """
+    rows = []
+    dates = []
+    missing = []
+    for date_to_process in pd.date_range(START_DATE, END_DATE):
+        date_str = date_to_process.strftime("%Y-%m-%d")
+        date_rows = get_archived_metrics(date_str, table_id, metrics)
+        if date_rows is None:
+            missing.append(date_str)
+            continue
+        rows += date_rows
+        dates.append(date_str)
+    if missing:
+        print(f"Not in the archive (left untouched): {', '.join(missing)}")
+    if not dates:
+        return 0, dates, missing
+    # Cast before deleting, nothing is deleted when every row is quarantined
+    rows = coerce_rows_for_table(rows, table_id) if rows else []
+    delete_records_for_dates(dates, table_id)
+    return (load_rows_into_bq(rows, table_id) if rows else 0), dates, missing
+
+# ======================================================================
+# Verify START_DATE to END_DATE against LinkedIn's account totals
+# ======================================================================
+def get_verification_dates(access_token):
+    """
+    Compares the daily account totals of the key metrics (one LinkedIn
+    request for the range, see verify.py) with one SUM query per table.
+    Returns ({table_id: [dates that don't match]}, log lines).
+    """
+    table_ids = [list(t.keys())[0] for t in TABLE_IDS]
+    metric_names = verify.all_verify_metrics(table_ids)
+    fields = ["dateRange"] + transforms.analytics_fields(metric_names)
+    response = request_linkedin_analytics(access_token, START_DATE, fields, ["ACCOUNT"], end_date=END_DATE)
+    linkedin_totals = verify.linkedin_daily_totals(response.get("elements", []), metric_names)
+
+    dates_by_table = {}
+    logs = ["=" * 50]
+    for table_id in table_ids:
+        job_config = bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter("account_id", "STRING", ACCOUNT_ID),
+            bigquery.ScalarQueryParameter("start_date", "DATE", START_DATE),
+            bigquery.ScalarQueryParameter("end_date", "DATE", END_DATE),
+        ])
+        query = verify.totals_query(PROJECT_ID, DATASET_ID, table_id, verify.verify_metrics(table_id))
+        query_job = bq_client.query(query, job_config=job_config)
+        table_totals = {row["date"]: dict(row.items()) for row in query_job.result()}
+        JOB_LEDGER.record(query_job, table_id, "verify")
+        mismatches = verify.find_mismatches(linkedin_totals, table_totals, table_id, START_DATE, END_DATE)
+        if not mismatches:
+            continue
+        dates_by_table[table_id] = sorted({day for day, _, _, _ in mismatches})
+        logs.append(f"Totals of {table_id} don't match LinkedIn on {len(dates_by_table[table_id])} days:")
+        logs += [f"  {day} {metric}: LinkedIn {expected:g}, BigQuery {actual:g}" for day, metric, expected, actual in mismatches]
+    if not dates_by_table:
+        logs.append(f"Every table matches LinkedIn's account totals from {START_DATE} to {END_DATE}")
+    if STORAGE_LAYOUT == "wide":
+        dates_by_table = {wide.WIDE_TABLE_ID: sorted({d for dates in dates_by_table.values() for d in dates})}
+    print("\n".join(logs))
+    return dates_by_table, logs
+
+# ======================================================================
+# Run history and regression flags
+# ======================================================================
+def write_run_history(recorder, status, n_rows=0, error=None):
+    """Writes the run's manifest to RUN_HISTORY_PATH and returns its regression flags, never raises."""
+    stats = LINKEDIN_LIMITER.stats()
+    run = recorder.run_row(
+        status,
+        units=len(recorder.units),
+        rows=n_rows,
+        api_calls=stats["requests"],
+        retries=stats["throttled"],
+        error=error,
+        job_costs=JOB_LEDGER
+    )
+    return run_history.write_history(
+        run_history.SqliteHistory(RUN_HISTORY_PATH), recorder, run, RUN_HISTORY_BASELINE_RUNS, factor=RUN_REGRESSION_FACTOR
+    )
 
 # ======================================================================
 # Cloud Function entrypoint for local execution
 # ======================================================================
+@profiling.profiled("local_linkedin_to_bq", PROFILE_PATH, PROFILE_TOP_N)
 def local_linkedin_to_bq(request):
+    recorder = run_history.RunRecorder("replay" if REPLAY else "verify" if VERIFY else "ingest") if RUN_HISTORY_PATH else None
+    n_rows = 0
     try:
         # Ensure BigQuery dataset and table exist
         ensure_dataset_and_table()
@@ -562,8 +1078,8 @@ def local_linkedin_to_bq(request):
         # token = get_valid_access_token()
         valid_access_token = ACCESS_TOKEN_SECRET
 
-        global ACCOUNT_NAME
-        ACCOUNT_NAME = getAccountName(ACCOUNT_ID, valid_access_token)
+        global ACCOUNT_NAME, ACTIVITY_INDEX
+        ACCOUNT_NAME = "N/A" if REPLAY else getAccountName(ACCOUNT_ID, valid_access_token)
         print(f"Using LinkedIn Account Name: {ACCOUNT_NAME}")
 
         # Delete existing records for that date to avoid duplicates
@@ -572,44 +1088,225 @@ def local_linkedin_to_bq(request):
 
         emailLogs = []
 
+        if EVOLVE_SCHEMA:
+            emailLogs += evolve_schema(valid_access_token)
+            emailLogs += JOB_LEDGER.describe()
+            print("\n".join(emailLogs))
+            send_email(
+                EMAIL_RECIPIENT,
+                "LinkedIn Schema Evolution",
+                (
+                    f"Account Name: {ACCOUNT_NAME}\n"
+                    f"Dataset: {DATASET_ID}\n"
+                    f"{chr(10).join(emailLogs)}\n"
+                )
+            )
+            return ("Schema evolution done.", 200)
+
+        if CAMPAIGN_DIMENSION_ENABLED and FACT_ROWS == "full" and not REPLAY:
+            try:
+                load_campaign_listings()
+            except Exception as e:
+                # The campaigns are looked up one by one instead
+                print(f"Campaign listings failed: {e}")
+                emailLogs.append(f"Campaign listings failed: {e}")
+
+        all_dates = [d.strftime("%Y-%m-%d") for d in pd.date_range(START_DATE, END_DATE)]
+        # The dates to pull, the others are only emptied
+        active_dates = all_dates
+        skipped_dates = []
+        # The skipped dates the probe confirmed, only their rows are deleted
+        confirmed_dates = []
+        if ACTIVITY_INDEX_ENABLED and not REPLAY and not VERIFY:
+            ACTIVITY_INDEX = build_activity_index(valid_access_token)
+            active_dates = [d for d in all_dates if ACTIVITY_INDEX.is_active(d)]
+            skipped_dates = [d for d in all_dates if d not in active_dates]
+            confirmed_dates = [d for d in skipped_dates if ACTIVITY_INDEX.confirmed_inactive(d)]
+            if skipped_dates:
+                emailLogs.append("=" * 50)
+                emailLogs.append(f"Skipped {len(skipped_dates)} dates without delivery: {', '.join(skipped_dates)}")
+                print(emailLogs[-1])
+        if VERIFY:
+            verify_dates, verify_logs = get_verification_dates(valid_access_token)
+            emailLogs += verify_logs
+
         # Set the number of tables to process
-        nTables = len(TABLE_IDS)
+        tables = TABLE_IDS if STORAGE_LAYOUT == "tables" else [{wide.WIDE_TABLE_ID: {"metrics": wide.wide_metrics()}}]
+        nTables = len(tables)
         print(f"Number of tables to process: {nTables}")
         nTableProcessing = 0
+        load_lock = threading.Lock()
+
+        def tasks():
+            nonlocal nTableProcessing, n_rows
+            for table_info in tables:
+                for TABLE_ID, table_config in table_info.items():
+                    nTableProcessing += 1
+                    print("="*40)
+                    print(f"Processing table: {nTableProcessing} of {nTables} - {TABLE_ID}")
+
+                    if REPLAY:
+                        try:
+                            inserted_rows, dates, missing = replay_table(TABLE_ID, table_config.get("metrics", []))
+                        except coercion.QuarantineError as e:
+                            emailLogs.append("=" * 50)
+                            emailLogs.append(f"Skipped {TABLE_ID}, existing rows left as they are: {e}")
+                            continue
+                        n_rows += inserted_rows
+                        emailLogs.append("=" * 50)
+                        emailLogs.append(f"Replayed {inserted_rows} rows into table ({TABLE_ID}) of BigQuery dataset {DATASET_ID} from {len(dates)} archived dates")
+                        if missing:
+                            emailLogs.append(f"Not in the archive (left untouched): {', '.join(missing)}")
+                        continue
+
+                    # Each date is deleted by its load, once its rows are cast, the dates without delivery here
+                    if VERIFY:
+                        dates_to_process = verify_dates.get(TABLE_ID, [])
+                        if not dates_to_process:
+                            print(f"{TABLE_ID} matches LinkedIn's totals, skipped")
+                            continue
+                    else:
+                        dates_to_process = active_dates
+                        if confirmed_dates:
+                            delete_records_for_dates(confirmed_dates, TABLE_ID)
+
+                    # The dates of this table are fetched while the previous table is still loading
+                    for date_str in dates_to_process:
+                        yield {
+                            "table_id": TABLE_ID,
+                            "metrics": table_config.get("metrics", []),
+                            "date": date_str,
+                            "stage_seconds": {},
+                            "job_ids": [],
+                        }
+
+        def timed(stage, func):
+            def run(task):
+                stage_started_at = time.monotonic()
+                task = func(task)
+                task["stage_seconds"][stage] = time.monotonic() - stage_started_at
+                return task
+            return run
+
+        def fetch(task):
+            # Still one request per table for the wide table, LinkedIn caps the fields per request
+            table_metrics = (
+                [(table_id, config.get("metrics", [])) for info in TABLE_IDS for table_id, config in info.items()]
+                if task["table_id"] == wide.WIDE_TABLE_ID else [(task["table_id"], task["metrics"])]
+            )
+            print(f"Fetching LinkedIn analytics for {task['date']} of {task['table_id']}")
+            task["fetched"] = [
+                (table_id, metrics, request_linkedin_analytics(
+                    valid_access_token, task["date"], transforms.analytics_fields(metrics), PIVOTS,
+                    campaign_ids=live_campaign_ids(task["date"])
+                ).get("elements", []))
+                for table_id, metrics in table_metrics
+            ]
+            return task
+
+        def enrich(task):
+            table_rows = [
+                enrich_linkedin_elements(elements, task["date"], metrics, table_id)
+                for table_id, metrics, elements in task.pop("fetched")
+            ]
+            task["rows"] = wide.merge_rows(table_rows) if len(table_rows) > 1 else table_rows[0]
+            return task
+
+        def coerce(task):
+            rows = task.pop("rows")
+            try:
+                task["rows"] = coerce_rows_for_table(rows, task["table_id"]) if rows else []
+            except coercion.QuarantineError as e:
+                # Only this date is skipped, it is neither deleted nor loaded
+                task["rows"] = []
+                task["skipped"] = str(e)
+            task["quarantined_rows"] = len(rows) - len(task["rows"])
+            return task
+
+        def load(task):
+            if task.get("skipped"):
+                task["inserted_rows"] = 0
+                return task
+            # Delete existing records for that date to avoid duplicates
+            delete_records_for_dates([task["date"]], task["table_id"])
+            task["inserted_rows"] = load_rows_into_bq(task["rows"], task["table_id"], job_ids=task["job_ids"]) if task["rows"] else 0
+            return task
+
+        def record(task):
+            nonlocal n_rows
+            inserted_rows = task["inserted_rows"]
+            if recorder:
+                unit = {"account_id": ACCOUNT_ID, "table_id": task["table_id"], "date": task["date"]}
+                recorder.add_unit(unit, task["stage_seconds"], inserted_rows, task["quarantined_rows"], task["job_ids"])
+            # Loads are serialized unless PIPELINE_LOAD_WORKERS > 1, hence the lock
+            with load_lock:
+                n_rows += inserted_rows
+            emailLogs.append("=" * 50)
+            emailLogs.append(f"Inserted {inserted_rows} rows into table ({task['table_id']}) of BigQuery dataset {DATASET_ID} for date {task['date']}")
+            if task.get("skipped"):
+                emailLogs.append(f"Skipped, existing rows left as they are: {task['skipped']}")
+
+        timed_load = timed("load", load)
+        stages = pipeline.Pipeline(
+            [
+                pipeline.Stage("fetch", timed("fetch", fetch), PIPELINE_FETCH_WORKERS),
+                pipeline.Stage("enrich", timed("enrich", enrich), PIPELINE_FETCH_WORKERS),
+                pipeline.Stage("coerce", timed("coerce", coerce)),
+                pipeline.Stage("load", lambda task: record(timed_load(task)), PIPELINE_LOAD_WORKERS),
+            ],
+            queue_size=PIPELINE_QUEUE_SIZE
+        )
+        try:
+            stages.run(tasks())
+        finally:
+            if recorder:
+                recorder.add_stage_seconds({stage.name: stage.busy_seconds for stage in stages.stages})
+        if not REPLAY:
+            print(stages.describe())
+            emailLogs.append(stages.describe())
+
+        if ROLLUPS_ENABLED:
+            processed_units = [
+                {"account_id": ACCOUNT_ID, "table_id": list(t.keys())[0], "date": d}
+                for t in TABLE_IDS
+                for d in (
+                    verify_dates.get(wide.WIDE_TABLE_ID if STORAGE_LAYOUT == "wide" else list(t.keys())[0], [])
+                    if VERIFY else all_dates
+                )
+            ]
+            try:
+                rollups.update_rollups(bq_client, PROJECT_ID, DATASET_ID, processed_units, ROLLUP_TABLES_READY, JOB_LEDGER)
+            except Exception as e:
+                print(f"Rollup update failed: {e}")
+                emailLogs.append(f"Rollup update failed: {e}")
+
+        print(LINKEDIN_LIMITER.describe())
+        emailLogs.append(LINKEDIN_LIMITER.describe())
+        print("\n".join(JOB_LEDGER.describe()))
+        emailLogs += JOB_LEDGER.describe()
 
-        for table_info in TABLE_IDS:
-            for TABLE_ID, table_config in table_info.items():
-                nTableProcessing += 1
-                print("="*40)
-                print(f"Processing table: {nTableProcessing} of {nTables} - {TABLE_ID}")
-                # Delete existing records for that date to avoid duplicates
-                delete_records_in_date_range(START_DATE, END_DATE, TABLE_ID)
-
-                n_rows = 0
-                metrics = table_config.get("metrics", [])
-                for date_to_process in pd.date_range(START_DATE, END_DATE):
-                    # Fetch LinkedIn analytics for yesterday
-                    date_str = date_to_process.strftime("%Y-%m-%d")
-                    rows = get_linkedin_metrics(valid_access_token, date_str, metrics=metrics, pivots=PIVOTS)
-                    inserted_rows = insert_rows_into_bq(rows, TABLE_ID)
-
-                    n_rows += inserted_rows
-                    emailLogs.append("=" * 50)
-                    emailLogs.append(f"Inserted {inserted_rows} rows into table ({TABLE_ID}) of BigQuery dataset {DATASET_ID} for date {date_str}")
+        if recorder:
+            flags = write_run_history(recorder, "ok", n_rows)
+            emailLogs = [f"REGRESSION: {flag}" for flag in flags] + emailLogs
+            emailLogs.append(f"Run id: {recorder.run_id}")
 
         send_email(
             EMAIL_RECIPIENT, 
             "LinkedIn Data Ingestion", 
             (
-                "Manual run\n"
+                f"Manual run{' (replayed from ' + ARCHIVE_PATH + ')' if REPLAY else ''}{' (verified against LinkedIn totals)' if VERIFY else ''}\n"
                 f"Dates processed: {START_DATE} to {END_DATE}\n"
                 f"Account Name: {ACCOUNT_NAME}\n"
                 f"Dataset: {DATASET_ID}\n"
                 f"{chr(10).join(emailLogs)}\n"
             )
         )
+        if RESPONSE_CACHE:
+            print(f"Response cache: {RESPONSE_CACHE.hits} hits, {RESPONSE_CACHE.misses} misses")
         return (f"Inserted {n_rows} rows.", 200)
     except Exception as e:
+        if recorder:
+            write_run_history(recorder, "error", n_rows, error=e)
         send_email(
             EMAIL_RECIPIENT, 
             "LinkedIn Data Ingestion Error", 
@@ -618,6 +1315,7 @@ def local_linkedin_to_bq(request):
                 f"Dates processed: {START_DATE} to {END_DATE}\n"
                 f"Account Name: {ACCOUNT_NAME}\n"
                 f"Dataset: {DATASET_ID}\n"
+                f"{chr(10).join(JOB_LEDGER.describe())}\n"
             )
         )
         return (f"Error: {e}", 500)
@@ -17,6 +17,7 @@ PIVOTS = ['CAMPAIGN', 'CAMPAIGN_GROUP']
 ###########################################################################################################################################################
 
 # You will have to add the desired metric columns to the previous schema for each data table as per the metrics listed below
+# Metrics added to a table later are added to the live table and backfilled by: python main_local.py --evolve-schema
 
 # Here are added the table names and the metrics to be pulled for each one, this metrics must match both LinkedIn API and the table schema created in BigQuery
 BIGQUERY_TABLES = [
@@ -198,3 +199,121 @@ BIGQUERY_TABLES = [
         }
     }
 ]
+
+###########################################################################################################################################################
+# Intraday table                                                                                                                                          #
+# Filled by the "intraday" mode, which pulls today's metrics repeatedly and only writes the campaigns whose metrics changed since the previous pull.    #
+# It must have the basic schema above plus:                                                                                                              #
+#  - pulled_at (TIMESTAMP)                                                                                                                                #
+# and the metric columns listed below. Its rows for a date are removed once the normal daily load has processed that date.                              #
+###########################################################################################################################################################
+INTRADAY_TABLE = {
+    'ad_analytics_intraday': {
+        'metrics': [
+            'costInUsd',
+            'impressions',
+            'clicks',
+            'oneClickLeads',
+            'externalWebsiteConversions',
+            'totalEngagements'
+        ]
+    }
+}
+
+###########################################################################################################################################################
+# Rollup tables                                                                                                                                           #
+# Every table above gets a <table>_weekly and a <table>_monthly table, created and kept up to date by the pipeline: after each daily load only the       #
+# weeks and months of the dates loaded are recomputed. Metrics are summed, except the ones listed in NON_ADDITIVE_METRICS.                              #
+###########################################################################################################################################################
+ROLLUP_PERIODS = {
+    'weekly': 'WEEK(MONDAY)',
+    'monthly': 'MONTH'
+}
+
+# Metrics that can't be summed over days and how they are rolled up:
+#  - 'weighted_by': average weighted by another metric. It is taken from the same table, or from the first table above that has it when the
+#                   table doesn't. costPerQualifiedLead weighted by qualifiedLeads is total cost / total qualified leads.
+#  - 'aggregate':   SQL aggregate function. The reach of a week or a month can't be known from daily values, the highest daily value is used as a
+#                   lower bound, and so for audiencePenetration which is reach based too.
+NON_ADDITIVE_METRICS = {
+    'costPerQualifiedLead': {'weighted_by': 'qualifiedLeads'},
+    'averageDwellTime': {'weighted_by': 'impressions'},
+    'approximateMemberReach': {'aggregate': 'MAX'},
+    'audiencePenetration': {'aggregate': 'MAX'}
+}
+
+###########################################################################################################################################################
+# Wide storage layout (STORAGE_LAYOUT=wide)                                                                                                              #
+# Every metric of the tables above is stored once in this partitioned table, with the basic schema above and the union of their metric columns. The     #
+# table names above become views projecting their own metrics from it. It is created, and filled with the history of the tables, on the first run.      #
+###########################################################################################################################################################
+WIDE_TABLE = 'ad_analytics_wide'
+
+###########################################################################################################################################################
+# Verification (mode "verify" / main_local.py --verify)                                                                                                   #
+# The daily account totals of these metrics are requested from LinkedIn in one request and compared with the sums of each table that has them. Tables   #
+# that have none of them are compared on their first metric that can be summed.                                                                          #
+###########################################################################################################################################################
+VERIFY_METRICS = [
+    'costInUsd',
+    'impressions',
+    'clicks'
+]
+
+###########################################################################################################################################################
+# Campaign dimension table (CAMPAIGN_DIMENSION=true or FACT_ROWS=ids)                                                                                    #
+# One row per campaign and version of its attributes (names, type, status, campaign group), created and refreshed by the pipeline once per run.          #
+# With FACT_ROWS=ids the tables above only get the ids, join them with campaign_dimension_current on campaign_id for the names.                                    #
+###########################################################################################################################################################
+CAMPAIGN_DIMENSION_TABLE = 'campaign_dimension'
+
+###########################################################################################################################################################
+# Run history (RUN_HISTORY_ENABLED)                                                                                                                        #
+# One row per run and one per work unit with their durations, rows and BigQuery job ids, created by the pipeline. main_local.py uses a SQLite file.     #
+###########################################################################################################################################################
+RUN_HISTORY_TABLE = 'ingestion_runs'
+RUN_UNITS_TABLE = 'ingestion_run_units'
+
+###########################################################################################################################################################
+# Column types of the metrics (main_local.py --evolve-schema)                                                                                           #
+# Metric columns added to the tables by the schema evolution are FLOAT64 for the metrics below and INT64 for every other metric.                        #
+###########################################################################################################################################################
+FLOAT_METRICS = [
+    'costInLocalCurrency',
+    'costInUsd',
+    'costPerQualifiedLead',
+    'conversionValueInLocalCurrency',
+    'averageDwellTime',
+    'audiencePenetration'
+]
+
+###########################################################################################################################################################
+# Activity index (ACTIVITY_INDEX=true)                                                                                                                    #
+# The daily account totals of these metrics are requested once per run. Dates where they are all 0, or where no campaign's run schedule covers the day,  #
+# are skipped for every table. Keep every metric that can be reported without an impression (message sends, conversions, viral activity) in the list. #
+###########################################################################################################################################################
+ACTIVITY_PROBE_METRICS = [
+    'impressions',
+    'clicks',
+    'costInUsd',
+    'sends',
+    'opens',
+    'externalWebsiteConversions',
+    'oneClickLeads',
+    'viralImpressions',
+    'viralClicks',
+    'jobApplications',
+    'registrations'
+]
+
+###########################################################################################################################################################
+# Dashboard aggregates (GET /aggregates of the long-lived server)                                                                                         #
+# These metrics summed per campaign over the last DASHBOARD_WINDOWS days, each read from the first table above that has it. The first one orders the    #
+# campaigns.                                                                                                                                              #
+###########################################################################################################################################################
+DASHBOARD_METRICS = [
+    'costInUsd',
+    'clicks',
+    'oneClickLeads'
+]
+DASHBOARD_WINDOWS = [7, 30]
@@ -0,0 +1,110 @@
+import queue
+import threading
+import time
+
+# ======================================================================
+# Pipelined stages connected by bounded queues
+# Each stage (fetch, enrich, coerce, load) has its own worker threads and
+# takes its items from a bounded queue filled by the stage before it, so
+# the next unit is fetched while the previous one is still being loaded.
+# A full queue blocks the stage that feeds it (backpressure): at most
+# sum(workers) + len(stages) * queue_size items are in memory at once.
+# The source is only asked for its next item once the first queue has
+# room, so it can decide late whether another item should start at all.
+# ======================================================================
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, func, workers=1):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.items = 0
+        self.busy_seconds = 0.0
+
+
+class Pipeline:
+    def __init__(self, stages, queue_size=2):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.elapsed_seconds = 0.0
+
+    def run(self, source):
+        """
+        Runs every item of `source` through the stages, each stage's output
+        is the next stage's input. Returns the outputs of the last stage in
+        completion order. When a stage raises, the source stops, the items
+        in flight are dropped and the first error is raised.
+        """
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        results = []
+        errors = []
+        failed = threading.Event()
+        lock = threading.Lock()
+
+        def work(index, stage):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                item = inbox.get()
+                if item is _DONE:
+                    return
+                if failed.is_set():
+                    continue  # Drain the queue so the stages before don't block
+                started_at = time.monotonic()
+                try:
+                    output = stage.func(item)
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    failed.set()
+                    continue
+                with lock:
+                    stage.items += 1
+                    stage.busy_seconds += time.monotonic() - started_at
+                if outbox is None:
+                    with lock:
+                        results.append(output)
+                else:
+                    outbox.put(output)
+
+        def run_stage(index, stage):
+            workers = [threading.Thread(target=work, args=(index, stage), daemon=True) for _ in range(stage.workers)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            # The next stage stops once this one has nothing left to give it
+            if index + 1 < len(self.stages):
+                for _ in range(self.stages[index + 1].workers):
+                    queues[index + 1].put(_DONE)
+
+        started_at = time.monotonic()
+        stage_threads = [
+            threading.Thread(target=run_stage, args=(index, stage), daemon=True)
+            for index, stage in enumerate(self.stages)
+        ]
+        for thread in stage_threads:
+            thread.start()
+        try:
+            for item in source:
+                if failed.is_set():
+                    break
+                queues[0].put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in stage_threads:
+                thread.join()
+            self.elapsed_seconds += time.monotonic() - started_at
+        if errors:
+            raise errors[0]
+        return results
+
+    def describe(self):
+        busy = ", ".join(
+            f"{s.name} {s.busy_seconds:.1f}s ({s.workers} worker{'s' if s.workers > 1 else ''})"
+            for s in self.stages
+        )
+        return f"Pipeline: {self.elapsed_seconds:.1f}s elapsed, busy time per stage: {busy}"
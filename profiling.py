@@ -0,0 +1,108 @@
+import cProfile
+import functools
+import io
+import marshal
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+import storage
+
+# ======================================================================
+# Opt-in profiling of a run
+# Wraps a run in cProfile and tracemalloc and writes, for every run:
+#
+#   {path}/{name}/{timestamp}-{id}.prof             cProfile stats, open with pstats or snakeviz
+#   {path}/{name}/{timestamp}-{id}.allocations.txt  top allocation sites with their tracebacks
+#
+# and prints the top functions and allocation sites. cProfile only sees
+# the calling thread (work done in thread pools shows up as the time spent
+# waiting on it), tracemalloc sees the allocations of every thread.
+# Both are process wide, so one run is profiled at a time: runs served
+# concurrently by the same process while one is profiled (or while
+# something else traces allocations) run unprofiled.
+# ======================================================================
+PROFILE_LOCK = threading.Lock()
+
+def profiled(name, path, top_n=20, frames=10):
+    """
+    Decorator profiling every call of the function to `path` (local path or
+    gs://bucket/prefix). When `path` is not set the function is returned
+    as is, so there is no cost when profiling is off.
+    """
+    def decorator(func):
+        if not path:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE_LOCK.acquire(blocking=False):
+                print(f"Another run is being profiled, {name} runs unprofiled")
+                return func(*args, **kwargs)
+            try:
+                if tracemalloc.is_tracing():
+                    print(f"Allocations are already traced, {name} runs unprofiled")
+                    return func(*args, **kwargs)
+                profiler = cProfile.Profile()
+                tracemalloc.start(frames)
+                started_at = time.monotonic()
+                try:
+                    profiler.enable()
+                except ValueError as e:
+                    # Another profiler (a debugger, coverage...) is active
+                    tracemalloc.stop()
+                    print(f"Could not profile {name}: {e}")
+                    return func(*args, **kwargs)
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    elapsed = time.monotonic() - started_at
+                    try:
+                        snapshot = tracemalloc.take_snapshot()
+                        _, peak = tracemalloc.get_traced_memory()
+                        write_profile(name, path, profiler, snapshot, peak, elapsed, top_n)
+                    except Exception as e:
+                        # Never fail the run because the profile couldn't be taken or written
+                        print(f"Could not write the profile of {name}: {e}")
+                    finally:
+                        tracemalloc.stop()
+            finally:
+                PROFILE_LOCK.release()
+
+        return wrapper
+
+    return decorator
+
+
+def write_profile(name, path, profiler, snapshot, peak, elapsed, top_n):
+    run_id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}-{uuid.uuid4().hex[:8]}"
+    prefix = storage.join(path, name, run_id)
+
+    # Same format as Profile.dump_stats, which can only write local files
+    profiler.create_stats()
+    storage.write_bytes(f"{prefix}.prof", marshal.dumps(profiler.stats))
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ])
+    allocations = snapshot.statistics("traceback")
+    lines = [f"Peak traced memory: {peak / 1024 / 1024:.1f} MiB", ""]
+    for stat in allocations[:top_n]:
+        lines.append(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks")
+        lines += [f"    {line}" for line in stat.traceback.format()]
+        lines.append("")
+    storage.write_bytes(f"{prefix}.allocations.txt", "\n".join(lines).encode("utf-8"))
+
+    functions = io.StringIO()
+    pstats.Stats(profiler, stream=functions).sort_stats("cumulative").print_stats(top_n)
+    print(f"Profile of {name}: {elapsed:.1f}s, peak traced memory {peak / 1024 / 1024:.1f} MiB, written to {prefix}.prof")
+    print(functions.getvalue())
+    print(f"Top {top_n} allocation sites:")
+    for stat in snapshot.statistics("lineno")[:top_n]:
+        print(f"  {stat}")
@@ -0,0 +1,117 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from urllib.parse import parse_qsl, urlsplit
+
+# ======================================================================
+# On-disk cache for LinkedIn adAnalytics responses
+# Only responses whose last day is older than `immutable_after_days` are
+# cached, LinkedIn can still restate the more recent days (late
+# conversions, invalid click filtering...). Entries are gzip compressed
+# JSON files and the least recently used ones are evicted once the cache
+# grows over `max_bytes`.
+# ======================================================================
+class ResponseCache:
+
+    def __init__(self, directory, immutable_after_days=90, max_bytes=512 * 1024 * 1024, today=None):
+        self.directory = directory
+        self.immutable_after_days = immutable_after_days
+        self.max_bytes = max_bytes
+        self.today = today or datetime.now(timezone.utc).date()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = sum(size for _, _, size in self._entries())
+
+    # ------------------------------------------------------------------
+    # Keys
+    # ------------------------------------------------------------------
+    @staticmethod
+    def normalize(url, headers):
+        """
+        Normalizes an adAnalytics request so equivalent requests share an entry:
+        query parameters are sorted and the fields list is sorted and
+        deduplicated. The API version header is part of the key.
+        """
+        parts = urlsplit(url)
+        params = []
+        for name, value in parse_qsl(parts.query, keep_blank_values=True):
+            if name == "fields":
+                value = ",".join(sorted(set(f for f in value.split(",") if f)))
+            params.append((name, value))
+        query = "&".join(f"{name}={value}" for name, value in sorted(params))
+        version = (headers or {}).get("LinkedIn-Version", "")
+        return f"{version}|{parts.netloc}{parts.path}?{query}"
+
+    def _path(self, url, headers):
+        digest = hashlib.sha256(self.normalize(url, headers).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json.gz")
+
+    def is_immutable(self, last_day):
+        return (self.today - last_day).days >= self.immutable_after_days
+
+    # ------------------------------------------------------------------
+    # Get / put
+    # ------------------------------------------------------------------
+    def get(self, url, headers, last_day):
+        """Returns the cached JSON response, or None when it is not cached or not old enough to be cached."""
+        if not self.is_immutable(last_day):
+            return None
+        path = self._path(url, headers)
+        try:
+            with gzip.open(path, "rb") as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        # Touch the entry so eviction sees it as recently used
+        os.utime(path)
+        self.hits += 1
+        return data
+
+    def put(self, url, headers, last_day, content):
+        """Stores the raw response body (bytes) when its last day is old enough."""
+        if not self.is_immutable(last_day):
+            return
+        path = self._path(url, headers)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self.total_bytes += os.path.getsize(path) - previous_size
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    # ------------------------------------------------------------------
+    # Eviction
+    # ------------------------------------------------------------------
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is back to 90% of max_bytes."""
+        target = self.max_bytes * 0.9
+        entries = sorted(self._entries(), key=lambda e: e[1])
+        self.total_bytes = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
@@ -0,0 +1,218 @@
+from datetime import date, timedelta
+
+import metrics
+from shards import table_metrics
+
+# ======================================================================
+# Weekly and monthly rollup tables
+# The SQL is generated from metrics.py: one <table>_<period> table per
+# destination table and period in metrics.ROLLUP_PERIODS, grouped by
+# account, campaign group and campaign. Dimension names are the latest
+# ones seen in the period.
+# ======================================================================
+KEY_COLUMNS = ["account_id", "campaign_group_id", "campaign_id"]
+NAME_COLUMNS = ["account_name", "campaign_group_name", "campaign_name", "campaign_type", "campaign_status"]
+
+
+def rollup_table_id(table_id, period):
+    return f"{table_id}_{period}"
+
+
+def period_start(day, period):
+    if metrics.ROLLUP_PERIODS[period].startswith("WEEK"):
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(start, period):
+    if metrics.ROLLUP_PERIODS[period].startswith("WEEK"):
+        return start + timedelta(days=6)
+    next_month = (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return next_month - timedelta(days=1)
+
+
+def weight_source(weight, table_id):
+    """Returns the table the weight metric is read from: table_id itself when it has it, else the first table that does."""
+    if weight in table_metrics(table_id):
+        return table_id
+    for table_info in metrics.BIGQUERY_TABLES:
+        for other_table_id, table_config in table_info.items():
+            if weight in table_config.get("metrics", []):
+                return other_table_id
+    raise ValueError(f"No table has the weight metric {weight}")
+
+
+# ======================================================================
+# SQL generation
+# ======================================================================
+def rollup_select(project, dataset, table_id, period, where, weight_where):
+    """
+    Returns the SELECT computing the rollup rows of the table for the
+    period. `where` filters the daily rows (alias f), `weight_where` the
+    rows of the tables the weights are joined from.
+    """
+    trunc = metrics.ROLLUP_PERIODS[period]
+    columns = [f"DATE_TRUNC(f.date, {trunc}) AS period_start"]
+    columns += [f"f.{column}" for column in KEY_COLUMNS]
+    columns += [
+        f"ARRAY_AGG(f.{column} IGNORE NULLS ORDER BY f.date DESC LIMIT 1)[SAFE_OFFSET(0)] AS {column}"
+        for column in NAME_COLUMNS
+    ]
+    columns.append("COUNT(DISTINCT f.date) AS days")
+
+    joins = {}
+    for metric in table_metrics(table_id):
+        rule = metrics.NON_ADDITIVE_METRICS.get(metric)
+        if rule is None:
+            columns.append(f"SUM(f.{metric}) AS {metric}")
+        elif "aggregate" in rule:
+            columns.append(f"{rule['aggregate']}(f.{metric}) AS {metric}")
+        else:
+            weight = rule["weighted_by"]
+            source = weight_source(weight, table_id)
+            if source == table_id:
+                weight_column = f"f.{weight}"
+            else:
+                alias = joins.setdefault(source, f"w{len(joins)}")
+                weight_column = f"{alias}.{weight}"
+            columns.append(
+                f"SAFE_DIVIDE(SUM(f.{metric} * {weight_column}), SUM(IF(f.{metric} IS NULL, NULL, {weight_column}))) AS {metric}"
+            )
+
+    sql = "SELECT\n  " + ",\n  ".join(columns) + f"\nFROM `{project}.{dataset}.{table_id}` f\n"
+    for source, alias in joins.items():
+        weights = [
+            rule["weighted_by"] for metric, rule in metrics.NON_ADDITIVE_METRICS.items()
+            if metric in table_metrics(table_id) and rule.get("weighted_by") and weight_source(rule["weighted_by"], table_id) == source
+        ]
+        weight_sums = ", ".join(f"SUM({w}) AS {w}" for w in sorted(set(weights)))
+        keys = ", ".join(["date"] + KEY_COLUMNS)
+        sql += (
+            f"LEFT JOIN (\n"
+            f"  SELECT {keys}, {weight_sums}\n"
+            f"  FROM `{project}.{dataset}.{source}`\n"
+            f"  WHERE {weight_where}\n"
+            f"  GROUP BY {keys}\n"
+            f") {alias}\n"
+            f"  ON {' AND '.join(f'{alias}.{k} = f.{k}' for k in ['date'] + KEY_COLUMNS)}\n"
+        )
+    sql += f"WHERE {where}\n"
+    sql += f"GROUP BY period_start, {', '.join(f'f.{column}' for column in KEY_COLUMNS)}"
+    return sql
+
+
+def create_statement(project, dataset, table_id, period):
+    """CREATE TABLE IF NOT EXISTS for the rollup table, with the schema of its SELECT."""
+    select = rollup_select(project, dataset, table_id, period, "FALSE", "FALSE")
+    return (
+        f"CREATE TABLE IF NOT EXISTS `{project}.{dataset}.{rollup_table_id(table_id, period)}`\n"
+        f"PARTITION BY DATE_TRUNC(period_start, MONTH)\n"
+        f"CLUSTER BY account_id, campaign_id\n"
+        f"AS\n{select};"
+    )
+
+
+def rebuild_statement(project, dataset, table_id, period):
+    """Recreates the rollup table from the whole daily history, e.g. after columns were added to the daily table."""
+    select = rollup_select(project, dataset, table_id, period, "TRUE", "TRUE")
+    return (
+        f"CREATE OR REPLACE TABLE `{project}.{dataset}.{rollup_table_id(table_id, period)}`\n"
+        f"PARTITION BY DATE_TRUNC(period_start, MONTH)\n"
+        f"CLUSTER BY account_id, campaign_id\n"
+        f"AS\n{select};"
+    )
+
+
+def affected_periods(dates, period):
+    """Returns the sorted start dates of the periods containing the dates (YYYY-MM-DD strings)."""
+    return sorted({period_start(date.fromisoformat(d), period) for d in dates})
+
+
+def update_script(project, dataset, updates):
+    """
+    Returns (script, parameters) recomputing the affected periods of every
+    table in one transaction. `updates` maps (account_id, table_id) to the
+    dates that were loaded. Parameters are (name, type, value) tuples,
+    ARRAY parameters have a type like "ARRAY<DATE>".
+    """
+    statements = []
+    parameters = []
+    n = 0
+    for (account_id, table_id), dates in updates.items():
+        for period in metrics.ROLLUP_PERIODS:
+            periods = affected_periods(dates, period)
+            first = periods[0]
+            last = period_end(periods[-1], period)
+            parameters += [
+                (f"account_id_{n}", "STRING", account_id),
+                (f"periods_{n}", "ARRAY<DATE>", periods),
+                (f"first_{n}", "DATE", first),
+                (f"last_{n}", "DATE", last),
+            ]
+            rollup_ref = f"{project}.{dataset}.{rollup_table_id(table_id, period)}"
+            where = (
+                f"f.account_id = @account_id_{n} AND f.date BETWEEN @first_{n} AND @last_{n} "
+                f"AND DATE_TRUNC(f.date, {metrics.ROLLUP_PERIODS[period]}) IN UNNEST(@periods_{n})"
+            )
+            weight_where = f"account_id = @account_id_{n} AND date BETWEEN @first_{n} AND @last_{n}"
+            statements.append(
+                f"DELETE FROM `{rollup_ref}` WHERE account_id = @account_id_{n} AND period_start IN UNNEST(@periods_{n});"
+            )
+            statements.append(
+                f"INSERT INTO `{rollup_ref}`\n{rollup_select(project, dataset, table_id, period, where, weight_where)};"
+            )
+            n += 1
+    script = "BEGIN TRANSACTION;\n" + "\n".join(statements) + "\nCOMMIT TRANSACTION;\n"
+    return script, parameters
+
+
+# ======================================================================
+# Running the updates (main.py and main_local.py)
+# ======================================================================
+def query_parameters(parameters):
+    """BigQuery query parameters from the (name, type, value) tuples of update_script."""
+    from google.cloud import bigquery
+
+    return [
+        bigquery.ArrayQueryParameter(name, param_type[len("ARRAY<"):-1], value)
+        if param_type.startswith("ARRAY<")
+        else bigquery.ScalarQueryParameter(name, param_type, value)
+        for name, param_type, value in parameters
+    ]
+
+
+def ensure_rollup_tables(bq_client, project, dataset, table_ids, ready_tables):
+    """Creates the rollup tables of the tables, except the (table_id, period) already in ready_tables, and adds them to it."""
+    statements = [
+        create_statement(project, dataset, table_id, period)
+        for table_id in table_ids
+        for period in metrics.ROLLUP_PERIODS
+        if (table_id, period) not in ready_tables
+    ]
+    if not statements:
+        return
+    bq_client.query("\n".join(statements)).result()
+    ready_tables.update((t, p) for t in table_ids for p in metrics.ROLLUP_PERIODS)
+
+
+def update_rollups(bq_client, project, dataset, units, ready_tables, job_ledger=None):
+    """
+    Recomputes the weeks and months containing the dates of the processed
+    units, for every table and account, in one transaction. `ready_tables`
+    is the caller's set of rollup tables already created, `job_ledger` the
+    run's job_costs.JobCostLedger.
+    """
+    from google.cloud import bigquery
+
+    updates = {}
+    for unit in units:
+        updates.setdefault((str(unit["account_id"]), unit["table_id"]), set()).add(unit["date"])
+    if not updates:
+        return
+    ensure_rollup_tables(bq_client, project, dataset, {table_id for _, table_id in updates}, ready_tables)
+    script, parameters = update_script(project, dataset, updates)
+    query_job = bq_client.query(script, job_config=bigquery.QueryJobConfig(query_parameters=query_parameters(parameters)))
+    query_job.result()  # Wait for the transaction to commit
+    print(f"Updated the rollups of {len(updates)} tables")
+    if job_ledger is not None:
+        job_ledger.record(query_job, f"rollups ({len(updates)} tables)", "rollup")
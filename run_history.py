@@ -0,0 +1,297 @@
+import json
+import sqlite3
+import statistics
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import metrics
+
+# ======================================================================
+# Run history
+# One manifest row per run (mode, duration, units, rows, LinkedIn calls
+# and retries, busy seconds per pipeline stage, BigQuery bytes billed and
+# slot time, see job_costs.py) and one per work unit
+# (seconds per stage, rows, BigQuery job ids), written to the
+# metrics.RUN_HISTORY_TABLE / RUN_UNITS_TABLE tables by the function and
+# to a SQLite file by main_local.py. Each run is compared with the median
+# of the last successful runs of the same mode, so a run slowly creeping
+# towards the timeout is flagged before it actually fails. Both stores
+# (BigQueryHistory, SqliteHistory) have the same ensure, write and
+# recent_runs methods, write_history uses either.
+# ======================================================================
+RUN_COLUMNS = [
+    ("run_id", "STRING"),
+    ("started_at", "TIMESTAMP"),
+    ("mode", "STRING"),
+    ("commit_mode", "STRING"),
+    ("status", "STRING"),
+    ("error", "STRING"),
+    ("duration_seconds", "FLOAT64"),
+    ("units", "INT64"),
+    ("remaining_units", "INT64"),
+    ("row_count", "INT64"),
+    ("api_calls", "INT64"),
+    ("retries", "INT64"),
+    ("stage_seconds", "STRING"),  # JSON {stage: busy seconds}
+    ("flags", "STRING"),
+    ("bytes_billed", "INT64"),
+    ("slot_ms", "INT64"),
+    ("job_costs", "STRING"),  # JSON {table: statistics}
+]
+UNIT_COLUMNS = [
+    ("run_id", "STRING"),
+    ("account_id", "STRING"),
+    ("table_id", "STRING"),
+    ("date", "DATE"),
+    ("stage_seconds", "STRING"),  # JSON {stage: seconds}
+    ("row_count", "INT64"),
+    ("quarantined_rows", "INT64"),
+    ("job_ids", "STRING"),  # JSON list
+]
+
+
+class RunRecorder:
+    """Collects the manifest of one run, units can be added from several threads."""
+
+    def __init__(self, mode, commit_mode=None, run_id=None):
+        # The continuations of a run share its run_id, each writes its own run row
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.mode = mode
+        self.commit_mode = commit_mode
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.monotonic()
+        self.units = []
+        self.stage_seconds = {}
+        self._lock = threading.Lock()
+
+    def add_unit(self, unit, stage_seconds, rows, quarantined_rows=0, job_ids=()):
+        with self._lock:
+            self.units.append({
+                "run_id": self.run_id,
+                "account_id": str(unit["account_id"]),
+                "table_id": unit["table_id"],
+                "date": unit["date"],
+                "stage_seconds": json.dumps({k: round(v, 3) for k, v in stage_seconds.items()}),
+                "row_count": rows,
+                "quarantined_rows": quarantined_rows,
+                "job_ids": json.dumps([j for j in job_ids if j]),
+            })
+
+    def add_stage_seconds(self, stage_seconds):
+        with self._lock:
+            for stage, seconds in stage_seconds.items():
+                self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def run_row(self, status, units=0, remaining_units=0, rows=0, api_calls=0, retries=0, error=None, flags=(), job_costs=None):
+        """`job_costs` is the run's job_costs.JobCostLedger."""
+        totals = job_costs.totals() if job_costs else {}
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at.isoformat(),
+            "mode": self.mode,
+            "commit_mode": self.commit_mode,
+            "status": status,
+            "error": str(error) if error else None,
+            "duration_seconds": round(time.monotonic() - self._started, 3),
+            "units": units,
+            "remaining_units": remaining_units,
+            "row_count": rows,
+            "api_calls": api_calls,
+            "retries": retries,
+            "stage_seconds": json.dumps({k: round(v, 3) for k, v in self.stage_seconds.items()}),
+            "flags": "\n".join(flags) or None,
+            "bytes_billed": totals.get("bytes_billed"),
+            "slot_ms": totals.get("slot_ms"),
+            "job_costs": job_costs.to_json() if job_costs else None,
+        }
+
+
+# ======================================================================
+# Regression detection
+# ======================================================================
+def seconds_per_unit(run, stage=None):
+    if not run.get("units"):
+        return None
+    if stage is None:
+        return run["duration_seconds"] / run["units"]
+    seconds = json.loads(run.get("stage_seconds") or "{}").get(stage)
+    return None if seconds is None else seconds / run["units"]
+
+
+def find_regressions(run, baseline_runs, factor=1.5, min_runs=3, timeout_seconds=None, timeout_warning=0.8):
+    """
+    Returns the flags of the run (a row of run_row): seconds per unit, in
+    total and per stage, above `factor` times the median of the baseline
+    runs (once there are `min_runs` of them), and a duration above
+    `timeout_warning` of the timeout.
+    """
+    flags = []
+    if timeout_seconds and run["duration_seconds"] > timeout_warning * timeout_seconds:
+        flags.append(
+            f"Run took {run['duration_seconds']:.0f}s, {run['duration_seconds'] / timeout_seconds:.0%} "
+            f"of the {timeout_seconds}s timeout"
+        )
+    if len(baseline_runs) < min_runs or not run.get("units"):
+        return flags
+    stages = [None] + sorted(json.loads(run.get("stage_seconds") or "{}"))
+    for stage in stages:
+        current = seconds_per_unit(run, stage)
+        history = [s for s in (seconds_per_unit(r, stage) for r in baseline_runs) if s]
+        if current is None or len(history) < min_runs:
+            continue
+        baseline = statistics.median(history)
+        if current > factor * baseline:
+            name = "Throughput" if stage is None else f"Stage {stage}"
+            flags.append(
+                f"{name} regression: {current:.2f}s per unit vs {baseline:.2f}s "
+                f"(median of the last {len(history)} {run['mode']} runs)"
+            )
+    return flags
+
+
+def write_history(history, recorder, run, baseline_runs, factor=1.5, timeout_seconds=None, timeout_warning=0.8):
+    """
+    Flags the run (a row of run_row) against the last `baseline_runs`
+    successful runs of its mode, then writes it with the recorder's units
+    to `history`. Returns the regression flags. The history is best
+    effort, failing to write it never fails the run.
+    """
+    flags = []
+    try:
+        history.ensure()
+        if run["status"] == "ok":
+            flags = find_regressions(
+                run,
+                history.recent_runs(recorder.mode, baseline_runs),
+                factor=factor,
+                timeout_seconds=timeout_seconds,
+                timeout_warning=timeout_warning
+            )
+            run["flags"] = "\n".join(flags) or None
+        history.write(run, recorder.units)
+        print(f"Run {recorder.run_id} written to {history} ({len(recorder.units)} units)")
+    except Exception as e:
+        print(f"Could not write the run history: {e}")
+    for flag in flags:
+        print(f"Regression: {flag}")
+    return flags
+
+
+# ======================================================================
+# BigQuery tables
+# ======================================================================
+def create_statements(project, dataset):
+    statements = []
+    for table_id, columns, options in (
+        (metrics.RUN_HISTORY_TABLE, RUN_COLUMNS, "PARTITION BY DATE(started_at)"),
+        (metrics.RUN_UNITS_TABLE, UNIT_COLUMNS, "PARTITION BY date CLUSTER BY run_id"),
+    ):
+        # Column names are quoted, some are reserved keywords otherwise
+        column_list = ", ".join(f"`{name}` {column_type}" for name, column_type in columns)
+        statements.append(f"CREATE TABLE IF NOT EXISTS `{project}.{dataset}.{table_id}` ({column_list}) {options};")
+    return "\n".join(statements)
+
+
+def baseline_query(project, dataset, limit):
+    """The last `limit` successful runs of @mode."""
+    return (
+        f"SELECT * FROM `{project}.{dataset}.{metrics.RUN_HISTORY_TABLE}` "
+        f"WHERE mode = @mode AND status = 'ok' AND units > 0 "
+        f"ORDER BY started_at DESC LIMIT {int(limit)}"
+    )
+
+
+class BigQueryHistory:
+    """The history tables of the function, created on the first write of the instance."""
+
+    def __init__(self, bq_client, project, dataset):
+        self.bq_client = bq_client
+        self.project = project
+        self.dataset = dataset
+        self.ready = False
+
+    def __str__(self):
+        return metrics.RUN_HISTORY_TABLE
+
+    def ensure(self):
+        if not self.ready:
+            self.bq_client.query(create_statements(self.project, self.dataset)).result()
+            self.ready = True
+
+    def write(self, run_row, unit_rows):
+        from google.cloud import bigquery
+
+        for table_id, columns, rows in (
+            (metrics.RUN_HISTORY_TABLE, RUN_COLUMNS, [run_row]),
+            (metrics.RUN_UNITS_TABLE, UNIT_COLUMNS, unit_rows),
+        ):
+            if not rows:
+                continue
+            job_config = bigquery.LoadJobConfig(
+                schema=[bigquery.SchemaField(name, column_type) for name, column_type in columns],
+                source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+                # Columns added to RUN_COLUMNS or UNIT_COLUMNS since the table was created
+                schema_update_options=[bigquery.SchemaUpdateOption.ALLOW_FIELD_ADDITION]
+            )
+            self.bq_client.load_table_from_json(
+                rows, f"{self.project}.{self.dataset}.{table_id}", job_config=job_config
+            ).result()
+
+    def recent_runs(self, mode, limit):
+        from google.cloud import bigquery
+
+        job_config = bigquery.QueryJobConfig(query_parameters=[bigquery.ScalarQueryParameter("mode", "STRING", mode)])
+        query = baseline_query(self.project, self.dataset, limit)
+        return [dict(row.items()) for row in self.bq_client.query(query, job_config=job_config).result()]
+
+
+# ======================================================================
+# Local SQLite history (main_local.py)
+# ======================================================================
+SQLITE_TYPES = {"STRING": "TEXT", "TIMESTAMP": "TEXT", "DATE": "TEXT", "FLOAT64": "REAL", "INT64": "INTEGER"}
+
+
+class SqliteHistory:
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def ensure(self):
+        with self._connect() as connection:
+            for table_id, columns in ((metrics.RUN_HISTORY_TABLE, RUN_COLUMNS), (metrics.RUN_UNITS_TABLE, UNIT_COLUMNS)):
+                column_list = ", ".join(f"{name} {SQLITE_TYPES[column_type]}" for name, column_type in columns)
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table_id} ({column_list})")
+                # Columns added since the file was created
+                existing = {row[1] for row in connection.execute(f"PRAGMA table_info({table_id})")}
+                for name, column_type in columns:
+                    if name not in existing:
+                        connection.execute(f"ALTER TABLE {table_id} ADD COLUMN {name} {SQLITE_TYPES[column_type]}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def write(self, run_row, unit_rows):
+        with self._connect() as connection:
+            for table_id, columns, rows in (
+                (metrics.RUN_HISTORY_TABLE, RUN_COLUMNS, [run_row]),
+                (metrics.RUN_UNITS_TABLE, UNIT_COLUMNS, unit_rows),
+            ):
+                names = [name for name, _ in columns]
+                connection.executemany(
+                    f"INSERT INTO {table_id} ({', '.join(names)}) VALUES ({', '.join('?' for _ in names)})",
+                    [[row.get(name) for name in names] for row in rows]
+                )
+
+    def recent_runs(self, mode, limit):
+        with self._connect() as connection:
+            connection.row_factory = sqlite3.Row
+            cursor = connection.execute(
+                f"SELECT * FROM {metrics.RUN_HISTORY_TABLE} WHERE mode = ? AND status = 'ok' AND units > 0 "
+                f"ORDER BY started_at DESC LIMIT ?",
+                (mode, limit)
+            )
+            return [dict(row) for row in cursor]
@@ -0,0 +1,30 @@
+import concurrency
+import job_costs
+
+# ======================================================================
+# Per run state
+# What a run builds up while it goes and reads back later: the statistics
+# of its BigQuery jobs (see job_costs.py), its LinkedIn requests (see
+# concurrency.RequestCounter), the campaign listings of its accounts (see
+# refresh_campaign_dimension in main.py) and their activity indexes (see
+# activity.py). The long-lived server runs requests
+# concurrently, each run gets its own RunState, passed down explicitly to
+# the functions that record to it or read from it.
+# ======================================================================
+class RunState:
+    def __init__(self):
+        self.job_ledger = job_costs.JobCostLedger()
+        self.api_calls = concurrency.RequestCounter()
+        # {account_id: ({campaign_group_id: response}, {campaign_id: response})} from the run's listings
+        self.account_dimensions = {}
+        # {account_id: activity.ActivityIndex}
+        self.activity_indexes = {}
+
+    def known_entities(self, account_id):
+        """The account's (campaign groups, campaigns) listed by the run, ({}, {}) when it wasn't listed."""
+        return self.account_dimensions.get(str(account_id), ({}, {}))
+
+    def listed_campaigns(self, account_id):
+        """The account's campaigns listed by the run, None when it wasn't listed."""
+        listing = self.account_dimensions.get(str(account_id))
+        return listing[1] if listing else None
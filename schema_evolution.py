@@ -0,0 +1,85 @@
+from datetime import timedelta
+
+import metrics
+import transforms
+from shards import parse_date
+from verify import element_date
+
+# ======================================================================
+# Schema evolution (main_local.py --evolve-schema)
+# When a metric is added to a table in metrics.py, the column is added to
+# the live table and only the new metrics are requested over the table's
+# history, a month of days per request. They are loaded into a staging
+# table and merged into the existing rows on (date, account_id,
+# campaign_id), so the other columns are neither requested nor rewritten.
+# Rows LinkedIn returns for campaigns the table has no row for that day
+# are left out: the daily load always writes every campaign with activity.
+# ======================================================================
+KEY_COLUMNS = [("date", "DATE"), ("account_id", "STRING"), ("campaign_id", "STRING")]
+DEFAULT_CHUNK_DAYS = 30
+
+
+def column_type(metric):
+    return "FLOAT64" if metric in metrics.FLOAT_METRICS else "INT64"
+
+
+def missing_columns(metric_names, column_names):
+    """The metrics of metric_names the table (its column names) doesn't have yet, in metrics.py order."""
+    existing = set(column_names)
+    missing = []
+    for metric in metric_names:
+        if metric not in existing and metric not in missing:
+            missing.append(metric)
+    return missing
+
+
+def alter_statement(project, dataset, table_id, metric_names):
+    columns = ", ".join(f"ADD COLUMN IF NOT EXISTS `{m}` {column_type(m)}" for m in metric_names)
+    return f"ALTER TABLE `{project}.{dataset}.{table_id}` {columns};"
+
+
+def staging_columns(metric_names):
+    """(column, BigQuery type) of the staging table of the backfilled metrics."""
+    return KEY_COLUMNS + [(m, column_type(m)) for m in metric_names]
+
+
+def date_chunks(start_date, end_date, days=DEFAULT_CHUNK_DAYS):
+    """Yields (first, last) YYYY-MM-DD pairs covering start_date to end_date, `days` days at most."""
+    first = parse_date(start_date)
+    end = parse_date(end_date)
+    while first <= end:
+        last = min(first + timedelta(days=days - 1), end)
+        yield first.isoformat(), last.isoformat()
+        first = last + timedelta(days=1)
+
+
+def backfill_rows(elements, account_id, metric_names):
+    """Rows of the staging table from the elements of a DAILY request over a date range."""
+    transforms.normalize_elements(elements, metric_names)
+    rows = []
+    for element in elements:
+        _, campaign_id = transforms.parse_pivot_values(element.get("pivotValues", []))
+        row = {"date": element_date(element), "account_id": str(account_id), "campaign_id": campaign_id}
+        for metric in metric_names:
+            row[metric] = element[metric]
+        rows.append(row)
+    return rows
+
+
+def merge_statement(project, dataset, table_id, staging_ref, metric_names):
+    on = " AND ".join(f"T.`{c}` = S.`{c}`" for c, _ in KEY_COLUMNS)
+    updates = ", ".join(f"`{m}` = S.`{m}`" for m in metric_names)
+    return (
+        f"MERGE `{project}.{dataset}.{table_id}` T\n"
+        f"USING `{staging_ref}` S\n"
+        f"ON {on}\n"
+        f"WHEN MATCHED THEN UPDATE SET {updates};"
+    )
+
+
+def date_range_query(project, dataset, table_id):
+    """First and last date of every account in the table, one row per account."""
+    return (
+        f"SELECT account_id, CAST(MIN(date) AS STRING) AS first_date, CAST(MAX(date) AS STRING) AS last_date "
+        f"FROM `{project}.{dataset}.{table_id}` GROUP BY account_id ORDER BY account_id"
+    )
@@ -0,0 +1,145 @@
+import re
+from datetime import datetime, timedelta
+
+import metrics
+
+# ======================================================================
+# Shard specs
+# A shard spec is the JSON body accepted by the Cloud Function entrypoint:
+# {
+#     "start_date": "YYYY-MM-DD",
+#     "end_date": "YYYY-MM-DD",
+#     "tables": ["ad_analytics", ...],     (optional, defaults to all tables)
+#     "accounts": ["<account_id>", ...]    (optional, defaults to LINKEDIN_ACCOUNT_ID)
+# }
+# ======================================================================
+VALID_TABLE_NAMES = [list(t.keys())[0] for t in metrics.BIGQUERY_TABLES]
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def validate_account_id(account_id):
+    """
+    Returns the account id as a string. Account ids end up in table names
+    (staging tables) and come from request bodies, only digits are accepted.
+    """
+    account_id = str(account_id)
+    if not re.fullmatch(r"[0-9]+", account_id):
+        raise ValueError(f"Invalid account id: {account_id!r}, account ids are numeric")
+    return account_id
+
+
+def parse_shard_spec(body, default_date, default_account_id):
+    """
+    Validates a shard spec and fills in the defaults. Raises ValueError
+    with a readable message when the spec is not valid.
+    """
+    start_date = body.get("start_date", default_date)
+    end_date = body.get("end_date", start_date)
+    try:
+        start = parse_date(start_date)
+        end = parse_date(end_date)
+    except (TypeError, ValueError):
+        raise ValueError("start_date and end_date must be formatted as YYYY-MM-DD")
+    if start > end:
+        raise ValueError("start_date must be before or equal to end_date")
+
+    for key in ("tables", "accounts"):
+        # A string would be iterated character by character
+        if body.get(key) is not None and not isinstance(body[key], list):
+            raise ValueError(f"{key} must be a list")
+
+    tables = body.get("tables") or VALID_TABLE_NAMES
+    invalid_tables = [t for t in tables if t not in VALID_TABLE_NAMES]
+    if invalid_tables:
+        raise ValueError(
+            f"Invalid tables: {', '.join(invalid_tables)}. "
+            f"Valid tables are: {', '.join(VALID_TABLE_NAMES)}"
+        )
+
+    accounts = [validate_account_id(a) for a in (body.get("accounts") or [default_account_id])]
+
+    return {
+        "start_date": start.isoformat(),
+        "end_date": end.isoformat(),
+        "tables": list(tables),
+        "accounts": accounts,
+    }
+
+
+# ======================================================================
+# Split a shard spec into smaller shards for the coordinator
+# ======================================================================
+def split_into_shards(spec, shard_days=7, tables_per_shard=None):
+    """
+    Splits a shard spec into one shard per account, per block of
+    `shard_days` days and per group of `tables_per_shard` tables.
+    """
+    if shard_days < 1:
+        raise ValueError("shard_days must be at least 1")
+    tables = spec["tables"]
+    if not tables_per_shard or tables_per_shard < 1:
+        tables_per_shard = len(tables)
+    table_groups = [tables[i:i + tables_per_shard] for i in range(0, len(tables), tables_per_shard)]
+
+    start = parse_date(spec["start_date"])
+    end = parse_date(spec["end_date"])
+
+    shards = []
+    for account_id in spec["accounts"]:
+        block_start = start
+        while block_start <= end:
+            block_end = min(block_start + timedelta(days=shard_days - 1), end)
+            for table_group in table_groups:
+                shards.append({
+                    "start_date": block_start.isoformat(),
+                    "end_date": block_end.isoformat(),
+                    "tables": table_group,
+                    "accounts": [account_id],
+                })
+            block_start = block_end + timedelta(days=1)
+    return shards
+
+
+# ======================================================================
+# Work units
+# A work unit is one table, for one account and one date. It is the
+# smallest piece of work that is deleted and reloaded as a whole.
+# ======================================================================
+def expand_work_units(spec):
+    units = []
+    start = parse_date(spec["start_date"])
+    end = parse_date(spec["end_date"])
+    for account_id in spec["accounts"]:
+        for table_id in [t for t in VALID_TABLE_NAMES if t in spec["tables"]]:
+            day = start
+            while day <= end:
+                units.append({"account_id": account_id, "table_id": table_id, "date": day.isoformat()})
+                day += timedelta(days=1)
+    return units
+
+
+def validate_work_units(units):
+    """
+    Checks the work units of a continuation token, which come from request
+    bodies too. Raises ValueError when one is not a valid unit.
+    """
+    valid_tables = set(VALID_TABLE_NAMES) | {metrics.WIDE_TABLE}
+    for unit in units:
+        if not isinstance(unit, dict) or unit.get("table_id") not in valid_tables:
+            raise ValueError("Invalid continuation token")
+        unit["account_id"] = validate_account_id(unit.get("account_id"))
+        try:
+            parse_date(unit.get("date"))
+        except (TypeError, ValueError):
+            raise ValueError("Invalid continuation token")
+    return units
+
+
+def table_metrics(table_id):
+    for table_info in metrics.BIGQUERY_TABLES:
+        if table_id in table_info:
+            return table_info[table_id].get("metrics", [])
+    raise ValueError(f"Unknown table: {table_id}")
@@ -0,0 +1,102 @@
+from datetime import timedelta
+
+from shards import parse_date
+
+# ======================================================================
+# Complete adAnalytics results past LinkedIn's element cap
+# One adAnalytics response returns 15,000 elements at most, without
+# pagination: a date range or a fine pivot with more rows than that
+# silently loses the rest. A response at the cap is taken as truncated
+# and its query is split, by date window first (halves of the range),
+# then by campaign (facets of at most max_facet campaigns, then halves),
+# until every sub-query is under the cap. Sub-queries cover disjoint
+# dates or campaigns, so their elements are concatenated. They are run a
+# round at a time, every query of a round concurrently.
+# ======================================================================
+ELEMENT_CAP = 15000
+# Pivots whose elements each belong to a single campaign, only these can be split by campaign
+CAMPAIGN_SPLITTABLE_PIVOTS = {"CAMPAIGN", "CREATIVE"}
+
+
+def is_capped(elements, cap=ELEMENT_CAP):
+    return len(elements) >= cap
+
+
+def can_split_by_campaign(pivots):
+    return bool(CAMPAIGN_SPLITTABLE_PIVOTS & set(pivots))
+
+
+def element_key(element):
+    """Identifies an element within the responses of a query and its sub-queries."""
+    date_range = element.get("dateRange", {}).get("start", {})
+    return (
+        tuple(element.get("pivotValues") or ()),
+        date_range.get("year"), date_range.get("month"), date_range.get("day"),
+    )
+
+
+def split_dates(start_date, end_date):
+    """Halves of the range (YYYY-MM-DD), None for a single day."""
+    start, end = parse_date(start_date), parse_date(end_date)
+    if start >= end:
+        return None
+    middle = start + timedelta(days=(end - start).days // 2)
+    return [(start.isoformat(), middle.isoformat()), ((middle + timedelta(days=1)).isoformat(), end.isoformat())]
+
+
+def split_campaigns(campaign_ids, max_facet):
+    """Chunks of at most max_facet campaigns when there are more, else halves, None for a single campaign."""
+    if len(campaign_ids) > max_facet:
+        return [campaign_ids[i:i + max_facet] for i in range(0, len(campaign_ids), max_facet)]
+    if len(campaign_ids) < 2:
+        return None
+    middle = len(campaign_ids) // 2
+    return [campaign_ids[:middle], campaign_ids[middle:]]
+
+
+def fetch_complete(fetch, start_date, end_date, campaign_ids=None, list_campaigns=None, pivots=("CAMPAIGN",),
+                   elements=None, max_facet=100, cap=ELEMENT_CAP, map_func=map):
+    """
+    Returns every element of the query, splitting it while responses hit
+    the cap. `fetch(start_date, end_date, campaign_ids)` returns a list of
+    elements, campaign_ids None being the whole account, and
+    `list_campaigns()` the account's campaign ids, only called when needed.
+    Queries are only split by campaign for one of the pivots of
+    CAMPAIGN_SPLITTABLE_PIVOTS. `elements` is the response of the query
+    itself when it was already requested. `map_func` runs a round of
+    sub-queries (a thread pool's map).
+    """
+    split_by_campaign = can_split_by_campaign(pivots)
+    complete = []
+    pending = [(start_date, end_date, campaign_ids, elements)]
+    account_campaigns = None
+    while pending:
+        to_fetch = [query for query in pending if query[3] is None]
+        fetched = iter(map_func(lambda query: fetch(*query[:3]), to_fetch))
+        pending = [
+            query if query[3] is not None else (*query[:3], next(fetched))
+            for query in pending
+        ]
+        next_round = []
+        for start, end, ids, query_elements in pending:
+            if not is_capped(query_elements, cap):
+                complete += query_elements
+                continue
+            date_windows = split_dates(start, end)
+            if date_windows:
+                print(f"{len(query_elements)} elements from {start} to {end}, at the cap, split by dates")
+                next_round += [(first, last, ids, None) for first, last in date_windows]
+                continue
+            if ids is None and list_campaigns is not None and split_by_campaign:
+                if account_campaigns is None:
+                    account_campaigns = sorted(list_campaigns())
+                ids = account_campaigns
+            chunks = split_campaigns(ids, max_facet) if ids and split_by_campaign else None
+            if chunks:
+                print(f"{len(query_elements)} elements on {start} for {len(ids)} campaigns, at the cap, split by campaigns")
+                next_round += [(start, end, chunk, None) for chunk in chunks]
+                continue
+            print(f"{len(query_elements)} elements on {start} can't be split further, some may be missing")
+            complete += query_elements
+        pending = next_round
+    return complete
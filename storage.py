@@ -0,0 +1,61 @@
+import os
+
+# ======================================================================
+# Local and Google Cloud Storage paths
+# Paths starting with gs:// are read and written with google-cloud-storage,
+# anything else is a local path (a bucket mounted with Cloud Storage FUSE
+# works as a local path too).
+# ======================================================================
+_gcs_client = None
+
+
+def _gcs():
+    global _gcs_client
+    if _gcs_client is None:
+        from google.cloud import storage
+        _gcs_client = storage.Client()
+    return _gcs_client
+
+
+def is_gcs(path):
+    return path.startswith("gs://")
+
+
+def _split_gcs_path(path):
+    bucket, _, name = path[len("gs://"):].partition("/")
+    return bucket, name
+
+
+def join(base, *parts):
+    if is_gcs(base):
+        return "/".join([base.rstrip("/")] + [p.strip("/") for p in parts])
+    return os.path.join(base, *parts)
+
+
+def write_bytes(path, data):
+    if is_gcs(path):
+        bucket, name = _split_gcs_path(path)
+        _gcs().bucket(bucket).blob(name).upload_from_string(data)
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write to a temporary file first so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def read_bytes(path):
+    """Returns the content of the file, or None when it doesn't exist."""
+    if is_gcs(path):
+        from google.api_core.exceptions import NotFound
+        bucket, name = _split_gcs_path(path)
+        try:
+            return _gcs().bucket(bucket).blob(name).download_as_bytes()
+        except NotFound:
+            return None
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
@@ -0,0 +1,23 @@
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# ======================================================================
+# Incremental parsing of adAnalytics responses
+# requests asks for a gzip transfer by default (Accept-Encoding: gzip,
+# deflate) and urllib3 decompresses the body as it is read. With ijson the
+# elements are parsed one at a time while the body downloads, so neither
+# the whole body nor a second copy of it is held in memory. Without ijson
+# the whole body is parsed at once, as before.
+# ======================================================================
+def iter_elements(response):
+    """
+    Yields the "elements" of a response requested with stream=True.
+    Numbers are parsed as int and float, like response.json() does.
+    """
+    if ijson is None:
+        yield from response.json().get("elements", [])
+        return
+    response.raw.decode_content = True
+    yield from ijson.items(response.raw, "elements.item", use_float=True)
@@ -0,0 +1,92 @@
+# ======================================================================
+# Transforms from LinkedIn adAnalytics responses to BigQuery rows
+# Nothing in here makes HTTP requests: the campaign and campaign group
+# metadata are resolved beforehand and passed in as dicts keyed by id.
+# ======================================================================
+NOT_AVAILABLE = "N/A"
+
+
+def analytics_fields(metrics):
+    """
+    Returns the fields to request for the metrics. pivotValues is always
+    requested, and so are impressions: LinkedIn doesn't always return the
+    other metrics without them (not documented by LinkedIn, observed behavior).
+    """
+    fields = ["pivotValues", "impressions"]
+    for metric in metrics:
+        if metric not in fields:
+            fields.append(metric)
+    return fields
+
+
+def parse_pivot_values(pivot_values):
+    """Returns (campaign_group_id, campaign_id) from an element's pivotValues URNs."""
+    campaign_group_id = NOT_AVAILABLE
+    campaign_id = NOT_AVAILABLE
+    for urn in pivot_values:
+        if "CampaignGroup" in urn:
+            campaign_group_id = urn.split(":")[-1]
+        elif "Campaign" in urn:
+            campaign_id = urn.split(":")[-1]
+    return campaign_group_id, campaign_id
+
+
+def referenced_ids(elements):
+    """Returns the sets of campaign group ids and campaign ids referenced by the elements."""
+    campaign_group_ids = set()
+    campaign_ids = set()
+    for element in elements:
+        campaign_group_id, campaign_id = parse_pivot_values(element.get("pivotValues", []))
+        if campaign_group_id != NOT_AVAILABLE:
+            campaign_group_ids.add(campaign_group_id)
+        if campaign_id != NOT_AVAILABLE:
+            campaign_ids.add(campaign_id)
+    return campaign_group_ids, campaign_ids
+
+
+def normalize_elements(elements, metrics):
+    """
+    Drops impressions when they were not requested and sets the requested
+    metrics LinkedIn left out to 0. Modifies the elements in place.
+    """
+    impressions_requested = "impressions" in metrics
+    for element in elements:
+        if not impressions_requested:
+            element.pop("impressions", None)
+        for metric in metrics:
+            if metric not in element:
+                element[metric] = 0
+    return elements
+
+
+def build_rows(elements, date, account_id, account_name, campaign_groups, campaigns, names=True):
+    """
+    Builds one BigQuery row per element: the dimension columns followed by
+    the element's metrics. Without `names` the campaign and campaign group
+    names, type and status are left out (NULL), see dimensions.py.
+    """
+    rows = []
+    for element in elements:
+        campaign_group_id, campaign_id = parse_pivot_values(element.get("pivotValues", []))
+
+        row = {
+            "date": date,
+            "account_name": account_name,
+            "account_id": account_id,
+            "campaign_group_id": campaign_group_id,
+            "campaign_id": campaign_id,
+        }
+        if names:
+            campaign_group = campaign_groups.get(campaign_group_id) or {}
+            campaign = campaigns.get(campaign_id) or {}
+            row["campaign_group_name"] = campaign_group.get("name", NOT_AVAILABLE)
+            row["campaign_name"] = campaign.get("name", NOT_AVAILABLE)
+            row["campaign_type"] = campaign.get("type", NOT_AVAILABLE)
+            row["campaign_status"] = campaign.get("status", NOT_AVAILABLE)
+
+        # merge the metrics
+        for key, value in element.items():
+            if key != "pivotValues":
+                row[key] = value
+        rows.append(row)
+    return rows
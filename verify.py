@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+
+import metrics
+from shards import parse_date, table_metrics
+
+# ======================================================================
+# Verification of loaded days against LinkedIn's account totals
+# One ACCOUNT pivot adAnalytics request returns the daily totals of a few
+# key metrics for a whole date range, they are compared with one SUM query
+# per table over the same dates. Only the days of the tables whose totals
+# disagree need to be ingested again.
+# ======================================================================
+DEFAULT_RELATIVE_TOLERANCE = 0.001
+DEFAULT_ABSOLUTE_TOLERANCE = 0.01
+
+
+def verify_metrics(table_id):
+    """
+    The metrics of the table compared with LinkedIn: the ones in
+    metrics.VERIFY_METRICS, or the table's first summable metric.
+    """
+    table_metric_names = table_metrics(table_id)
+    selected = [m for m in metrics.VERIFY_METRICS if m in table_metric_names]
+    if selected:
+        return selected
+    return [m for m in table_metric_names if m not in metrics.NON_ADDITIVE_METRICS][:1]
+
+
+def all_verify_metrics(table_ids):
+    seen = []
+    for table_id in table_ids:
+        for metric in verify_metrics(table_id):
+            if metric not in seen:
+                seen.append(metric)
+    return seen
+
+
+def element_date(element):
+    start = element.get("dateRange", {}).get("start", {})
+    return date(start["year"], start["month"], start["day"]).isoformat()
+
+
+def linkedin_daily_totals(elements, metric_names):
+    """Returns {date: {metric: total}} from the elements of an ACCOUNT pivot DAILY response."""
+    totals = {}
+    for element in elements:
+        day_totals = totals.setdefault(element_date(element), {})
+        for metric in metric_names:
+            day_totals[metric] = day_totals.get(metric, 0.0) + float(element.get(metric) or 0)
+    return totals
+
+
+def totals_query(project, dataset, table_id, metric_names):
+    """SUM of the metrics per date for @account_id from @start_date to @end_date."""
+    sums = ", ".join(f"SUM(CAST(`{m}` AS FLOAT64)) AS `{m}`" for m in metric_names)
+    return (
+        f"SELECT CAST(date AS STRING) AS date, {sums} "
+        f"FROM `{project}.{dataset}.{table_id}` "
+        f"WHERE account_id = @account_id AND date BETWEEN @start_date AND @end_date "
+        f"GROUP BY date"
+    )
+
+
+def matches(expected, actual, relative_tolerance=DEFAULT_RELATIVE_TOLERANCE, absolute_tolerance=DEFAULT_ABSOLUTE_TOLERANCE):
+    return abs(expected - actual) <= max(absolute_tolerance, relative_tolerance * abs(expected))
+
+
+def find_mismatches(linkedin_totals, table_totals, table_id, start_date, end_date, **tolerances):
+    """
+    Compares every day from start_date to end_date, days missing on either
+    side count as 0. Returns [(date, metric, linkedin total, table total)].
+    """
+    mismatches = []
+    day = parse_date(start_date)
+    while day <= parse_date(end_date):
+        day_str = day.isoformat()
+        for metric in verify_metrics(table_id):
+            expected = linkedin_totals.get(day_str, {}).get(metric, 0.0)
+            actual = table_totals.get(day_str, {}).get(metric) or 0.0
+            if not matches(expected, actual, **tolerances):
+                mismatches.append((day_str, metric, expected, actual))
+        day += timedelta(days=1)
+    return mismatches
@@ -0,0 +1,131 @@
+import metrics
+from shards import VALID_TABLE_NAMES, table_metrics
+
+# ======================================================================
+# Wide storage layout
+# Instead of one table per entry of metrics.BIGQUERY_TABLES, every metric
+# is stored once in a single wide fact table (metrics.WIDE_TABLE) with one
+# row per date, account, campaign group and campaign, and the table names
+# of metrics.BIGQUERY_TABLES become views projecting their metrics from it.
+# A day of an account is then one delete and one load job instead of one
+# of each per table.
+# ======================================================================
+WIDE_TABLE_ID = metrics.WIDE_TABLE
+KEY_COLUMNS = ["date", "account_id", "campaign_group_id", "campaign_id"]
+DIMENSION_COLUMNS = [
+    "date",
+    "account_name",
+    "account_id",
+    "campaign_group_name",
+    "campaign_group_id",
+    "campaign_name",
+    "campaign_id",
+    "campaign_type",
+    "campaign_status",
+]
+
+
+def wide_metrics():
+    """Returns the union of the metrics of every table, in the order of metrics.py."""
+    seen = []
+    for table_id in VALID_TABLE_NAMES:
+        for metric in table_metrics(table_id):
+            if metric not in seen:
+                seen.append(metric)
+    return seen
+
+
+def collapse_units(units):
+    """
+    Turns table work units into wide table units: one per account and date,
+    in the order they first appear. Wide units are kept as they are.
+    """
+    collapsed = []
+    seen = set()
+    for unit in units:
+        key = (unit["account_id"], unit["date"])
+        if key not in seen:
+            seen.add(key)
+            collapsed.append({"account_id": unit["account_id"], "table_id": WIDE_TABLE_ID, "date": unit["date"]})
+    return collapsed
+
+
+def table_units(units):
+    """Expands wide table units back into one unit per table (e.g. to update the tables' rollups)."""
+    expanded = []
+    for unit in units:
+        if unit["table_id"] == WIDE_TABLE_ID:
+            expanded += [dict(unit, table_id=table_id) for table_id in VALID_TABLE_NAMES]
+        else:
+            expanded.append(unit)
+    return expanded
+
+
+def merge_rows(row_lists):
+    """Merges the rows of several tables into one wide row per date, account, campaign group and campaign."""
+    merged = {}
+    for rows in row_lists:
+        for row in rows:
+            key = tuple(row.get(column) for column in KEY_COLUMNS)
+            if key in merged:
+                merged[key].update(row)
+            else:
+                merged[key] = dict(row)
+    return list(merged.values())
+
+
+# ======================================================================
+# SQL
+# ======================================================================
+def view_statement(project, dataset, table_id):
+    columns = ", ".join(f"`{c}`" for c in DIMENSION_COLUMNS + table_metrics(table_id))
+    return (
+        f"CREATE OR REPLACE VIEW `{project}.{dataset}.{table_id}` AS "
+        f"SELECT {columns} FROM `{project}.{dataset}.{WIDE_TABLE_ID}`;"
+    )
+
+
+def migration_script(project, dataset, table_columns):
+    """
+    Copies the history of the per table layout into the wide table in one
+    transaction. `table_columns` is {table_id: metric columns the table
+    has}. Each table is merged on the key columns, so the metrics of the
+    same campaign and day from different tables end up on the same row.
+    The script fails before copying anything when a table has several rows
+    for the same key, with the number of such rows: one of them would be
+    lost, the table is deduplicated by hand first.
+    """
+    wide_ref = f"`{project}.{dataset}.{WIDE_TABLE_ID}`"
+    on = " AND ".join(f"W.`{c}` = S.`{c}`" for c in KEY_COLUMNS)
+    keys = ", ".join(f"`{c}`" for c in KEY_COLUMNS)
+    checks = []
+    statements = []
+    for table_id, metric_columns in table_columns.items():
+        columns = DIMENSION_COLUMNS + metric_columns
+        updates = ", ".join(f"`{c}` = S.`{c}`" for c in metric_columns) or "`account_name` = S.`account_name`"
+        checks.append(
+            f"SET duplicate_rows = (\n"
+            f"  SELECT IFNULL(SUM(n - 1), 0) FROM (\n"
+            f"    SELECT COUNT(*) AS n FROM `{project}.{dataset}.{table_id}` GROUP BY {keys} HAVING n > 1\n"
+            f"  )\n"
+            f");\n"
+            f"IF duplicate_rows > 0 THEN\n"
+            f"  RAISE USING MESSAGE = FORMAT('%d duplicate rows in {table_id} (same {', '.join(KEY_COLUMNS)}), "
+            f"deduplicate it before migrating to {WIDE_TABLE_ID}', duplicate_rows);\n"
+            f"END IF;\n"
+        )
+        statements.append(
+            f"MERGE {wide_ref} W\n"
+            f"  USING `{project}.{dataset}.{table_id}` S\n"
+            f"  ON {on}\n"
+            f"  WHEN MATCHED THEN UPDATE SET {updates}\n"
+            f"  WHEN NOT MATCHED THEN INSERT ({', '.join(f'`{c}`' for c in columns)})"
+            f" VALUES ({', '.join(f'S.`{c}`' for c in columns)});"
+        )
+    return (
+        "DECLARE duplicate_rows INT64;\n"
+        + "".join(checks)
+        + "BEGIN TRANSACTION;\n"
+        + "".join(f"{statement}\n" for statement in statements)
+        + "COMMIT TRANSACTION;\n"
+    )